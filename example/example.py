@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 
-from yarrow.operator import Operator
+from yarrow.cache import MemoryCache
+from yarrow.operator import BatchOperator, Operator
 
 
 class Input(BaseModel):
@@ -20,6 +21,7 @@ class Sum(Operator):
     """
     input = Input
     output = Output
+    cache = MemoryCache(max_size=10_000, ttl=3600)
 
     @classmethod
     def run(cls, input_: Input):  # pylint: disable=missing-function-docstring
@@ -34,6 +36,7 @@ class Mul(Operator):
     """
     input = Input
     output = Output
+    cache = MemoryCache(max_size=10_000, ttl=3600)
 
     @classmethod
     def run(cls, input_: Input):  # pylint: disable=missing-function-docstring
@@ -54,5 +57,23 @@ class Sequence(Operator):
         for c in range(input_.a, input_.b):
             yield Output(c=c)
 
+    @classmethod
+    def resume(cls, input_: Input, offset: int):  # pylint: disable=missing-function-docstring
+        return cls.run(Input(a=input_.a + offset, b=input_.b))
+
+
+class BatchSum(BatchOperator):
+    """
+    Calculate sums of two numbers by batches.
+    """
+    input = Input
+    output = Output
+    max_batch_size = 10
+
+    @classmethod
+    def run(cls, input_: list[Input]):  # pylint: disable=missing-function-docstring
+        for item in input_:
+            yield Output(c=item.a + item.b)
+
 
 String = 'abc'  # pylint: disable=invalid-name
@@ -0,0 +1,134 @@
+"""
+Per-item cost of serializing one result into an answer for different payload shapes: the result is dumped to dict
+and re-validated into Answer (as it was before) versus the validated model is serialized directly into the answer,
+by pydantic-core and by orjson (if it is installed).
+
+Run: python -m tests.benchmarks.bench_codec
+"""
+import time
+from typing import Any, Callable
+
+from pika import BasicProperties
+from pika.spec import Basic
+from pydantic import BaseModel
+
+from yarrow.codec import CODEC
+from yarrow.models import Answer, JsonBackend, Status
+from yarrow.operator import Operator, Reply
+
+from tests.benchmarks.bench_request import NullChannel
+
+
+class Flat(BaseModel):
+    # pylint: disable=missing-class-docstring
+    a: int
+    b: float
+    c: str
+    d: bool
+
+
+class Point(BaseModel):
+    # pylint: disable=missing-class-docstring
+    x: float
+    y: float
+    label: str
+
+
+class Nested(BaseModel):
+    # pylint: disable=missing-class-docstring
+    points: list[Point]
+
+
+class Numeric(BaseModel):
+    # pylint: disable=missing-class-docstring
+    values: list[float]
+
+
+class Text(BaseModel):
+    # pylint: disable=missing-class-docstring
+    text: str
+
+
+SHAPES: list[tuple[str, type[BaseModel], dict[str, Any]]] = [
+    ('flat', Flat, {'a': 1, 'b': 0.5, 'c': 'abc', 'd': True}),
+    ('nested', Nested, {'points': [{'x': i, 'y': i / 2, 'label': f'p{i}'} for i in range(20)]}),
+    ('numeric', Numeric, {'values': [i / 3 for i in range(1_000)]}),
+    ('text', Text, {'text': 'lorem ipsum ' * 1_000}),
+]
+
+
+def reply(output: type[BaseModel]) -> Reply:
+    """
+    Return reply of an operator with the output model.
+    """
+    operator_class = type('Bench', (Operator,), {'input': output, 'output': output, 'run': lambda input_: []})
+    return Reply(
+        operator_class,
+        NullChannel(),
+        Basic.Deliver(delivery_tag=1),
+        BasicProperties(reply_to='reply', correlation_id='id'),
+        b'{}',
+    )
+
+
+def legacy(output: type[BaseModel], element: dict[str, Any], request: bytes) -> bytes:
+    """
+    Serialization as it was before: dict round-trip and validation into Answer.
+    """
+    result = output.model_validate(element).model_dump()
+    answer = Answer(request=None, result=result, status=Status.PROCESSING, num=0)
+    tail = answer.model_dump_json(exclude={'request'}).encode('utf-8')
+    return b'{"request":' + request + b',' + tail[1:]
+
+
+REPLIES: dict[type[BaseModel], Reply] = {}
+
+
+def direct(output: type[BaseModel], element: dict[str, Any], _: bytes) -> bytes:
+    """
+    Serialization of the validated model directly into the answer, the request is echoed by the reply.
+    """
+    result = CODEC.dumps(output.model_validate(element))
+    answer = Answer.model_construct(request=None, result=None, status=Status.PROCESSING, error=None, num=0)
+    return REPLIES[output].encode(answer, result)
+
+
+def measure(function: Callable[..., bytes], output: type[BaseModel], element: dict[str, Any], number: int) -> float:
+    """
+    Return the best time of one item in microseconds.
+    """
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            function(output, element, b'{}')
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1_000_000
+
+
+def main() -> None:
+    """
+    Print per-item encode cost of every payload shape.
+    """
+    backends = [JsonBackend.PYDANTIC]
+    try:
+        import orjson  # pylint: disable=import-outside-toplevel,unused-import  # noqa: F401
+        backends.append(JsonBackend.ORJSON)
+    except ImportError:
+        pass
+
+    print(f'{"shape":>8} {"before, us":>12} ' + ' '.join(f'{backend.value + ", us":>14}' for backend in backends))
+    for name, output, element in SHAPES:
+        REPLIES[output] = reply(output)
+        number = 20_000 if name == 'flat' else 2_000
+        before = measure(legacy, output, element, number)
+        after = []
+        for backend in backends:
+            CODEC.use(backend)
+            after.append(measure(direct, output, element, number))
+        CODEC.use(JsonBackend.PYDANTIC)
+        print(f'{name:>8} {before:>12.2f} ' + ' '.join(f'{value:>14.2f}' for value in after))
+
+
+if __name__ == '__main__':
+    main()
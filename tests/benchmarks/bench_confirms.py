@@ -0,0 +1,109 @@
+"""
+Throughput of a stream of replies without publisher confirms, with synchronous confirms of pika blocking channel
+and with pipelined confirms of PublisherConfirms. It needs a running broker, connection settings are read from
+environment variables as by yarrow itself (CONFIG_FILENAME is not used).
+
+Run: python -m tests.benchmarks.bench_confirms
+"""
+import os
+import time
+from typing import Callable
+
+from pika import BlockingConnection, ConnectionParameters, PlainCredentials
+
+from yarrow.confirms import ConfirmedChannel, PublisherConfirms
+from yarrow.settings import Settings
+
+
+QUEUE = 'bench_confirms'
+
+
+class AckCounter:
+    """
+    Consuming channel, which only counts acknowledged deliveries.
+    """
+    def __init__(self) -> None:
+        self.acks = 0
+
+    def basic_ack(self, _: int) -> None:  # pylint: disable=missing-function-docstring
+        self.acks += 1
+
+
+def unconfirmed(connection: BlockingConnection, deliveries: int, length: int) -> None:
+    """
+    Publish replies without confirms.
+    """
+    channel = connection.channel()
+    for _ in range(deliveries * length):
+        channel.basic_publish('', routing_key=QUEUE, body=b'{}')
+    connection.process_data_events(0)
+
+
+def synchronous(connection: BlockingConnection, deliveries: int, length: int) -> None:
+    """
+    Publish replies with waiting for confirm of every one.
+    """
+    channel = connection.channel()
+    channel.confirm_delivery()
+    for _ in range(deliveries * length):
+        channel.basic_publish('', routing_key=QUEUE, body=b'{}')
+
+
+def pipelined(connection: BlockingConnection, deliveries: int, length: int) -> None:
+    """
+    Publish replies with PublisherConfirms and wait until all deliveries are acknowledged.
+    """
+    confirms = PublisherConfirms(connection, connection.channel())
+    counter = AckCounter()
+    for delivery_tag in range(deliveries):
+        channel = ConfirmedChannel(confirms, counter)  # type: ignore[arg-type]
+        for _ in range(length):
+            channel.basic_publish('', routing_key=QUEUE, body=b'{}')
+        channel.basic_ack(delivery_tag)
+        connection.process_data_events(0)
+
+    while counter.acks < deliveries:
+        connection.process_data_events(1)
+
+
+def measure(mode: Callable[[BlockingConnection, int, int], None], deliveries: int, length: int) -> float:
+    """
+    Return replies per second.
+    """
+    settings = Settings(CONFIG_FILENAME=os.devnull)
+    connection = BlockingConnection(
+        parameters=ConnectionParameters(
+            host=settings.HOST,
+            port=settings.PORT,
+            virtual_host=settings.VIRTUAL_HOST,
+            credentials=PlainCredentials(settings.USERNAME, settings.PASSWORD),
+        )
+    )
+    try:
+        channel = connection.channel()
+        channel.queue_declare(QUEUE)
+        channel.queue_purge(QUEUE)
+
+        start = time.perf_counter()
+        mode(connection, deliveries, length)
+        elapsed = time.perf_counter() - start
+
+        channel.queue_delete(QUEUE)
+    finally:
+        connection.close()
+    return deliveries * length / elapsed
+
+
+def main() -> None:
+    """
+    Print replies per second of every mode for different stream lengths.
+    """
+    print(f'{"stream":>8} {"unconfirmed":>12} {"synchronous":>12} {"pipelined":>12}')
+    for length in (1, 10, 100):
+        deliveries = 10_000 // length
+        results = [measure(mode, deliveries, length) for mode in (unconfirmed, synchronous, pipelined)]
+        print(f'{length:>8} ' + ' '.join(f'{result:>12.0f}' for result in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Per-message cost of answering one request: the request is decoded and serialized once per delivery
+(current Reply) versus for every answer (as Operator.__init__ did before).
+
+Run: python -m tests.benchmarks.bench_request
+"""
+import json
+import time
+from typing import Any, Callable
+
+from pika import BasicProperties
+from pika.spec import Basic
+from pydantic import BaseModel
+
+from yarrow.models import Answer, Status
+from yarrow.operator import Operator
+
+
+class NullChannel:
+    """
+    Channel, which drops everything.
+    """
+    def basic_publish(self, *args: Any, **kwargs: Any) -> None:  # pylint: disable=missing-function-docstring
+        pass
+
+    def basic_ack(self, *args: Any, **kwargs: Any) -> None:  # pylint: disable=missing-function-docstring
+        pass
+
+
+class Request(BaseModel):
+    # pylint: disable=missing-class-docstring
+    items: list[int]
+    length: int
+
+
+class Item(BaseModel):
+    # pylint: disable=missing-class-docstring
+    i: int
+
+
+class Stream(Operator):
+    """
+    Yield "length" items.
+    """
+    input = Request
+    output = Item
+
+    @classmethod
+    def run(cls, input_: Request):  # pylint: disable=missing-function-docstring
+        for i in range(input_.length):
+            yield Item(i=i)
+
+
+def legacy(channel: NullChannel, _: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+    """
+    Answering as it was before: the request is decoded and serialized for every answer.
+    """
+    result = Stream.call(**json.loads(body))
+    num = -1
+    for num, data in enumerate(result):
+        answer = Answer(request=json.loads(body), result=data, status=Status.PROCESSING, num=num)
+        channel.basic_publish(
+            '',
+            routing_key=properties.reply_to,
+            body=answer.model_dump_json().encode('utf-8'),
+            properties=BasicProperties(correlation_id=properties.correlation_id),
+        )
+    answer = Answer(request=json.loads(body), result=None, status=Status.DONE, num=num + 1)
+    channel.basic_publish(
+        '',
+        routing_key=properties.reply_to,
+        body=answer.model_dump_json().encode('utf-8'),
+        properties=BasicProperties(correlation_id=properties.correlation_id),
+    )
+
+
+def measure(handler: Callable, body: bytes, messages: int, repeat: int = 3) -> float:
+    """
+    Return the best time of one published message in microseconds.
+    """
+    channel = NullChannel()
+    method_frame = Basic.Deliver(delivery_tag=1)
+    properties = BasicProperties(reply_to='reply', correlation_id='id')
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        handler(channel, method_frame, properties, body)
+        best = min(best, time.perf_counter() - start)
+    return best / messages * 1_000_000
+
+
+def main() -> None:
+    """
+    Print per-message cost for different body sizes and stream lengths.
+    """
+    print(f'{"body, KB":>10} {"stream":>8} {"before, us":>12} {"after, us":>12} {"speedup":>8}')
+    for items in (10, 1_000, 50_000):
+        for length in (1, 100, 1_000):
+            body = json.dumps({'items': list(range(items)), 'length': length}).encode('utf-8')
+            before = measure(legacy, body, length + 1)
+            after = measure(Stream, body, length + 1)
+            print(f'{len(body) / 1024:>10.1f} {length:>8} {before:>12.1f} {after:>12.1f} {before / after:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+End-to-end throughput, latency and memory of serve() with operators of example/example.py on the in-memory broker
+of tests.benchmarks.broker. A client keeps "concurrency" requests in flight and sends the next one, when the last
+answer (DONE) of a request is received. Latency is the time from publishing of a request to its last answer,
+throughput and latency are measured after warm-up requests. Peak memory is measured by tracemalloc in a separate run
+of the connection process without requests prepared in advance (workers of process execution mode are not traced).
+Other settings (JSON_BACKEND, PUBLISHER_CONFIRMS, FUSE_PIPELINES, ...) are read from environment variables.
+
+Run: python -m tests.benchmarks.bench_serve
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import NamedTuple
+from unittest.mock import patch
+
+from pika import BasicProperties
+
+from yarrow.main import serve
+from yarrow.models import ExecutionMode
+
+from tests.benchmarks.broker import FakeConnection
+
+
+REPLY_QUEUE = 'bench'
+OPERATORS = ('Sum', 'Mul', 'Sequence', 'BatchSum')
+PAYLOADS = (0, 10_000, 100_000)
+LENGTHS = (1, 100)
+CONCURRENCY: list[tuple[ExecutionMode, int | None, int]] = [
+    (ExecutionMode.SYNC, None, 1),
+    (ExecutionMode.SYNC, None, 16),
+    (ExecutionMode.THREAD, 4, 16),
+    (ExecutionMode.PROCESS, 4, 16),
+]
+
+
+class Result(NamedTuple):
+    # pylint: disable=missing-class-docstring
+    rate: float
+    p50: float
+    p99: float
+
+
+class Client:
+    """
+    Client, which sends requests to the operator queue and receives answers by the listener of the reply queue.
+    """
+    def __init__(self, connection: FakeConnection, operator: str, requests: list[bytes], concurrency: int):
+        self.connection = connection
+        self.operator = operator
+        self.requests = requests
+        self.concurrency = concurrency
+        self.warmup = 2 * concurrency
+        self.sent: dict[str, float] = {}
+        self.latencies: list[float] = []
+        self.done = 0
+        self.start = 0.0
+        self.end = 0.0
+        connection.listeners[REPLY_QUEUE] = self.on_answer
+
+    def send(self, number: int) -> None:
+        """
+        Publish the request to the operator queue.
+        """
+        correlation_id = str(number)
+        self.sent[correlation_id] = time.perf_counter()
+        self.connection.publish(
+            self.operator,
+            BasicProperties(reply_to=REPLY_QUEUE, correlation_id=correlation_id),
+            self.requests[number],
+        )
+
+    def run(self) -> None:
+        """
+        Publish first requests.
+        """
+        self.start = time.perf_counter()
+        for number in range(min(self.concurrency, len(self.requests))):
+            self.send(number)
+
+    def on_answer(self, properties: BasicProperties, body: bytes) -> None:
+        """
+        Take last answers of requests into account and send next requests.
+        """
+        # Status is near the end of an answer, the request echo at the beginning can be large.
+        index = body.rfind(b'"status":"') + 10
+        status = body[index:index + 4]
+        if status == b'PROC':
+            return
+        if status != b'DONE':
+            raise RuntimeError(f'Unexpected answer: {body[:200]!r}')
+
+        now = time.perf_counter()
+        started = self.sent.pop(str(properties.correlation_id))
+        self.done += 1
+        if self.done > self.warmup:
+            self.latencies.append(now - started)
+        elif self.done == self.warmup:
+            self.start = now
+
+        number = self.done + self.concurrency - 1
+        if number < len(self.requests):
+            self.send(number)
+        elif not self.sent:
+            self.end = now
+            self.connection.stop()
+
+    def result(self) -> Result:  # pylint: disable=missing-function-docstring
+        percentiles = statistics.quantiles(self.latencies, n=100, method='inclusive')
+        return Result(len(self.latencies) / (self.end - self.start), percentiles[49] * 1000, percentiles[98] * 1000)
+
+
+def run(operator: str, requests: list[bytes], mode: ExecutionMode, workers: int | None, concurrency: int) -> Client:
+    """
+    Serve the operator on the in-memory broker, until all requests are answered.
+    """
+    connection = FakeConnection()
+    client = Client(connection, operator, requests, concurrency)
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml') as config:
+        json.dump({'operators': [{'operator': f'example.example.{operator}', 'prefetch_count': concurrency}]}, config)
+        config.flush()
+        environment = {
+            'HOST': 'localhost',
+            'PORT': '5672',
+            'VIRTUAL_HOST': '/',
+            'USERNAME': 'guest',
+            'PASSWORD': 'guest',
+            'CONFIG_FILENAME': config.name,
+            'EXECUTION_MODE': mode.value,
+        }
+        if workers is not None:
+            environment['WORKERS'] = str(workers)
+        with patch.dict(os.environ, environment), patch('yarrow.main.BlockingConnection', return_value=connection):
+            client.run()
+            serve()
+    return client
+
+
+def requests_of(payload: int, length: int, count: int, offset: int) -> list[bytes]:
+    """
+    Return requests with unique inputs (results of operators with cache are not reused).
+    """
+    return [
+        json.dumps({'a': offset + i, 'b': offset + i + length, 'padding': 'x' * payload}).encode('utf-8')
+        for i in range(count)
+    ]
+
+
+def main() -> None:
+    """
+    Print throughput, latency and peak memory for every operator, payload size, stream length and concurrency.
+    """
+    print(
+        f'{"operator":>9} {"body, KB":>9} {"stream":>7} {"mode":>8} {"workers":>8} {"in flight":>10} '
+        f'{"msgs/s":>9} {"p50, ms":>9} {"p99, ms":>9} {"peak, MB":>9}'
+    )
+    offset = 0
+    for operator in OPERATORS:
+        for length in LENGTHS if operator == 'Sequence' else LENGTHS[:1]:
+            for payload in PAYLOADS:
+                for mode, workers, concurrency in CONCURRENCY:
+                    if operator == 'BatchSum' and concurrency == 1:
+                        continue  # every request would wait max_batch_wait
+                    count = max(200, 2_000 // length)
+                    requests = requests_of(payload, length, count, offset)
+                    offset += count
+                    result = run(operator, requests, mode, workers, concurrency).result()
+
+                    requests = requests_of(payload, length, count, offset)
+                    offset += count
+                    tracemalloc.start()
+                    run(operator, requests, mode, workers, concurrency)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+
+                    print(
+                        f'{operator:>9} {len(requests[0]) / 1024:>9.1f} {length:>7} {mode.value:>8} '
+                        f'{workers or "-":>8} {concurrency:>10} {result.rate:>9.0f} {result.p50:>9.2f} '
+                        f'{result.p99:>9.2f} {peak / 1024 ** 2:>9.1f}'
+                    )
+
+
+if __name__ == '__main__':
+    main()
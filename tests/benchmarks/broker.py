@@ -0,0 +1,215 @@
+"""
+In-memory stand-in of a broker with the part of pika BlockingConnection and BlockingChannel, which yarrow uses:
+queues, consumers with prefetch count, acknowledgements, publisher confirms, thread-safe callbacks and timers.
+Messages are delivered in the thread, which calls start_consuming, as by pika.
+"""
+import heapq
+import itertools
+import queue
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple
+
+from pika import BasicProperties
+from pika.frame import Method
+from pika.spec import Basic
+
+
+Listener = Callable[[BasicProperties, bytes], None]
+
+
+class Consumer(NamedTuple):
+    # pylint: disable=missing-class-docstring
+    channel: 'FakeChannel'
+    queue: str
+    callback: Callable
+    prefetch_count: int
+
+
+class Timer(NamedTuple):
+    # pylint: disable=missing-class-docstring
+    deadline: float
+    number: int
+    callback: Callable[[], None]
+
+
+class FakeConnection:
+    """
+    Connection to the in-memory broker. Messages published to a queue with a listener are handed to the listener
+    instead of the queue. Consuming stops after stop() or after stall_timeout seconds without any events.
+    """
+    def __init__(self, stall_timeout: float = 10.0):
+        self.stall_timeout = stall_timeout
+        self.is_open = True
+        self.stopped = False
+        self.queues: dict[str, deque[tuple[BasicProperties, bytes, bool]]] = {}
+        self.listeners: dict[str, Listener] = {}
+        self.consumers: dict[str, Consumer] = {}
+        self.unacked: dict[int, tuple[str, str, BasicProperties, bytes]] = {}
+        self.in_flight: dict[str, int] = {}
+        self.callbacks: queue.SimpleQueue[Callable[[], None]] = queue.SimpleQueue()
+        self.timers: list[Timer] = []
+        self.cancelled: set[int] = set()
+        self.counter = itertools.count(1)
+
+    def channel(self) -> 'FakeChannel':  # pylint: disable=missing-function-docstring
+        return FakeChannel(self)
+
+    def close(self) -> None:  # pylint: disable=missing-function-docstring
+        self.is_open = False
+
+    def stop(self) -> None:
+        """
+        Stop consuming of all channels.
+        """
+        self.stopped = True
+
+    def add_callback_threadsafe(self, callback: Callable[[], None]) -> None:
+        # pylint: disable=missing-function-docstring
+        self.callbacks.put(callback)
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> Timer:
+        # pylint: disable=missing-function-docstring
+        timer = Timer(time.monotonic() + delay, next(self.counter), callback)
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def remove_timeout(self, timer: Timer) -> None:  # pylint: disable=missing-function-docstring
+        self.cancelled.add(timer.number)
+
+    def publish(self, routing_key: str, properties: BasicProperties, body: bytes) -> None:
+        """
+        Put the message to the queue or hand it to the listener of the queue.
+        """
+        listener = self.listeners.get(routing_key)
+        if listener is not None:
+            listener(properties, body)
+        else:
+            self.queues.setdefault(routing_key, deque()).append((properties, body, False))
+
+    def settle(self, delivery_tag: int, requeue: bool = False) -> None:
+        """
+        Release the delivery and put it back to its queue, if it is requeued.
+        """
+        consumer_tag, queue_name, properties, body = self.unacked.pop(delivery_tag)
+        self.in_flight[consumer_tag] -= 1
+        if requeue:
+            self.queues[queue_name].appendleft((properties, body, True))
+
+    def process_data_events(self) -> None:
+        """
+        Run thread-safe callbacks and due timers, deliver messages or wait for the next event.
+        """
+        if self._run_callbacks() | self._run_timers() | self._deliver():
+            return
+
+        timeout = self.stall_timeout
+        if self.timers:
+            timeout = min(timeout, max(self.timers[0].deadline - time.monotonic(), 0))
+        try:
+            callback = self.callbacks.get(timeout=timeout)
+        except queue.Empty as error:
+            if not self.timers:
+                raise RuntimeError(f'No events for {self.stall_timeout} seconds') from error
+            return
+        callback()
+
+    def _run_callbacks(self) -> bool:
+        busy = False
+        while not self.callbacks.empty():
+            self.callbacks.get()()
+            busy = True
+        return busy
+
+    def _run_timers(self) -> bool:
+        busy = False
+        while self.timers and self.timers[0].deadline <= time.monotonic():
+            timer = heapq.heappop(self.timers)
+            if timer.number in self.cancelled:
+                self.cancelled.discard(timer.number)
+            else:
+                timer.callback()
+                busy = True
+        return busy
+
+    def _deliver(self) -> bool:
+        # Like a broker, deliver not more than prefetch count, acknowledgements in callbacks give room for next pass.
+        busy = False
+        for consumer_tag, consumer in list(self.consumers.items()):
+            messages = self.queues.get(consumer.queue)
+            count = len(messages or ())
+            if consumer.prefetch_count:
+                count = min(count, consumer.prefetch_count - self.in_flight[consumer_tag])
+            for _ in range(count):
+                if consumer_tag not in self.consumers or self.stopped or not messages:
+                    break
+                properties, body, redelivered = messages.popleft()
+                delivery_tag = next(self.counter)
+                self.unacked[delivery_tag] = (consumer_tag, consumer.queue, properties, body)
+                self.in_flight[consumer_tag] += 1
+                method_frame = Basic.Deliver(consumer_tag, delivery_tag, redelivered, '', consumer.queue)
+                consumer.callback(consumer.channel, method_frame, properties, body)
+                busy = True
+        return busy
+
+
+class FakeChannel:
+    """
+    Channel of the in-memory broker.
+    """
+    def __init__(self, connection: FakeConnection):
+        self.connection = connection
+        self.is_open = True
+        self.prefetch_count = 0
+        self.on_confirm: Callable[[Method], None] | None = None
+        self.published = 0
+
+    @property
+    def _impl(self) -> 'FakeChannel':
+        return self
+
+    def confirm_delivery(self, callback: Callable[[Method], None]) -> None:
+        # pylint: disable=missing-function-docstring
+        self.on_confirm = callback
+
+    def queue_declare(self, queue: str, **_: Any) -> None:  # pylint: disable=missing-function-docstring
+        self.connection.queues.setdefault(queue, deque())
+
+    def basic_qos(self, prefetch_count: int = 0, **_: Any) -> None:  # pylint: disable=missing-function-docstring
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue: str, on_message_callback: Callable, **_: Any) -> str:
+        # pylint: disable=missing-function-docstring
+        consumer_tag = f'ctag{next(self.connection.counter)}'
+        self.connection.consumers[consumer_tag] = Consumer(self, queue, on_message_callback, self.prefetch_count)
+        self.connection.in_flight[consumer_tag] = 0
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag: str) -> None:  # pylint: disable=missing-function-docstring
+        self.connection.consumers.pop(consumer_tag, None)
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties | None = None,
+                      **_: Any) -> None:
+        # pylint: disable=missing-function-docstring,unused-argument
+        self.connection.publish(routing_key, properties or BasicProperties(), body)
+        if self.on_confirm is not None:
+            self.published += 1
+            self.on_confirm(Method(1, Basic.Ack(self.published)))
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False) -> None:
+        # pylint: disable=missing-function-docstring,unused-argument
+        self.connection.settle(delivery_tag)
+
+    def basic_nack(self, delivery_tag: int, multiple: bool = False, requeue: bool = True) -> None:
+        # pylint: disable=missing-function-docstring,unused-argument
+        self.connection.settle(delivery_tag, requeue)
+
+    def start_consuming(self) -> None:  # pylint: disable=missing-function-docstring
+        while not self.connection.stopped:
+            self.connection.process_data_events()
+
+    def stop_consuming(self) -> None:  # pylint: disable=missing-function-docstring
+        self.connection.stop()
+
+    def close(self) -> None:  # pylint: disable=missing-function-docstring
+        self.is_open = False
@@ -0,0 +1,210 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, Mock, call, patch
+
+import pika
+import pytest
+from pika.spec import Basic
+
+from yarrow import aio
+from yarrow.models import OperatorConfig
+
+
+@pytest.fixture
+def channel():
+    return Mock(
+        default_exchange=Mock(publish=AsyncMock()),
+        get_exchange=AsyncMock(return_value=Mock(publish=AsyncMock())),
+        declare_queue=AsyncMock(),
+    )
+
+
+@pytest.fixture
+def message():
+    return Mock(
+        delivery_tag=7,
+        redelivered=None,
+        headers={},
+        reply_to='a',
+        correlation_id='b',
+        body=b'{"a": 3}',
+        ack=AsyncMock(),
+    )
+
+
+async def test_async_channel_basic_publish(channel, message):
+    async_channel = aio.AsyncChannel(channel, message)
+
+    async_channel.basic_publish(
+        '',
+        routing_key='a',
+        body=b'body',
+        properties=pika.BasicProperties(correlation_id='b', reply_to='c', headers={'d': 'e'}),
+    )
+    channel.default_exchange.publish.assert_not_called()
+
+    await async_channel.flush()
+
+    channel.default_exchange.publish.assert_awaited_once()
+    published, = channel.default_exchange.publish.await_args.args
+    assert channel.default_exchange.publish.await_args.kwargs == {'routing_key': 'a'}
+    assert published.body == b'body'
+    assert published.correlation_id == 'b'
+    assert published.reply_to == 'c'
+    assert published.headers == {'d': 'e'}
+    assert not async_channel.pending
+
+
+async def test_async_channel_basic_publish_exchange(channel, message):
+    async_channel = aio.AsyncChannel(channel, message)
+
+    async_channel.basic_publish('exchange', routing_key='a', body=b'body')
+    await async_channel.flush()
+
+    channel.get_exchange.assert_awaited_once_with('exchange', ensure=False)
+    channel.get_exchange.return_value.publish.assert_awaited_once()
+    channel.default_exchange.publish.assert_not_called()
+
+
+async def test_async_channel_basic_ack(channel, message):
+    async_channel = aio.AsyncChannel(channel, message)
+
+    async_channel.basic_ack(7)
+    with pytest.raises(ValueError):
+        async_channel.basic_ack(8)
+    await async_channel.flush()
+
+    message.ack.assert_awaited_once_with()
+
+
+async def test_async_channel_queue_declare(channel, message):
+    async_channel = aio.AsyncChannel(channel, message)
+
+    async_channel.queue_declare('queue')
+    await async_channel.flush()
+
+    channel.declare_queue.assert_awaited_once_with('queue')
+
+
+def test_incoming_frames(message):
+    method_frame, properties = aio.incoming_frames(message)
+
+    assert isinstance(method_frame, Basic.Deliver)
+    assert method_frame.delivery_tag == 7
+    assert method_frame.redelivered is False
+    assert properties.reply_to == 'a'
+    assert properties.correlation_id == 'b'
+    assert properties.headers is None
+
+
+@patch('yarrow.aio.get_info')
+async def test_info(get_info_mock):
+    channel = Mock(flush=AsyncMock())
+    method_frame = Mock()
+    properties = Mock()
+
+    await aio.info(channel, method_frame, properties, b'')
+
+    get_info_mock.assert_called_once_with(channel, method_frame, properties, b'')
+    channel.flush.assert_awaited_once_with()
+
+
+async def test_consumer(channel, message):
+    handler = AsyncMock()
+
+    await aio.consumer(channel, handler)(message)
+
+    handler.assert_awaited_once()
+    async_channel, method_frame, properties, body = handler.await_args.args
+    assert isinstance(async_channel, aio.AsyncChannel)
+    assert async_channel.message is message
+    assert method_frame.delivery_tag == 7
+    assert properties.reply_to == 'a'
+    assert body == b'{"a": 3}'
+
+
+async def test_consumer_max_in_flight(channel, message):
+    running = 0
+    max_running = 0
+
+    async def handler(*_):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    on_message = aio.consumer(channel, handler, 2)
+    await asyncio.gather(*[on_message(message) for _ in range(5)])
+
+    assert max_running == 2
+
+
+@pytest.fixture
+def connection():
+    queue = Mock(consume=AsyncMock())
+    channel = Mock(
+        declare_queue=AsyncMock(return_value=queue),
+        set_qos=AsyncMock(),
+    )
+    return MagicMock(channel=AsyncMock(return_value=channel))
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+async def test_serve(connection, operator, workers):
+    operator_configs = [
+        OperatorConfig(operator='tests.TestOperator'),
+        OperatorConfig(operator='tests.Other', prefetch_count=10, max_in_flight=2, priority=5),
+    ]
+    operator_pairs = [('TestOperator', operator), ('Other', operator)]
+
+    with (
+        patch('yarrow.aio.Settings', return_value=Mock(WORKERS=workers)) as settings_mock,
+        patch('yarrow.aio.apply_settings') as apply_settings_mock,
+        patch('yarrow.aio.load_operators', return_value=(operator_configs, operator_pairs)),
+        patch('yarrow.aio.aio_pika.connect', AsyncMock(return_value=connection)) as connect_mock,
+        patch('yarrow.aio.consumer') as consumer_mock,
+    ):
+        task = asyncio.create_task(aio.serve())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    connect_mock.assert_awaited_once()
+    apply_settings_mock.assert_called_once_with(settings_mock.return_value)
+
+    channel = connection.channel.return_value
+    channel.declare_queue.assert_has_awaits([call('__info__'), call('TestOperator'), call('Other')])
+    channel.set_qos.assert_has_awaits([call(prefetch_count=0), call(prefetch_count=10)])
+
+    consumer_mock.assert_has_calls([
+        call(channel, aio.info),
+        call(channel, operator.consume, None),
+        call(channel, operator.consume, 2),
+    ])
+    queue = channel.declare_queue.return_value
+    queue.consume.assert_has_awaits([
+        call(consumer_mock.return_value),
+        call(consumer_mock.return_value, arguments=None),
+        call(consumer_mock.return_value, arguments={'x-priority': 5}),
+    ])
+    connection.__aexit__.assert_awaited_once()
+
+
+async def test_serve_not_operator():
+    with (
+        patch('yarrow.aio.Settings', return_value=Mock()),
+        patch('yarrow.aio.load_operators', return_value=([Mock()], [('function', lambda *_: None)])),
+        patch('yarrow.aio.aio_pika.connect') as connect_mock,
+    ):
+        with pytest.raises(ValueError):
+            await aio.serve()
+
+    connect_mock.assert_not_called()
+
+
+async def test_operator_consume_end_to_end(channel, message, operator):
+    await aio.consumer(channel, operator.consume)(message)
+
+    assert channel.default_exchange.publish.await_count == 2
+    message.ack.assert_awaited_once_with()
@@ -0,0 +1,72 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from yarrow import metrics
+from yarrow.cache import MemoryCache, ResultCache
+
+
+def test_result_cache_not_implemented():
+    cache = ResultCache()
+
+    with pytest.raises(NotImplementedError):
+        cache.get('a')
+    with pytest.raises(NotImplementedError):
+        cache.set('a', b'[]')
+
+
+def test_memory_cache_lru():
+    cache = MemoryCache(max_size=2)
+    evictions = metrics.CACHE_EVICTIONS.values[('LruOperator',)]
+
+    cache.set('LruOperator:a', b'[1]')
+    cache.set('LruOperator:b', b'[2]')
+    assert cache.get('LruOperator:a') == b'[1]'
+    cache.set('LruOperator:c', b'[3]')
+
+    assert cache.get('LruOperator:b') is None
+    assert cache.get('LruOperator:a') == b'[1]'
+    assert cache.get('LruOperator:c') == b'[3]'
+    assert metrics.CACHE_EVICTIONS.values[('LruOperator',)] == evictions + 1
+
+
+@patch('yarrow.cache.time.monotonic', side_effect=[10.0, 15.0, 20.0])
+def test_memory_cache_ttl(_):
+    cache = MemoryCache(ttl=10)
+    evictions = metrics.CACHE_EVICTIONS.values[('TtlOperator',)]
+
+    cache.set('TtlOperator:a', b'[1]')
+
+    assert cache.get('TtlOperator:a') == b'[1]'
+    assert cache.get('TtlOperator:a') is None
+    assert 'TtlOperator:a' not in cache.values
+    assert metrics.CACHE_EVICTIONS.values[('TtlOperator',)] == evictions + 1
+
+
+def test_operator_cache(operator, model):
+    run = Mock(side_effect=lambda input_: iter([model(a=input_.a), model(a=input_.a + 1)]))
+    hits = metrics.CACHE_HITS.values[(operator.__name__,)]
+    misses = metrics.CACHE_MISSES.values[(operator.__name__,)]
+
+    with patch.object(operator, 'cache', MemoryCache()), patch.object(operator, 'run', run):
+        assert list(operator.call(a=1)) == [{'a': 1}, {'a': 2}]
+        assert list(operator.call(a=1)) == [{'a': 1}, {'a': 2}]
+        assert list(operator.execute(model(a=1))) == [model(a=1), model(a=2)]
+        assert list(operator.call(a=5)) == [{'a': 5}, {'a': 6}]
+
+    assert run.call_count == 2
+    assert metrics.CACHE_HITS.values[(operator.__name__,)] == hits + 2
+    assert metrics.CACHE_MISSES.values[(operator.__name__,)] == misses + 2
+
+
+def test_operator_cache_not_stored_on_error(operator, model):
+    def run(input_):
+        yield model(a=input_.a)
+        raise ValueError('failed')
+
+    cache = MemoryCache()
+    with patch.object(operator, 'cache', cache), patch.object(operator, 'run', run):
+        with pytest.raises(ValueError):
+            list(operator.call(a=1))
+
+    assert not cache.values
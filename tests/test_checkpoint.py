@@ -0,0 +1,51 @@
+import pytest
+
+from yarrow.checkpoint import Checkpoint, CheckpointStore, FileCheckpointStore, SqliteCheckpointStore
+
+
+def test_checkpoint_store_not_implemented():
+    store = CheckpointStore()
+
+    with pytest.raises(NotImplementedError):
+        store.get('a')
+    with pytest.raises(NotImplementedError):
+        store.set('a', Checkpoint(1, 1))
+    with pytest.raises(NotImplementedError):
+        store.delete('a')
+
+
+@pytest.fixture(params=['file', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'file':
+        return FileCheckpointStore(tmp_path / 'checkpoints')
+    return SqliteCheckpointStore(tmp_path / 'checkpoints.sqlite')
+
+
+def test_checkpoint_store(store):
+    assert store.get('Sequence:1') is None
+
+    store.set('Sequence:1', Checkpoint(10, 3))
+    store.set('Sequence:1', Checkpoint(20, 5))
+    store.set('Sequence:2', Checkpoint(1, 1))
+
+    assert store.get('Sequence:1') == Checkpoint(20, 5)
+    assert store.get('Sequence:2') == Checkpoint(1, 1)
+
+    store.delete('Sequence:1')
+    store.delete('Sequence:1')
+
+    assert store.get('Sequence:1') is None
+    assert store.get('Sequence:2') == Checkpoint(1, 1)
+
+
+def test_file_checkpoint_store(tmp_path):
+    FileCheckpointStore(tmp_path / 'checkpoints').set('Sequence:../1', Checkpoint(10, 3))
+
+    assert [path.suffix for path in (tmp_path / 'checkpoints').iterdir()] == ['.json']
+    assert FileCheckpointStore(tmp_path / 'checkpoints').get('Sequence:../1') == Checkpoint(10, 3)
+
+
+def test_sqlite_checkpoint_store_persistent(tmp_path):
+    SqliteCheckpointStore(tmp_path / 'checkpoints.sqlite').set('Sequence:1', Checkpoint(10, 3))
+
+    assert SqliteCheckpointStore(tmp_path / 'checkpoints.sqlite').get('Sequence:1') == Checkpoint(10, 3)
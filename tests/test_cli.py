@@ -0,0 +1,26 @@
+from unittest.mock import Mock, patch
+
+from yarrow import cli
+
+
+@patch('yarrow.cli.Settings')
+@patch('yarrow.cli.log.configure')
+@patch('yarrow.cli.main.serve')
+def test_run(serve_mock, configure_mock, settings_mock):
+    cli.run([])
+
+    configure_mock.assert_called_once_with(settings_mock.return_value)
+    serve_mock.assert_called_once_with()
+
+
+@patch('yarrow.cli.Settings', Mock())
+@patch('yarrow.cli.log.configure', Mock())
+@patch('yarrow.aio.serve', new_callable=Mock)
+@patch('yarrow.cli.asyncio.run')
+@patch('yarrow.cli.main.serve')
+def test_run_asyncio(serve_mock, asyncio_run_mock, aio_serve_mock):
+    cli.run(['--asyncio'])
+
+    serve_mock.assert_not_called()
+    aio_serve_mock.assert_called_once_with()
+    asyncio_run_mock.assert_called_once_with(aio_serve_mock.return_value)
@@ -0,0 +1,154 @@
+import gzip
+from decimal import Decimal
+from unittest.mock import Mock
+
+import cbor2
+import msgpack
+import pytest
+from pydantic import BaseModel
+from pydantic_core import from_json, to_json
+
+from yarrow.codec import (
+    CBOR,
+    JSON,
+    MSGPACK,
+    CborFormat,
+    Format,
+    JsonCodec,
+    MsgpackFormat,
+    cbor_header,
+    compress,
+    decompress,
+    dump_model_json,
+    get_format,
+)
+from yarrow.models import ContentEncoding, JsonBackend
+
+
+class Item(BaseModel):
+    a: int
+    b: list[float]
+
+
+@pytest.fixture(params=[JsonBackend.PYDANTIC, JsonBackend.ORJSON])
+def codec(request):
+    codec = JsonCodec()
+    codec.use(request.param)
+    return codec
+
+
+def test_codec_dumps(codec):
+    assert codec.dumps(Item(a=1, b=[0.5])) == b'{"a":1,"b":[0.5]}'
+    assert codec.dumps([Item(a=1, b=[])]) == b'[{"a":1,"b":[]}]'
+    assert codec.dumps({'a': 'ы', 'b': None}) == '{"a":"ы","b":null}'.encode('utf-8')
+
+
+def test_codec_dumps_pydantic_types(codec):
+    class Converted(BaseModel):
+        d: Decimal
+        s: set[int]
+
+    assert codec.dumps(Converted(d=Decimal('1.5'), s={1, 2})) == b'{"d":"1.5","s":[1,2]}'
+
+
+def test_codec_loads(codec):
+    assert codec.loads(b'{"a": [1, 2.5, null]}') == {'a': [1, 2.5, None]}
+    with pytest.raises(ValueError):
+        codec.loads(b'not json')
+
+
+def test_codec_default_backend():
+    codec = JsonCodec()
+
+    assert codec.dumps is to_json
+    assert codec.loads is from_json
+
+
+def test_dump_model_json():
+    class Binary(BaseModel):
+        a: bytes
+
+    assert dump_model_json(Binary(a=b'x')) == {'a': 'x'}
+    with pytest.raises(TypeError):
+        dump_model_json(object())
+
+
+@pytest.mark.parametrize('content_type, format_class', [
+    (None, Format),
+    (Mock(), Format),
+    ('text/plain', Format),
+    ('application/json; charset=utf-8', Format),
+    ('application/msgpack', MsgpackFormat),
+    ('APPLICATION/X-MSGPACK', MsgpackFormat),
+    ('application/vnd.msgpack', MsgpackFormat),
+    ('application/cbor', CborFormat),
+])
+def test_get_format(content_type, format_class):
+    format_ = get_format(content_type)
+
+    assert type(format_) is format_class
+    assert get_format(content_type) is format_
+
+
+@pytest.mark.parametrize('content_type, loads', [(JSON, from_json), (MSGPACK, msgpack.unpackb), (CBOR, cbor2.loads)])
+@pytest.mark.parametrize('size', [0, 1, 15, 16, 23, 24, 255, 256, 65535, 65536])
+def test_format_array(content_type, loads, size):
+    format_ = get_format(content_type)
+
+    assert loads(format_.array([format_.dumps(Item(a=i, b=[])) for i in range(size)])) == [
+        {'a': i, 'b': []} for i in range(size)
+    ]
+
+
+@pytest.mark.parametrize('content_type, loads', [(JSON, from_json), (MSGPACK, msgpack.unpackb), (CBOR, cbor2.loads)])
+def test_format_answer(content_type, loads):
+    format_ = get_format(content_type)
+
+    body = format_.answer([format_.dumps(value) for value in ({'a': 1}, [0.5], 'DONE', None, 2)])
+
+    assert loads(body) == {'request': {'a': 1}, 'result': [0.5], 'status': 'DONE', 'error': None, 'num': 2}
+    assert loads(format_.null) is None
+
+
+@pytest.mark.parametrize('content_type, dumps', [(JSON, to_json), (MSGPACK, msgpack.packb), (CBOR, cbor2.dumps)])
+def test_format_validate(content_type, dumps):
+    format_ = get_format(content_type)
+
+    assert format_.validate(Item, dumps({'a': 1, 'b': [2]})) == Item(a=1, b=[2.0])
+    assert format_.loads(dumps({'a': 1})) == {'a': 1}
+    with pytest.raises(format_.decode_errors):
+        format_.loads(b'\xc1')
+
+
+@pytest.mark.parametrize('size, length', [(23, 1), (24, 2), (255, 2), (256, 3), (65536, 5), (2 ** 32, 9)])
+def test_cbor_header(size, length):
+    header = cbor_header(4, size)
+
+    assert len(header) == length
+    assert header[0] >> 5 == 4
+
+
+@pytest.mark.parametrize('encoding', list(ContentEncoding))
+def test_compress(encoding):
+    body = b'{"a": [1, 2, 3]}' * 100
+
+    compressed = compress(body, encoding)
+
+    assert len(compressed) < len(body)
+    assert decompress(compressed, encoding.value) == body
+    assert decompress(compressed, encoding.value.upper()) == body
+
+
+def test_compress_gzip_deterministic():
+    assert compress(b'{}', ContentEncoding.GZIP) == compress(b'{}', ContentEncoding.GZIP)
+    assert gzip.decompress(compress(b'{}', ContentEncoding.GZIP)) == b'{}'
+
+
+@pytest.mark.parametrize('content_encoding', [None, Mock(), '', 'identity'])
+def test_decompress_not_compressed(content_encoding):
+    assert decompress(b'{}', content_encoding) == b'{}'
+
+
+def test_decompress_unsupported():
+    with pytest.raises(ValueError, match='Unsupported content encoding br'):
+        decompress(b'{}', 'br')
@@ -0,0 +1,146 @@
+from unittest.mock import Mock, call
+
+import pytest
+from pika.frame import Method
+from pika.spec import Basic
+
+from yarrow.confirms import ConfirmedChannel, PublisherConfirms
+
+
+@pytest.fixture
+def connection():
+    return Mock(add_callback_threadsafe=Mock(side_effect=lambda callback: callback()))
+
+
+@pytest.fixture
+def confirms(connection):
+    return PublisherConfirms(connection, Mock())
+
+
+def confirm(confirms, method):
+    on_confirm = confirms.channel._impl.confirm_delivery.call_args.args[0]
+    on_confirm(Method(1, method))
+
+
+def test_publisher_confirms_init(confirms):
+    confirms.channel._impl.confirm_delivery.assert_called_once()
+    confirms.channel.confirm_delivery.assert_not_called()
+
+
+def test_confirmed_channel_ack_after_confirm(confirms):
+    channel = Mock()
+    confirmed_channel = ConfirmedChannel(confirms, channel)
+
+    confirmed_channel.basic_publish('', routing_key='a', body=b'1')
+    confirmed_channel.basic_publish('', routing_key='a', body=b'2')
+    confirmed_channel.basic_ack(7)
+
+    assert confirms.channel.basic_publish.call_args_list == [
+        call('', routing_key='a', body=b'1'),
+        call('', routing_key='a', body=b'2'),
+    ]
+    channel.basic_publish.assert_not_called()
+    channel.basic_ack.assert_not_called()
+
+    confirm(confirms, Basic.Ack(delivery_tag=1))
+    channel.basic_ack.assert_not_called()
+
+    confirm(confirms, Basic.Ack(delivery_tag=2))
+    channel.basic_ack.assert_called_once_with(7)
+    assert not confirms.unconfirmed
+
+
+def test_confirmed_channel_ack_without_replies(confirms):
+    channel = Mock()
+
+    ConfirmedChannel(confirms, channel).basic_ack(7)
+
+    channel.basic_ack.assert_called_once_with(7)
+
+
+def test_confirmed_channel_other_methods(confirms):
+    channel = Mock()
+
+    ConfirmedChannel(confirms, channel).queue_declare('queue')
+
+    channel.queue_declare.assert_called_once_with('queue')
+
+
+def test_confirmed_channel_checkpoint(confirms):
+    channel = Mock()
+    actions = Mock()
+    confirmed_channel = ConfirmedChannel(confirms, channel)
+
+    confirmed_channel.checkpoint(actions.first)
+    actions.first.assert_called_once_with()
+
+    confirmed_channel.basic_publish('', routing_key='a', body=b'1')
+    confirmed_channel.checkpoint(actions.second)
+    confirmed_channel.basic_publish('', routing_key='a', body=b'2')
+    confirmed_channel.checkpoint(actions.third)
+    confirmed_channel.basic_ack(7)
+    actions.second.assert_not_called()
+
+    confirm(confirms, Basic.Ack(delivery_tag=1))
+    actions.second.assert_called_once_with()
+    actions.third.assert_not_called()
+
+    confirm(confirms, Basic.Ack(delivery_tag=2))
+    actions.third.assert_called_once_with()
+    assert [name for name, _, _ in actions.mock_calls] == ['first', 'second', 'third']
+    channel.basic_ack.assert_called_once_with(7)
+
+
+def test_confirmed_channel_checkpoint_nack(confirms):
+    actions = Mock()
+    confirmed_channel = ConfirmedChannel(confirms, Mock())
+    confirmed_channel.basic_publish('', routing_key='a', body=b'1')
+    confirmed_channel.checkpoint(actions.first)
+
+    confirm(confirms, Basic.Nack(delivery_tag=1))
+    confirmed_channel.checkpoint(actions.second)
+
+    actions.first.assert_not_called()
+    actions.second.assert_not_called()
+
+
+def test_publisher_confirms_multiple(confirms):
+    channels = [Mock(), Mock(), Mock()]
+    for delivery_tag, channel in enumerate(channels):
+        confirmed_channel = ConfirmedChannel(confirms, channel)
+        confirmed_channel.basic_publish('', routing_key='a', body=b'')
+        confirmed_channel.basic_ack(delivery_tag)
+
+    confirm(confirms, Basic.Ack(delivery_tag=2, multiple=True))
+
+    channels[0].basic_ack.assert_called_once_with(0)
+    channels[1].basic_ack.assert_called_once_with(1)
+    channels[2].basic_ack.assert_not_called()
+    assert list(confirms.unconfirmed) == [3]
+
+
+def test_publisher_confirms_nack(confirms):
+    channel = Mock()
+    confirmed_channel = ConfirmedChannel(confirms, channel)
+    confirmed_channel.basic_publish('', routing_key='a', body=b'1')
+    confirmed_channel.basic_publish('', routing_key='a', body=b'2')
+    confirmed_channel.basic_ack(7)
+
+    confirm(confirms, Basic.Nack(delivery_tag=1))
+    confirm(confirms, Basic.Ack(delivery_tag=2))
+
+    channel.basic_ack.assert_not_called()
+    channel.basic_nack.assert_called_once_with(7, requeue=True)
+
+
+def test_publisher_confirms_consumer(confirms):
+    callback = Mock()
+    channel = Mock()
+
+    confirms.consumer(callback)(channel, 'method_frame', 'properties', b'body')
+
+    confirmed_channel, method_frame, properties, body = callback.call_args.args
+    assert isinstance(confirmed_channel, ConfirmedChannel)
+    assert confirmed_channel.channel is channel
+    assert confirmed_channel.confirms is confirms
+    assert (method_frame, properties, body) == ('method_frame', 'properties', b'body')
@@ -0,0 +1,190 @@
+from unittest.mock import Mock, call
+
+from pika import BasicProperties
+import pytest
+
+from example.example import BatchSum
+from yarrow import metrics
+from yarrow.dedup import AnswerStore, Deduplication, MemoryAnswerStore, Publication, SqliteAnswerStore
+from yarrow.workers import BatchCollector
+
+
+def test_answer_store_not_implemented():
+    store = AnswerStore()
+
+    with pytest.raises(NotImplementedError):
+        store.get('a')
+    with pytest.raises(NotImplementedError):
+        store.set('a', [])
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryAnswerStore(2)
+    return SqliteAnswerStore(tmp_path / 'dedup.sqlite', 2)
+
+
+def test_answer_store(store):
+    publications = [
+        Publication('a', b'{"num":0}'),
+        Publication('a', b'\x85', 'b', 'application/msgpack', 'gzip'),
+    ]
+
+    assert store.get('Sum:1') is None
+    store.set('Sum:1', publications)
+    store.set('Sum:2', [])
+    assert store.get('Sum:1') == publications
+    assert store.get('Sum:2') == []
+
+    store.set('Sum:2', [Publication('c', b'{}')])
+    store.set('Sum:3', [])
+
+    assert store.get('Sum:1') is None
+    assert store.get('Sum:2') == [Publication('c', b'{}')]
+    assert store.get('Sum:3') == []
+
+
+def test_sqlite_answer_store_persistent(tmp_path):
+    SqliteAnswerStore(tmp_path / 'dedup.sqlite', 10).set('Sum:1', [Publication('a', b'{}')])
+
+    assert SqliteAnswerStore(tmp_path / 'dedup.sqlite', 10).get('Sum:1') == [Publication('a', b'{}')]
+
+
+ANSWER_PROPERTIES = BasicProperties(correlation_id='id', content_type='application/msgpack')
+
+
+def answer(channel, method_frame, properties, body):
+    channel.queue_declare('__dead_letters_queue__')
+    for num in range(2):
+        channel.basic_publish(
+            '',
+            routing_key=properties.reply_to,
+            body=body + str(num).encode(),
+            properties=BasicProperties(correlation_id=properties.correlation_id, content_type='application/msgpack'),
+        )
+    channel.basic_ack(method_frame.delivery_tag)
+
+
+def test_deduplication():
+    deduplication = Deduplication()
+    deduplication.store = MemoryAnswerStore(10)
+    callback = Mock(side_effect=answer)
+    on_message = deduplication.consumer('Sum', callback)
+    channel = Mock()
+    properties = BasicProperties(correlation_id='id', reply_to='a')
+    duplicates = metrics.DUPLICATES.values[('Sum',)]
+
+    on_message(channel, Mock(delivery_tag=1), properties, b'body')
+    on_message(channel, Mock(delivery_tag=2), properties, b'body')
+
+    callback.assert_called_once()
+    channel.queue_declare.assert_called_once_with('__dead_letters_queue__')
+    published = [
+        call('', routing_key='a', body=b'body0', properties=ANSWER_PROPERTIES),
+        call('', routing_key='a', body=b'body1', properties=ANSWER_PROPERTIES),
+    ]
+    assert channel.basic_publish.call_args_list == published * 2
+    assert channel.basic_ack.call_args_list == [call(1), call(2)]
+    assert metrics.DUPLICATES.values[('Sum',)] == duplicates + 1
+    assert not deduplication.pending
+    assert not deduplication.deliveries
+
+
+def test_deduplication_nack():
+    deduplication = Deduplication()
+    deduplication.store = MemoryAnswerStore(10)
+    channel = Mock()
+    properties = BasicProperties(correlation_id='id', reply_to='a')
+
+    def fail(channel, method_frame, properties, body):
+        channel.basic_publish('', routing_key='a', body=body, properties=properties)
+        channel.basic_nack(method_frame.delivery_tag, requeue=False)
+
+    deduplication.consumer('Sum', fail)(channel, Mock(delivery_tag=1), properties, b'body')
+
+    channel.basic_nack.assert_called_once_with(1, requeue=False)
+    assert deduplication.store.get('Sum:id') is None
+    assert not deduplication.pending
+    assert not deduplication.deliveries
+
+
+def test_deduplication_concurrent_copies():
+    deduplication = Deduplication()
+    deduplication.store = MemoryAnswerStore(10)
+    channels = {}
+
+    def publish(channel, method_frame, properties, body):
+        channel.basic_publish('', routing_key='a', body=body + b'-p0', properties=properties)
+        channels[method_frame.delivery_tag] = channel
+
+    on_message = deduplication.consumer('Sum', publish)
+    properties = BasicProperties(correlation_id='id', reply_to='a')
+    on_message(Mock(), Mock(delivery_tag=1), properties, b'first')
+    on_message(Mock(), Mock(delivery_tag=2), properties, b'second')
+    channels[2].basic_ack(2)
+
+    assert deduplication.store.get('Sum:id') == [Publication('a', b'second-p0', 'a')]
+    assert list(deduplication.pending) == [1]
+
+
+def test_deduplication_redelivery_after_reset():
+    deduplication = Deduplication()
+    deduplication.store = MemoryAnswerStore(10)
+    properties = BasicProperties(correlation_id='id', reply_to='a')
+
+    def partial_answer(channel, method_frame, properties, body):
+        channel.basic_publish('', routing_key='a', body=b'first-p0', properties=properties)
+
+    deduplication.consumer('Sum', partial_answer)(Mock(), Mock(delivery_tag=1), properties, b'body')
+    deduplication.reset()
+
+    assert not deduplication.pending
+    assert not deduplication.deliveries
+
+    channel = Mock()
+    deduplication.consumer('Sum', answer)(channel, Mock(delivery_tag=1), properties, b'second-')
+
+    assert [publication.body for publication in deduplication.store.get('Sum:id')] == [b'second-0', b'second-1']
+    channel.basic_ack.assert_called_once_with(1)
+
+
+def test_deduplication_batch_operator():
+    deduplication = Deduplication()
+    deduplication.store = MemoryAnswerStore(10)
+    on_message = deduplication.consumer('BatchSum', BatchCollector(Mock(), BatchSum.consume_batch, 2, 0.5))
+    channel = Mock()
+
+    on_message(channel, Mock(delivery_tag=1), BasicProperties(correlation_id='c1', reply_to='a'), b'{"a": 1, "b": 2}')
+    on_message(channel, Mock(delivery_tag=2), BasicProperties(correlation_id='c2', reply_to='a'), b'{"a": 3, "b": 4}')
+
+    assert [publication.body for publication in deduplication.store.get('BatchSum:c1')] == [
+        b'{"request":{"a":1,"b":2},"result":{"c":3},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":1,"b":2},"result":null,"status":"DONE","error":null,"num":1}',
+    ]
+    assert [publication.body for publication in deduplication.store.get('BatchSum:c2')] == [
+        b'{"request":{"a":3,"b":4},"result":{"c":7},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":3,"b":4},"result":null,"status":"DONE","error":null,"num":1}',
+    ]
+
+    channel.reset_mock()
+    on_message(channel, Mock(delivery_tag=3), BasicProperties(correlation_id='c1', reply_to='a'), b'{"a": 1, "b": 2}')
+
+    assert [call_.kwargs['body'] for call_ in channel.basic_publish.call_args_list] == [
+        publication.body for publication in deduplication.store.get('BatchSum:c1')
+    ]
+    channel.basic_ack.assert_called_once_with(3)
+
+
+@pytest.mark.parametrize('correlation_id, store', [(None, MemoryAnswerStore(10)), ('id', None)])
+def test_deduplication_skipped(correlation_id, store):
+    deduplication = Deduplication()
+    deduplication.store = store
+    callback = Mock()
+    channel = Mock()
+    method_frame = Mock(delivery_tag=1)
+    properties = BasicProperties(correlation_id=correlation_id)
+
+    deduplication.consumer('Sum', callback)(channel, method_frame, properties, b'body')
+
+    callback.assert_called_once_with(channel, method_frame, properties, b'body')
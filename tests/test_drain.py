@@ -0,0 +1,94 @@
+from unittest.mock import ANY, Mock
+
+import pytest
+
+from yarrow import metrics
+from yarrow.drain import Drain, TrackedChannel
+
+
+@pytest.fixture
+def drain():
+    return Drain(Mock(), Mock(), 5.0)
+
+
+def deliver(drain, operator_name, delivery_tag, callback=None):
+    callback = callback or Mock()
+    channel = Mock()
+    drain.consumer(operator_name, callback)(channel, Mock(delivery_tag=delivery_tag), Mock(), b'{}')
+    return channel, callback.call_args.args[0]
+
+
+def test_drain_consumer(drain):
+    callback = Mock()
+    channel, tracked_channel = deliver(drain, 'DrainOperator', 1, callback)
+
+    assert isinstance(tracked_channel, TrackedChannel)
+    callback.assert_called_once_with(tracked_channel, ANY, ANY, b'{}')
+    assert drain.deliveries == {1: 'DrainOperator'}
+
+    tracked_channel.basic_publish('', routing_key='a', body=b'1')
+    channel.basic_publish.assert_called_once_with('', routing_key='a', body=b'1')
+    tracked_channel.basic_ack(1)
+    channel.basic_ack.assert_called_once_with(1)
+    assert not drain.deliveries
+
+    channel, tracked_channel = deliver(drain, 'DrainOperator', 2)
+    tracked_channel.basic_nack(2, requeue=False)
+    channel.basic_nack.assert_called_once_with(2, requeue=False)
+    assert not drain.deliveries
+
+    deliver(drain, 'DrainOperator', None)
+    assert not drain.deliveries
+    drain.channel.stop_consuming.assert_not_called()
+
+
+def test_drain_start_without_deliveries(drain):
+    cancel = Mock()
+
+    drain.start(cancel)
+
+    cancel.assert_called_once_with()
+    drain.connection.call_later.assert_not_called()
+    drain.channel.stop_consuming.assert_called_once_with()
+
+
+def test_drain_start_finished(drain):
+    _, tracked_channel = deliver(drain, 'DrainOperator', 1)
+    _, other_tracked_channel = deliver(drain, 'DrainOperator', 2)
+
+    drain.start(Mock())
+
+    drain.connection.call_later.assert_called_once_with(5.0, drain.stop)
+    tracked_channel.basic_ack(1)
+    drain.channel.stop_consuming.assert_not_called()
+    other_tracked_channel.basic_ack(2)
+    drain.connection.remove_timeout.assert_called_once_with(drain.connection.call_later.return_value)
+    drain.channel.stop_consuming.assert_called_once_with()
+
+
+def test_drain_timeout(drain):
+    abandoned = metrics.ABANDONED.values[('SlowOperator',)]
+    deliver(drain, 'SlowOperator', 1)
+    deliver(drain, 'SlowOperator', 2)
+    deliver(drain, 'FastOperator', 3)[1].basic_ack(3)
+
+    drain.start(Mock())
+    drain.stop()
+
+    assert metrics.ABANDONED.values[('SlowOperator',)] == abandoned + 2
+    assert ('FastOperator',) not in metrics.ABANDONED.values
+    assert not drain.deliveries
+    assert drain.timer is None
+    drain.channel.stop_consuming.assert_called_once_with()
+
+
+def test_drain_interrupted(drain):
+    cancel = Mock()
+    deliver(drain, 'InterruptedOperator', 1)
+
+    drain.start(cancel)
+    drain.start(cancel)
+
+    cancel.assert_called_once_with()
+    assert not drain.deliveries
+    drain.channel.stop_consuming.assert_called_once_with()
@@ -0,0 +1,124 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from pika import BasicProperties
+
+from yarrow import metrics
+from yarrow.flow import FlowControl, Window, call
+
+
+def test_window():
+    window = Window('WindowOperator', 1)
+    resume = Mock()
+    pauses = metrics.STREAM_PAUSE_SECONDS.observations.get(('WindowOperator',), [0] * 16)[-1]
+
+    assert window.acquire(resume) is True
+    window.spend()
+    assert window.acquire(resume) is False
+    assert window.grant(0) is None
+    assert window.grant(1) is resume
+    assert window.grant(1) is None
+    assert window.credits == 2
+
+    resume.assert_not_called()
+    assert window.paused_seconds > 0
+    assert metrics.STREAM_PAUSE_SECONDS.observations[('WindowOperator',)][-1] == pytest.approx(
+        pauses + window.paused_seconds
+    )
+
+
+def test_window_expire():
+    window = Window('WindowOperator', 0)
+    resume = Mock()
+
+    assert window.expire(0.0) is None
+    assert window.acquire(resume) is False
+    assert window.expire(60.0) is None
+    assert window.expire(0.0) is resume
+    assert window.grant(1) is None
+    with pytest.raises(TimeoutError):
+        window.acquire(resume)
+
+
+def test_call():
+    task = Mock()
+
+    call(task)
+
+    task.assert_called_once_with()
+
+
+@patch('yarrow.flow.uuid.uuid4', return_value=Mock(hex='abc'))
+def test_flow_control_start(_):
+    flow_control = FlowControl()
+    channel = Mock()
+    executor = Mock()
+
+    flow_control.start(channel, executor)
+
+    assert flow_control.queue == '__credits__.abc'
+    assert flow_control.executor is executor
+    channel.queue_declare.assert_called_once_with('__credits__.abc', exclusive=True, auto_delete=True)
+    channel.basic_consume.assert_called_once_with('__credits__.abc', flow_control.on_grant)
+    channel.connection.call_later.assert_not_called()
+
+    flow_control.start(channel, idle_timeout=60.0)
+    assert flow_control.executor is call
+    channel.connection.call_later.assert_called_once_with(30.0, flow_control.expire)
+
+
+@pytest.fixture
+def flow_control():
+    flow_control = FlowControl()
+    flow_control.executor = Mock()
+    return flow_control
+
+
+def test_flow_control_on_grant(flow_control):
+    channel = Mock()
+    window = flow_control.open('GrantOperator', 'id', 0)
+    resume = Mock()
+    window.acquire(resume)
+
+    flow_control.on_grant(channel, Mock(delivery_tag=1), BasicProperties(correlation_id='id'), b'3')
+
+    channel.basic_ack.assert_called_once_with(1)
+    flow_control.executor.assert_called_once_with(resume)
+    assert window.credits == 3
+
+    flow_control.on_grant(channel, Mock(delivery_tag=2), BasicProperties(correlation_id='id'), b'1')
+    flow_control.executor.assert_called_once_with(resume)
+    assert window.credits == 4
+
+    flow_control.close('id')
+    flow_control.close('id')
+    assert not flow_control.windows
+
+
+@pytest.mark.parametrize('correlation_id, body', [('unknown', b'1'), ('id', b'"1"'), ('id', b'not json')])
+def test_flow_control_on_grant_ignored(flow_control, correlation_id, body):
+    channel = Mock()
+    window = flow_control.open('GrantOperator', 'id', 0)
+    window.acquire(Mock())
+
+    flow_control.on_grant(channel, Mock(delivery_tag=None), BasicProperties(correlation_id=correlation_id), body)
+
+    channel.basic_ack.assert_not_called()
+    flow_control.executor.assert_not_called()
+    assert window.credits == 0
+
+
+def test_flow_control_expire(flow_control):
+    flow_control.expire()
+
+    flow_control.channel = Mock()
+    flow_control.idle_timeout = 60.0
+    paused, resume = flow_control.open('ExpireOperator', 'paused', 0), Mock()
+    paused.acquire(resume)
+    flow_control.open('ExpireOperator', 'running', 1)
+
+    with patch('yarrow.flow.time.monotonic', return_value=paused.paused_at + 61.0):
+        flow_control.expire()
+
+    flow_control.executor.assert_called_once_with(resume)
+    flow_control.channel.connection.call_later.assert_called_once_with(30.0, flow_control.expire)
@@ -0,0 +1,120 @@
+import gzip
+from unittest.mock import Mock, call, patch
+
+import pika
+import pytest
+
+from yarrow import metrics
+from yarrow.instrumentation import INSTRUMENTATION, Instrument, Instrumentation, PhaseMetrics, Profiler
+from yarrow.models import Phase
+
+
+@pytest.fixture
+def instrument():
+    instrument = Mock(spec=Instrument)
+    INSTRUMENTATION.register(instrument)
+    with patch.object(INSTRUMENTATION, 'sample_rate', 1.0):
+        yield instrument
+    INSTRUMENTATION.unregister(instrument)
+
+
+def test_instrument_hooks_do_nothing():
+    instrument = Instrument()
+
+    instrument.before('Sum', Phase.RUN)
+    instrument.after('Sum', Phase.RUN, 1.0)
+
+
+def test_profiler_measure():
+    instrument = Mock()
+    profiler = Profiler('Sum', [instrument])
+
+    with patch('yarrow.instrumentation.time.perf_counter', side_effect=[1.0, 1.5]):
+        assert profiler.measure(Phase.RUN, sum, [1, 2]) == 3
+
+    assert instrument.mock_calls == [call.before('Sum', Phase.RUN), call.after('Sum', Phase.RUN, 0.5)]
+
+
+def test_profiler_measure_error():
+    instrument = Mock()
+    function = Mock(side_effect=ValueError)
+
+    with pytest.raises(ValueError):
+        Profiler('Sum', [instrument]).measure(Phase.RUN, function)
+
+    instrument.after.assert_called_once()
+
+
+def test_instrumentation_profiler():
+    instrumentation = Instrumentation()
+    assert instrumentation.profiler('Sum') is None
+
+    instrumentation.register(Mock())
+    assert instrumentation.profiler('Sum') is None
+
+    instrumentation.sample_rate = 0.5
+    with patch('yarrow.instrumentation.random.random', side_effect=[0.7, 0.2]):
+        assert instrumentation.profiler('Sum') is None
+        profiler = instrumentation.profiler('Sum')
+
+    assert isinstance(profiler, Profiler)
+    assert profiler.operator_name == 'Sum'
+    assert profiler.instruments == instrumentation.instruments
+
+
+def test_phase_metrics():
+    PhaseMetrics().after('PhaseOperator', Phase.PUBLISH, 0.001)
+
+    assert metrics.PHASE_SECONDS.observations[('PhaseOperator', 'publish')][-1] == 0.001
+
+
+def test_operator_phases(operator, instrument):
+    channel = Mock()
+
+    operator(channel, Mock(), Mock(reply_to='a'), b'{"a": 3}')
+
+    assert [phase for _, phase in (call_.args for call_ in instrument.before.call_args_list)] == [
+        Phase.VALIDATION,
+        Phase.RUN,
+        Phase.OUTPUT,
+        Phase.SERIALIZATION,
+        Phase.SERIALIZATION,
+        Phase.PUBLISH,
+        Phase.RUN,
+        Phase.SERIALIZATION,
+        Phase.PUBLISH,
+    ]
+    assert channel.basic_publish.call_count == 2
+
+
+def test_operator_phases_compressed(operator, instrument):
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id', content_encoding='gzip')
+
+    with patch.object(operator, 'compress_min_size', 75):
+        operator(Mock(), Mock(), properties, gzip.compress(b'{"a": 3}'))
+
+    assert [call_.args[1] for call_ in instrument.before.call_args_list] == [
+        Phase.COMPRESSION,
+        Phase.VALIDATION,
+        Phase.RUN,
+        Phase.OUTPUT,
+        Phase.SERIALIZATION,
+        Phase.SERIALIZATION,
+        Phase.COMPRESSION,
+        Phase.PUBLISH,
+        Phase.RUN,
+        Phase.SERIALIZATION,
+        Phase.PUBLISH,
+    ]
+
+
+async def test_operator_phases_async(operator, model, instrument):
+    async def run(input_):
+        yield model(a=input_.a)
+
+    with patch.object(operator, 'run', run):
+        assert [element async for element in operator.aexecute(model(a=1), INSTRUMENTATION.profiler('Test'))] == [
+            model(a=1),
+        ]
+
+    assert [call_.args[1] for call_ in instrument.before.call_args_list] == [Phase.OUTPUT]
@@ -0,0 +1,77 @@
+import time
+from unittest.mock import Mock, patch
+
+from example.example import BatchSum, Input, Output
+from yarrow.keepalive import KeepAlive
+
+
+def test_keepalive_not_started():
+    keepalive = KeepAlive()
+
+    assert list(keepalive.iterate([1, 2])) == [1, 2]
+    assert keepalive.waiting_since is None
+
+
+def test_keepalive():
+    keepalive = KeepAlive(0.01)
+    connection = Mock()
+    keepalive.start(connection)
+    stopped = keepalive.stopped
+
+    def results():
+        yield 1
+        time.sleep(0.1)
+        yield 2
+
+    assert list(keepalive.iterate(results())) == [1, 2]
+    connection.process_data_events.assert_called_with(0)
+    assert keepalive.waiting_since is None
+
+    keepalive.stop()
+    assert keepalive.connection is None
+    assert stopped.is_set()
+
+
+def test_keepalive_batch_operator():
+    keepalive = KeepAlive(0.01)
+    connection = Mock()
+
+    def run(inputs):
+        time.sleep(0.1)
+        for item in inputs:
+            yield Output(c=item.a + item.b)
+
+    with patch('yarrow.operator.KEEPALIVE', keepalive), patch.object(BatchSum, 'run', run):
+        keepalive.start(connection)
+        try:
+            assert BatchSum.execute_batch([Input(a=1, b=2)]) == [Output(c=3)]
+        finally:
+            keepalive.stop()
+
+    connection.process_data_events.assert_called_with(0)
+
+
+def test_keepalive_beat():
+    keepalive = KeepAlive(10.0)
+    connection = Mock()
+
+    keepalive.beat()
+    keepalive.connection = connection
+    keepalive.beat()
+    keepalive.waiting_since = time.monotonic()
+    keepalive.beat()
+    connection.process_data_events.assert_not_called()
+
+    with patch('yarrow.keepalive.time.monotonic', return_value=keepalive.waiting_since + 10.0):
+        keepalive.beat()
+    connection.process_data_events.assert_called_once_with(0)
+
+
+def test_keepalive_beat_error():
+    keepalive = KeepAlive(0.0)
+    keepalive.connection = Mock(process_data_events=Mock(side_effect=ConnectionError('lost')))
+    keepalive.waiting_since = 0.0
+
+    keepalive.beat()
+
+    assert keepalive.connection is None
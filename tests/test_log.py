@@ -0,0 +1,97 @@
+import json
+import logging
+from unittest.mock import Mock, patch
+
+import pytest
+
+from yarrow import log
+from yarrow.models import LogFormat
+
+
+def test_preview():
+    assert str(log.Preview(b'{"a": 1}', 10)) == '{"a": 1}'
+    assert str(log.Preview(b'{"a": 12345}', 5)) == '{"a":... (12 bytes)'
+
+
+def test_message_log_sampled():
+    message_log = log.MessageLog()
+    assert message_log.sampled() is True
+
+    message_log.sample_rate = 0.1
+    with patch('yarrow.log.random.random', side_effect=[0.05, 0.5]):
+        assert message_log.sampled() is True
+        assert message_log.sampled() is False
+
+
+def test_message_log_preview():
+    message_log = log.MessageLog()
+    message_log.body_preview = 3
+
+    preview = message_log.preview(b'abcdef')
+
+    assert isinstance(preview, log.Preview)
+    assert str(preview) == 'abc... (6 bytes)'
+
+
+def test_json_formatter():
+    record = logging.LogRecord('yarrow', logging.INFO, __file__, 1, 'Start %s', ('Sum',), None)
+    record.operator = 'Sum'
+    record.correlation_id = 'b'
+
+    entry = json.loads(log.JsonFormatter().format(record))
+
+    assert entry['level'] == 'INFO'
+    assert entry['logger'] == 'yarrow'
+    assert entry['message'] == 'Start Sum'
+    assert entry['operator'] == 'Sum'
+    assert entry['correlation_id'] == 'b'
+    assert 'status' not in entry
+    assert 'time' in entry
+
+
+def test_json_formatter_exception():
+    try:
+        raise ValueError('error')
+    except ValueError as error:
+        record = logging.LogRecord('yarrow', logging.ERROR, __file__, 1, 'Failed', (), (ValueError, error, None))
+
+    entry = json.loads(log.JsonFormatter().format(record))
+
+    assert 'ValueError: error' in entry['exception']
+
+
+@pytest.mark.parametrize('log_format, formatter_class', [
+    (LogFormat.TEXT, logging.Formatter),
+    (LogFormat.JSON, log.JsonFormatter),
+])
+@patch('yarrow.log.logging.basicConfig')
+def test_configure(basic_config_mock, log_format, formatter_class):
+    log.configure(Mock(LOG_FORMAT=log_format, LOG_LEVEL='DEBUG'))
+
+    basic_config_mock.assert_called_once()
+    assert basic_config_mock.call_args.kwargs['level'] == 'DEBUG'
+    handler, = basic_config_mock.call_args.kwargs['handlers']
+    assert type(handler.formatter) is formatter_class
+
+
+def test_operator_logs(operator, caplog):
+    caplog.set_level(logging.INFO, logger='yarrow.operator')
+
+    with patch.object(log.MESSAGE_LOG, 'body_preview', 4):
+        operator(Mock(), Mock(), Mock(reply_to='a', correlation_id='b'), b'{"a": 3}')
+
+    start, end = [record for record in caplog.records if record.name == 'yarrow.operator']
+    assert start.getMessage() == 'Start operator TestOperator, correlation_id b, body {"a"... (8 bytes)'
+    assert start.operator == 'TestOperator'
+    assert end.getMessage() == 'End operator TestOperator with status DONE, reply_to a, correlation_id b'
+    assert end.status == 'DONE'
+
+
+def test_operator_logs_not_sampled(operator, caplog):
+    caplog.set_level(logging.INFO, logger='yarrow.operator')
+
+    with patch.object(log.MESSAGE_LOG, 'sample_rate', 0):
+        operator(Mock(), Mock(), Mock(reply_to='a'), b'{"b": 3}')
+
+    records = [record for record in caplog.records if record.name == 'yarrow.operator']
+    assert [record.levelname for record in records] == ['ERROR']
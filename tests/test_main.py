@@ -1,10 +1,26 @@
-from unittest.mock import Mock, call, patch
+import signal
+from unittest.mock import ANY, Mock, call, patch
 
 from pika import BasicProperties
+from pika.exceptions import AMQPConnectionError, ChannelClosedByBroker, StreamLostError
 import pytest
 import yaml
 
-from yarrow import main
+from example.example import BatchSum, Mul, Sequence, Sum
+from yarrow import main, metrics
+from yarrow.checkpoint import CHECKPOINTS, FileCheckpointStore, SqliteCheckpointStore
+from yarrow.dedup import DEDUPLICATION, MemoryAnswerStore, SqliteAnswerStore
+from yarrow.instrumentation import PhaseMetrics
+from yarrow.models import CheckpointBackend, ExecutionMode, OperatorConfig
+from yarrow.operator import LOCAL_OPERATORS, Operator
+from yarrow.workers import BatchCollector
+
+
+@pytest.fixture(autouse=True)
+def clear_info_cache():
+    main.info_body.cache_clear()
+    yield
+    main.info_body.cache_clear()
 
 
 @patch('yarrow.main.yaml.load_all', return_value=[
@@ -24,8 +40,8 @@ def test_read_operator_list(settings_mock, open_mock, load_mock):
     operators = main.read_operator_list()
 
     assert operators == [
-        'example.example.Sum',
-        'example.example.Mul',
+        OperatorConfig(operator='example.example.Sum'),
+        OperatorConfig(operator='example.example.Mul'),
     ]
 
     settings_mock.assert_called_once_with()
@@ -37,10 +53,35 @@ def test_read_operator_list(settings_mock, open_mock, load_mock):
     load_mock.assert_called_once_with(open_mock.return_value.__enter__.return_value, Loader=yaml.Loader)
 
 
+@patch('yarrow.main.yaml.load_all', return_value=[
+    {
+        'operators': [
+            'example.example.Sum',
+            {
+                'operator': 'example.example.Sequence',
+                'prefetch_count': 10,
+                'max_in_flight': 2,
+                'priority': 5,
+            },
+        ]
+    }
+])
+@patch('yarrow.main.open')
+@patch('yarrow.main.Settings', return_value=Mock())
+def test_read_operator_list_with_settings(settings_mock, open_mock, load_mock):
+    operators = main.read_operator_list()
+
+    assert operators == [
+        OperatorConfig(operator='example.example.Sum'),
+        OperatorConfig(operator='example.example.Sequence', prefetch_count=10, max_in_flight=2, priority=5),
+    ]
+    assert (operators[1].module, operators[1].name) == ('example.example', 'Sequence')
+
+
 @patch('yarrow.main.import_module')
 @patch('yarrow.main.read_operator_list', return_value=[
-    'example.example.Sum',
-    'example.example.Mul'
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul'),
 ])
 def test_import_operators(read_operator_list_mock, import_module_mock):
     main.import_operators()
@@ -53,15 +94,25 @@ def test_import_operators(read_operator_list_mock, import_module_mock):
     ])
 
 
+@patch('yarrow.main.import_module')
+@patch('yarrow.main.read_operator_list')
+def test_import_operators_from_configs(read_operator_list_mock, import_module_mock):
+    operator_pairs = main.import_operators([OperatorConfig(operator='example.example.Sum')])
+
+    read_operator_list_mock.assert_not_called()
+    import_module_mock.assert_called_once_with('example.example')
+    assert operator_pairs == [('Sum', import_module_mock.return_value.Sum)]
+
+
 @patch('yarrow.main.import_module', side_effect=[
     Mock(),
     Mock(),
     AttributeError,
 ])
 @patch('yarrow.main.read_operator_list', return_value=[
-    'example.example.Sum',
-    'example.example.Mul',
-    'example.example.NotExistedOperator',
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul'),
+    OperatorConfig(operator='example.example.NotExistedOperator'),
 ])
 def test_import_operators_error_not_exists(read_operator_list_mock, import_module_mock):
     with pytest.raises(AttributeError):
@@ -81,9 +132,9 @@ def test_import_operators_error_not_exists(read_operator_list_mock, import_modul
     ModuleNotFoundError,
 ])
 @patch('yarrow.main.read_operator_list', return_value=[
-    'example.example.Sum',
-    'example.example.Mul',
-    'example.not_exist_module.NotExistedOperator',
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul'),
+    OperatorConfig(operator='example.not_exist_module.NotExistedOperator'),
 ])
 def test_import_operators_error_module_not_exists(read_operator_list_mock, import_module_mock):
     with pytest.raises(ModuleNotFoundError):
@@ -101,9 +152,9 @@ def test_import_operators_error_module_not_exists(read_operator_list_mock, impor
     String='abc',
 ))
 @patch('yarrow.main.read_operator_list', return_value=[
-    'example.example.Sum',
-    'example.example.Mul',
-    'example.example.String',
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul'),
+    OperatorConfig(operator='example.example.String'),
 ])
 def test_import_operators_error_not_callable(read_operator_list_mock, import_module_mock):
     with pytest.raises(ValueError):
@@ -119,24 +170,50 @@ def test_import_operators_error_not_callable(read_operator_list_mock, import_mod
     ])
 
 
+@patch('yarrow.main.Drain', return_value=Mock(consumer=lambda _, callback: callback))
+@patch('yarrow.main.read_operator_list', return_value=[
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul', prefetch_count=10, priority=5),
+])
 @patch('yarrow.main.import_operators', return_value=[
-    ('Sum', Mock()),
-    ('Mul', Mock()),
+    ('Sum', Sum),
+    ('Mul', Mul),
 ])
 @patch('yarrow.main.BlockingConnection')
 @patch('yarrow.main.ConnectionParameters')
 @patch('yarrow.main.PlainCredentials')
-@patch('yarrow.main.Settings', return_value=Mock())
+@patch('yarrow.main.Settings', return_value=Mock(
+    EXECUTION_MODE=ExecutionMode.SYNC,
+    PUBLISHER_CONFIRMS=False,
+    METRICS_PORT=None,
+    PROFILE_SAMPLE_RATE=0,
+    LOG_BODY_PREVIEW=200,
+    LOG_SAMPLE_RATE=1.0,
+    DEDUP_SIZE=0,
+    FUSE_PIPELINES=False,
+    STREAM_CREDITS=False,
+    DRAIN_TIMEOUT=30.0,
+    CHECKPOINT_PATH=None,
+))
+@patch('yarrow.main.signal.signal')
 def test_serve(
+        signal_mock,
         settings_mock,
         plain_credentials_mock,
         connection_parameters_mock,
         blocking_connection_mock,
-        import_operators_mock
+        import_operators_mock,
+        read_operator_list_mock,
+        drain_mock,
 ):
-    main.serve()
+    with patch('yarrow.main.KEEPALIVE') as keepalive_mock:
+        main.serve()
 
+    keepalive_mock.start.assert_called_once_with(blocking_connection_mock.return_value)
+    keepalive_mock.stop.assert_called_once_with()
     settings_mock.assert_called_once_with()
+    import_operators_mock.assert_has_calls([call(read_operator_list_mock.return_value), call()])
+    assert b'"name": "Sum"' in main.info_body()
 
     plain_credentials_mock.assert_called_once_with(
         settings_mock.return_value.USERNAME,
@@ -147,6 +224,7 @@ def test_serve(
         port=settings_mock.return_value.PORT,
         virtual_host=settings_mock.return_value.VIRTUAL_HOST,
         credentials=plain_credentials_mock.return_value,
+        heartbeat=settings_mock.return_value.HEARTBEAT,
     )
     blocking_connection_mock.assert_called_once_with(
         parameters=connection_parameters_mock.return_value
@@ -157,15 +235,96 @@ def test_serve(
     channel.queue_declare.assert_any_call('Sum')
     channel.queue_declare.assert_any_call('Mul')
 
-    channel.basic_consume.assert_any_call('Sum', import_operators_mock.return_value[0][1])
-    channel.basic_consume.assert_any_call('Mul', import_operators_mock.return_value[1][1])
+    channel.basic_qos.assert_has_calls([
+        call(prefetch_count=0),
+        call(prefetch_count=10),
+    ])
+
+    channel.basic_consume.assert_any_call('Sum', import_operators_mock.return_value[0][1], arguments=None)
+    channel.basic_consume.assert_any_call(
+        'Mul',
+        import_operators_mock.return_value[1][1],
+        arguments={'x-priority': 5},
+    )
 
     channel.start_consuming.assert_called_once_with()
 
+    drain_mock.assert_called_once_with(blocking_connection_mock.return_value, channel, 30.0)
+    assert [args.args[0] for args in signal_mock.call_args_list] == [signal.SIGHUP, signal.SIGTERM]
+    for signal_number, handler in (args.args for args in signal_mock.call_args_list):
+        handler(signal_number, None)
+    add_callback_threadsafe = blocking_connection_mock.return_value.add_callback_threadsafe
+    assert add_callback_threadsafe.call_count == 2
+    add_callback_threadsafe.call_args.args[0]()
+    drain_mock.return_value.start.assert_called_once()
+    drain_mock.return_value.start.call_args.args[0]()
+    channel.basic_cancel.assert_called()
+
     channel.close.assert_called_once_with()
     blocking_connection_mock.return_value.close.assert_called_once_with()
 
 
+@patch('yarrow.main.Drain', return_value=Mock(consumer=lambda _, callback: callback))
+@patch('yarrow.main.read_operator_list', return_value=[
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul', max_in_flight=2),
+])
+@patch('yarrow.main.import_operators', return_value=[
+    ('Sum', Sum),
+    ('Mul', Mul),
+])
+@patch('yarrow.main.WorkerPool')
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.Settings', return_value=Mock(
+    EXECUTION_MODE=ExecutionMode.THREAD,
+    WORKERS=4,
+    PUBLISHER_CONFIRMS=False,
+    METRICS_PORT=None,
+    PROFILE_SAMPLE_RATE=0,
+    LOG_BODY_PREVIEW=200,
+    LOG_SAMPLE_RATE=1.0,
+    DEDUP_SIZE=0,
+    FUSE_PIPELINES=False,
+    STREAM_CREDITS=False,
+    DRAIN_TIMEOUT=30.0,
+    CHECKPOINT_PATH=None,
+))
+@patch('yarrow.main.signal.signal')
+def test_serve_worker_pool(
+        _,
+        settings_mock,
+        plain_credentials_mock,
+        connection_parameters_mock,
+        blocking_connection_mock,
+        worker_pool_mock,
+        import_operators_mock,
+        read_operator_list_mock,
+        ______,
+):
+    main.serve()
+
+    worker_pool_mock.assert_called_once_with(
+        blocking_connection_mock.return_value,
+        ExecutionMode.THREAD,
+        4,
+    )
+    pool = worker_pool_mock.return_value
+
+    pool.consumer.assert_has_calls([
+        call(import_operators_mock.return_value[0][1], None),
+        call(import_operators_mock.return_value[1][1], 2),
+    ])
+
+    channel = blocking_connection_mock.return_value.channel.return_value
+    channel.basic_consume.assert_any_call('__info__', main.get_info)
+    channel.basic_consume.assert_any_call('Sum', pool.consumer.return_value, arguments=None)
+    channel.basic_consume.assert_any_call('Mul', pool.consumer.return_value, arguments=None)
+
+    pool.shutdown.assert_called_once_with()
+
+
 @patch('yarrow.main.import_operators')
 def test_get_info(import_operators_mock, operator):
     import_operators_mock.return_value = [
@@ -177,11 +336,12 @@ def test_get_info(import_operators_mock, operator):
     properties = Mock()
     body = None
 
+    main.get_info(channel, method_frame, properties, body)
     main.get_info(channel, method_frame, properties, body)
 
     import_operators_mock.assert_called_once_with()
 
-    channel.basic_publish.assert_called_once_with(
+    channel.basic_publish.assert_called_with(
         exchange='',
         routing_key=properties.reply_to,
         properties=BasicProperties(correlation_id=properties.correlation_id),
@@ -189,7 +349,8 @@ def test_get_info(import_operators_mock, operator):
              b'["a"], "title": "TestModel", "type": "object"}, "output": {"properties": {"a": {"title": "A", '
              b'"type": "integer"}}, "required": ["a"], "title": "TestModel", "type": "object"}}]'
     )
-    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+    assert channel.basic_publish.call_count == 2
+    assert channel.basic_ack.call_count == 2
 
 
 @patch('yarrow.main.import_operators')
@@ -209,3 +370,440 @@ def test_get_info_no_reply_to(import_operators_mock, operator):
 
     channel.basic_publish.assert_not_called()
     channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+
+
+@pytest.mark.parametrize('pool', [None, Mock()])
+def test_consumer_operator(pool, operator):
+    operator_config = OperatorConfig(operator='tests.TestOperator', max_in_flight=2)
+
+    callback = main.consumer(Mock(), pool, operator, operator_config)
+
+    if pool is None:
+        assert callback is operator
+    else:
+        assert callback is pool.consumer.return_value
+        pool.consumer.assert_called_once_with(operator, 2)
+
+
+def test_consumer_batch_operator():
+    connection = Mock()
+
+    callback = main.consumer(connection, None, BatchSum, OperatorConfig(operator='example.example.BatchSum'))
+
+    assert isinstance(callback, BatchCollector)
+    assert callback.connection is connection
+    assert callback.handler == BatchSum.consume_batch
+    assert callback.max_size == BatchSum.max_batch_size
+    assert callback.max_wait == BatchSum.max_batch_wait
+
+
+def test_consumer_batch_operator_pool():
+    pool = Mock()
+    operator_config = OperatorConfig(operator='example.example.BatchSum', max_in_flight=2)
+
+    callback = main.consumer(Mock(), pool, BatchSum, operator_config)
+
+    assert callback is pool.batch_consumer.return_value
+    pool.batch_consumer.assert_called_once_with(BatchSum, 2)
+
+
+@patch('yarrow.main.Drain', return_value=Mock(consumer=lambda _, callback: callback))
+@patch('yarrow.main.load_operators', return_value=(
+    [OperatorConfig(operator='example.example.Sum')],
+    [('Sum', Sum)],
+))
+@patch('yarrow.main.PublisherConfirms')
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.Settings', return_value=Mock(
+    EXECUTION_MODE=ExecutionMode.SYNC,
+    PUBLISHER_CONFIRMS=True,
+    METRICS_PORT=9100,
+    PROFILE_SAMPLE_RATE=0,
+    LOG_BODY_PREVIEW=200,
+    LOG_SAMPLE_RATE=1.0,
+    DEDUP_SIZE=0,
+    FUSE_PIPELINES=False,
+    STREAM_CREDITS=False,
+    DRAIN_TIMEOUT=30.0,
+    CHECKPOINT_PATH=None,
+))
+@patch('yarrow.main.metrics.start_server')
+@patch('yarrow.main.signal.signal')
+def test_serve_publisher_confirms_and_metrics(
+        _,
+        start_server_mock,
+        __,
+        ___,
+        ____,
+        blocking_connection_mock,
+        publisher_confirms_mock,
+        _____,
+        ______,
+):
+    main.serve()
+
+    start_server_mock.assert_called_once_with(9100)
+    connection = blocking_connection_mock.return_value
+    publisher_confirms_mock.assert_called_once_with(connection, connection.channel.return_value)
+    confirms = publisher_confirms_mock.return_value
+    confirms.consumer.assert_called_once_with(Sum)
+    connection.channel.return_value.basic_consume.assert_any_call('Sum', confirms.consumer.return_value, arguments=None)
+
+
+@patch('yarrow.main.read_operator_list', return_value=[
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul'),
+])
+@patch('yarrow.main.import_operators', return_value=[('Sum', Sum), ('Mul', Mul)])
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.Settings', return_value=Mock(
+    EXECUTION_MODE=ExecutionMode.SYNC,
+    PUBLISHER_CONFIRMS=False,
+    METRICS_PORT=None,
+    PROFILE_SAMPLE_RATE=0,
+    LOG_BODY_PREVIEW=200,
+    LOG_SAMPLE_RATE=1.0,
+    DEDUP_SIZE=0,
+    FUSE_PIPELINES=True,
+    STREAM_CREDITS=False,
+    DRAIN_TIMEOUT=30.0,
+    CHECKPOINT_PATH=None,
+))
+@patch('yarrow.main.signal.signal')
+def test_serve_fuse_pipelines(*_):
+    with patch.dict(LOCAL_OPERATORS, clear=True), patch.object(Sum, 'fusable', True), patch.object(Mul, 'fusable', True):
+        main.serve()
+
+        assert LOCAL_OPERATORS == {'Sum': Sum, 'Mul': Mul}
+
+
+@pytest.mark.parametrize('mode, started', [
+    (ExecutionMode.SYNC, True),
+    (ExecutionMode.THREAD, True),
+    (ExecutionMode.PROCESS, False),
+])
+@patch('yarrow.main.read_operator_list', return_value=[OperatorConfig(operator='example.example.Sequence')])
+@patch('yarrow.main.import_operators', return_value=[('Sequence', Sequence)])
+@patch('yarrow.main.FLOW_CONTROL')
+@patch('yarrow.main.WorkerPool')
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.signal.signal')
+def test_serve_stream_credits(
+        _,
+        __,
+        ___,
+        blocking_connection_mock,
+        worker_pool_mock,
+        flow_control_mock,
+        ____,
+        _____,
+        mode,
+        started,
+):
+    settings = Mock(
+        EXECUTION_MODE=mode,
+        WORKERS=None,
+        PUBLISHER_CONFIRMS=False,
+        METRICS_PORT=None,
+        PROFILE_SAMPLE_RATE=0,
+        LOG_BODY_PREVIEW=200,
+        LOG_SAMPLE_RATE=1.0,
+        DEDUP_SIZE=0,
+        FUSE_PIPELINES=False,
+        STREAM_CREDITS=True,
+        DRAIN_TIMEOUT=30.0,
+        CHECKPOINT_PATH=None,
+    )
+    with patch('yarrow.main.Settings', return_value=settings):
+        main.serve()
+
+    channel = blocking_connection_mock.return_value.channel.return_value
+    if not started:
+        flow_control_mock.start.assert_not_called()
+    elif mode is ExecutionMode.SYNC:
+        flow_control_mock.start.assert_called_once_with(channel, None, settings.STREAM_IDLE_TIMEOUT)
+    else:
+        flow_control_mock.start.assert_called_once_with(
+            channel,
+            worker_pool_mock.return_value.executor.submit,
+            settings.STREAM_IDLE_TIMEOUT,
+        )
+
+
+def test_is_local_operator(operator, model):
+    async def run(input_):
+        yield input_
+
+    async_operator = type('AsyncOperator', (Operator,), {'input': model, 'output': model, 'run': run, 'fusable': True})
+
+    assert main.is_local_operator(operator) is False
+    with patch.object(operator, 'fusable', True):
+        assert main.is_local_operator(operator) is True
+    assert main.is_local_operator(Operator) is False
+    assert main.is_local_operator(async_operator) is False
+    assert main.is_local_operator(lambda *_: None) is False
+
+
+def test_consumers_local_operators():
+    local_operators = {}
+    consumers = main.Consumers(Mock(), Mock(), None, None, local_operators)
+
+    with patch.object(Sum, 'fusable', True), patch.object(Sequence, 'fusable', True):
+        consumers.add('Sum', Sum, OperatorConfig(operator='example.example.Sum'))
+        consumers.add('Sequence', Sequence, OperatorConfig(operator='example.example.Sequence'))
+    consumers.add('Mul', Mul, OperatorConfig(operator='example.example.Mul'))
+    assert local_operators == {'Sum': Sum, 'Sequence': Sequence}
+
+    consumers.cancel('Sum')
+    assert local_operators == {'Sequence': Sequence}
+
+
+@pytest.fixture
+def consumers():
+    channel = Mock(basic_consume=Mock(side_effect=lambda queue, *_, **__: f'tag-{queue}'))
+    consumers = main.Consumers(Mock(), channel, None)
+    consumers.add('Sum', Sum, OperatorConfig(operator='example.example.Sum'))
+    consumers.add('Mul', Mul, OperatorConfig(operator='example.example.Mul'))
+    consumers.add('BatchSum', BatchSum, OperatorConfig(operator='example.example.BatchSum'))
+    channel.reset_mock()
+    return consumers
+
+
+def test_consumers_add(consumers):
+    assert consumers.registered == {
+        'Sum': (OperatorConfig(operator='example.example.Sum'), 'tag-Sum', Sum),
+        'Mul': (OperatorConfig(operator='example.example.Mul'), 'tag-Mul', Mul),
+        'BatchSum': (OperatorConfig(operator='example.example.BatchSum'), 'tag-BatchSum', ANY),
+    }
+
+
+def test_consumers_cancel(consumers):
+    collector = consumers.registered['BatchSum'][2]
+
+    with patch.object(collector, 'flush') as flush_mock:
+        consumers.cancel('BatchSum')
+        consumers.cancel('Sum')
+
+    assert consumers.channel.basic_cancel.call_args_list == [call('tag-BatchSum'), call('tag-Sum')]
+    flush_mock.assert_called_once_with()
+    assert list(consumers.registered) == ['Mul']
+    assert consumers.operators == {'Mul': (Mul, OperatorConfig(operator='example.example.Mul'))}
+
+
+def test_consumers_add_deduplication():
+    channel = Mock()
+    consumers = main.Consumers(Mock(), channel, None)
+
+    with patch.object(DEDUPLICATION, 'store', MemoryAnswerStore(10)):
+        consumers.add('Sum', Sum, OperatorConfig(operator='example.example.Sum'))
+
+    assert consumers.registered['Sum'][2] is Sum
+    on_message = channel.basic_consume.call_args.args[1]
+    assert on_message is not Sum
+    on_message(channel, Mock(delivery_tag=1), BasicProperties(correlation_id='id', reply_to='a'), b'{"a": 1, "b": 2}')
+    assert channel.basic_publish.call_count == 2
+    channel.basic_ack.assert_called_once_with(1)
+
+
+@patch('yarrow.main.read_operator_list', return_value=[
+    OperatorConfig(operator='example.example.Sum'),
+    OperatorConfig(operator='example.example.Mul', prefetch_count=5),
+    OperatorConfig(operator='example.example.Sequence'),
+])
+def test_consumers_reload(_, consumers):
+    consumers.reload()
+
+    channel = consumers.channel
+    assert channel.basic_cancel.call_args_list == [call('tag-Mul'), call('tag-BatchSum')]
+    assert [call_.args[0] for call_ in channel.basic_consume.call_args_list] == ['Mul', 'Sequence']
+    channel.basic_qos.assert_any_call(prefetch_count=5)
+    assert list(consumers.registered) == ['Sum', 'Mul', 'Sequence']
+    assert b'"name": "Sequence"' in main.info_body()
+
+
+@patch('yarrow.main.read_operator_list', side_effect=ValueError('invalid config'))
+def test_consumers_reload_error(_, consumers):
+    consumers.reload()
+
+    consumers.channel.basic_cancel.assert_not_called()
+    consumers.channel.basic_consume.assert_not_called()
+    assert list(consumers.registered) == ['Sum', 'Mul', 'BatchSum']
+
+
+@patch('yarrow.main.MESSAGE_LOG')
+@patch('yarrow.main.INSTRUMENTATION')
+@patch('yarrow.main.metrics.start_server')
+def test_apply_settings(start_server_mock, instrumentation_mock, message_log_mock):
+    main.apply_settings(
+        Mock(METRICS_PORT=None, PROFILE_SAMPLE_RATE=0.1, LOG_BODY_PREVIEW=10, LOG_SAMPLE_RATE=0.5, DEDUP_SIZE=0),
+    )
+
+    assert message_log_mock.body_preview == 10
+    assert message_log_mock.sample_rate == 0.5
+    start_server_mock.assert_not_called()
+    assert instrumentation_mock.sample_rate == 0.1
+    instrumentation_mock.register.assert_called_once()
+    assert isinstance(instrumentation_mock.register.call_args.args[0], PhaseMetrics)
+
+
+@pytest.mark.parametrize('filename, store_class', [(None, MemoryAnswerStore), ('dedup.sqlite', SqliteAnswerStore)])
+def test_apply_settings_deduplication(tmp_path, filename, store_class):
+    settings = Mock(
+        METRICS_PORT=None,
+        PROFILE_SAMPLE_RATE=0,
+        LOG_BODY_PREVIEW=200,
+        LOG_SAMPLE_RATE=1.0,
+        DEDUP_SIZE=100,
+        DEDUP_FILENAME=None if filename is None else tmp_path / filename,
+    )
+
+    with patch.object(DEDUPLICATION, 'store', None):
+        main.apply_settings(settings)
+
+        assert isinstance(DEDUPLICATION.store, store_class)
+        assert DEDUPLICATION.store.max_size == 100
+
+
+@pytest.mark.parametrize('backend, store_class', [
+    (CheckpointBackend.FILE, FileCheckpointStore),
+    (CheckpointBackend.SQLITE, SqliteCheckpointStore),
+])
+def test_set_checkpoint_store(tmp_path, backend, store_class):
+    settings = Mock(CHECKPOINT_PATH=tmp_path / 'checkpoints', CHECKPOINT_BACKEND=backend, EXECUTION_MODE=ExecutionMode.THREAD)
+
+    with patch.object(CHECKPOINTS, 'store', None):
+        main.set_checkpoint_store(settings)
+
+        assert isinstance(CHECKPOINTS.store, store_class)
+
+
+@pytest.mark.parametrize('path, mode', [(None, ExecutionMode.SYNC), ('checkpoints', ExecutionMode.PROCESS)])
+def test_set_checkpoint_store_off(tmp_path, path, mode):
+    settings = Mock(
+        CHECKPOINT_PATH=None if path is None else tmp_path / path,
+        CHECKPOINT_BACKEND=CheckpointBackend.FILE,
+        EXECUTION_MODE=mode,
+    )
+
+    with patch.object(CHECKPOINTS, 'store', None):
+        main.set_checkpoint_store(settings)
+
+        assert CHECKPOINTS.store is None
+    assert not (tmp_path / 'checkpoints').exists()
+
+
+def reconnect_settings(attempts):
+    return Mock(
+        EXECUTION_MODE=ExecutionMode.SYNC,
+        PUBLISHER_CONFIRMS=False,
+        METRICS_PORT=None,
+        PROFILE_SAMPLE_RATE=0,
+        LOG_BODY_PREVIEW=200,
+        LOG_SAMPLE_RATE=1.0,
+        DEDUP_SIZE=0,
+        FUSE_PIPELINES=False,
+        STREAM_CREDITS=False,
+        DRAIN_TIMEOUT=30.0,
+        CHECKPOINT_PATH=None,
+        RECONNECT_DELAY=1.0,
+        RECONNECT_MAX_DELAY=60.0,
+        RECONNECT_ATTEMPTS=attempts,
+    )
+
+
+@patch('yarrow.main.Drain', return_value=Mock(consumer=lambda _, callback: callback, draining=False))
+@patch('yarrow.main.read_operator_list', return_value=[OperatorConfig(operator='example.example.Sum')])
+@patch('yarrow.main.import_operators', return_value=[('Sum', Sum)])
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.time.sleep')
+@patch('yarrow.main.signal.signal')
+def test_serve_reconnect(signal_mock, sleep_mock, _, __, blocking_connection_mock, ___, ____, _____):
+    reconnects = metrics.RECONNECTS.values[()]
+    lost_connection = Mock()
+    lost_connection.channel.return_value.start_consuming.side_effect = StreamLostError('lost')
+    connection = Mock()
+    blocking_connection_mock.side_effect = [AMQPConnectionError('refused'), lost_connection, connection]
+
+    with (
+        patch('yarrow.main.Settings', return_value=reconnect_settings(2)),
+        patch.object(DEDUPLICATION, 'reset') as reset_mock,
+    ):
+        main.serve()
+
+    assert reset_mock.call_count == 2
+    assert blocking_connection_mock.call_count == 3
+    assert sleep_mock.call_count == 2
+    assert 0 <= sleep_mock.call_args_list[0].args[0] <= 1.0
+    assert 0 <= sleep_mock.call_args_list[1].args[0] <= 1.0
+    assert metrics.RECONNECTS.values[()] == reconnects + 2
+    for connection_ in (lost_connection, connection):
+        connection_.channel.return_value.basic_consume.assert_any_call('Sum', Sum, arguments=None)
+        connection_.channel.return_value.start_consuming.assert_called_once_with()
+    lost_connection.channel.return_value.close.assert_called_once_with()
+    assert call(signal.SIGTERM, signal.SIG_DFL) in signal_mock.call_args_list
+    assert call(signal.SIGHUP, signal.SIG_IGN) in signal_mock.call_args_list
+
+
+@patch('yarrow.main.Drain', return_value=Mock(consumer=lambda _, callback: callback, draining=False))
+@patch('yarrow.main.read_operator_list', return_value=[OperatorConfig(operator='example.example.Sum')])
+@patch('yarrow.main.import_operators', return_value=[('Sum', Sum)])
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.time.sleep')
+@patch('yarrow.main.signal.signal')
+def test_serve_reconnect_attempts(_, sleep_mock, __, ___, blocking_connection_mock, ____, _____, ______):
+    blocking_connection_mock.return_value.channel.return_value.start_consuming.side_effect = (
+        ChannelClosedByBroker(406, 'PRECONDITION_FAILED')
+    )
+
+    with (
+        patch('yarrow.main.Settings', return_value=reconnect_settings(0)),
+        pytest.raises(ChannelClosedByBroker),
+    ):
+        main.serve()
+
+    sleep_mock.assert_not_called()
+
+
+@patch('yarrow.main.Drain', return_value=Mock(consumer=lambda _, callback: callback, draining=True))
+@patch('yarrow.main.read_operator_list', return_value=[OperatorConfig(operator='example.example.Sum')])
+@patch('yarrow.main.import_operators', return_value=[('Sum', Sum)])
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.time.sleep')
+@patch('yarrow.main.signal.signal')
+def test_serve_connection_lost_while_draining(_, sleep_mock, __, ___, blocking_connection_mock, ____, _____, ______):
+    blocking_connection_mock.return_value.channel.return_value.start_consuming.side_effect = StreamLostError('lost')
+
+    with patch('yarrow.main.Settings', return_value=reconnect_settings(2)):
+        main.serve()
+
+    blocking_connection_mock.assert_called_once()
+    sleep_mock.assert_not_called()
+
+
+@patch('yarrow.main.Drain', return_value=Mock(consumer=lambda _, callback: callback, draining=False))
+@patch('yarrow.main.read_operator_list', return_value=[OperatorConfig(operator='example.example.Sum')])
+@patch('yarrow.main.import_operators', return_value=[('Sum', Sum)])
+@patch('yarrow.main.BlockingConnection')
+@patch('yarrow.main.ConnectionParameters')
+@patch('yarrow.main.PlainCredentials')
+@patch('yarrow.main.signal.signal')
+def test_serve_heartbeat_off(*_):
+    settings = reconnect_settings(0)
+    settings.HEARTBEAT = 0
+
+    with patch('yarrow.main.Settings', return_value=settings), patch('yarrow.main.KEEPALIVE') as keepalive_mock:
+        main.serve()
+
+    keepalive_mock.start.assert_not_called()
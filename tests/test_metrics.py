@@ -0,0 +1,132 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from unittest.mock import Mock, patch
+
+import pytest
+
+from yarrow import metrics
+
+
+def test_counter():
+    counter = metrics.Counter('test_total', 'Test.', ('operator', 'status'))
+
+    counter.inc('Sum', 'DONE')
+    counter.inc('Sum', 'DONE', value=2)
+    counter.inc('Mul', 'ERROR')
+
+    assert list(counter.samples()) == [
+        'test_total{operator="Sum",status="DONE"} 3',
+        'test_total{operator="Mul",status="ERROR"} 1',
+    ]
+
+
+def test_counter_precision():
+    counter = metrics.Counter('test_total', 'Test.')
+
+    counter.inc('Sum', value=1234567)
+    counter.inc('Sum', value=0.5)
+
+    assert list(counter.samples()) == ['test_total{operator="Sum"} 1234567.5']
+
+
+def test_gauge():
+    gauge = metrics.Gauge('test', 'Test.')
+
+    gauge.inc('Sum')
+    gauge.inc('Sum')
+    gauge.dec('Sum')
+
+    assert list(gauge.samples()) == ['test{operator="Sum"} 1']
+
+
+def test_histogram():
+    histogram = metrics.Histogram('test_seconds', 'Test.', (0.1, 1.0))
+
+    histogram.observe(0.05, 'Sum')
+    histogram.observe(0.1, 'Sum')
+    histogram.observe(0.5, 'Sum')
+    histogram.observe(2.0, 'Sum')
+
+    assert list(histogram.samples()) == [
+        'test_seconds_bucket{operator="Sum",le="0.1"} 2',
+        'test_seconds_bucket{operator="Sum",le="1.0"} 3',
+        'test_seconds_bucket{operator="Sum",le="+Inf"} 4',
+        'test_seconds_sum{operator="Sum"} 2.65',
+        'test_seconds_count{operator="Sum"} 4',
+    ]
+
+
+def test_histogram_precision():
+    histogram = metrics.Histogram('test_seconds', 'Test.', (0.1,))
+
+    histogram.observe(1.0, 'Sum')
+    # Observations of a long running process: counts of buckets and the sum.
+    histogram.observations[('Sum',)] = [0, 1_000_001, 1_000_001.0]
+
+    assert list(histogram.samples()) == [
+        'test_seconds_bucket{operator="Sum",le="0.1"} 0',
+        'test_seconds_bucket{operator="Sum",le="+Inf"} 1000001',
+        'test_seconds_sum{operator="Sum"} 1000001',
+        'test_seconds_count{operator="Sum"} 1000001',
+    ]
+
+
+def test_metric_samples_not_implemented():
+    with pytest.raises(NotImplementedError):
+        list(metrics.Metric('test', 'Test.').samples())
+
+
+def test_render():
+    counter = metrics.Counter('test_total', 'Test.')
+    counter.inc('Sum')
+
+    with patch.object(metrics, 'METRICS', [counter]):
+        assert metrics.render() == (
+            b'# HELP test_total Test.\n'
+            b'# TYPE test_total counter\n'
+            b'test_total{operator="Sum"} 1\n'
+        )
+
+
+def test_start_server():
+    server = metrics.start_server(0, '127.0.0.1')
+    url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        with patch.object(metrics, 'render', Mock(return_value=b'metrics\n')):
+            with urlopen(f'{url}/metrics') as response:
+                assert response.status == 200
+                assert response.headers['Content-Type'].startswith('text/plain')
+                assert response.read() == b'metrics\n'
+
+        with pytest.raises(HTTPError) as error:
+            urlopen(f'{url}/other')
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_operator_metrics(operator):
+    labels = (operator.__name__,)
+    consumed = metrics.MESSAGES_CONSUMED.values[labels]
+    done = metrics.ANSWERS_PUBLISHED.values[(operator.__name__, 'DONE')]
+
+    operator(Mock(), Mock(), Mock(reply_to='a'), b'{"a": 3}')
+
+    assert metrics.MESSAGES_CONSUMED.values[labels] == consumed + 1
+    assert metrics.ANSWERS_PUBLISHED.values[(operator.__name__, 'DONE')] == done + 1
+    assert metrics.IN_FLIGHT.values[labels] == 0
+    assert labels in metrics.VALIDATION_SECONDS.observations
+    assert labels in metrics.RUN_SECONDS.observations
+    assert labels in metrics.PUBLISH_SECONDS.observations
+    assert metrics.STREAM_LENGTH.observations[labels][0] >= 1
+
+
+def test_operator_metrics_error(operator):
+    labels = (operator.__name__,)
+    errors = metrics.ANSWERS_PUBLISHED.values[(operator.__name__, 'ERROR')]
+
+    operator(Mock(), Mock(), Mock(reply_to='a'), b'{"b": 3}')
+
+    assert metrics.ANSWERS_PUBLISHED.values[(operator.__name__, 'ERROR')] == errors + 1
+    assert metrics.IN_FLIGHT.values[labels] == 0
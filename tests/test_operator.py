@@ -1,15 +1,34 @@
-from unittest.mock import Mock, patch
+import gzip
+import hashlib
+from functools import partial
+from unittest.mock import AsyncMock, Mock, call, patch
 
+import cbor2
+import msgpack
 import pika
+from pydantic_core import from_json
 import pytest
 
-from yarrow.operator import Operator
+from yarrow.checkpoint import CHECKPOINTS, Checkpoint, CheckpointStore
+from yarrow.codec import CODEC, compress, get_format
+from yarrow.flow import FLOW_CONTROL
+from yarrow.models import ContentEncoding, RequestEcho
+from yarrow.operator import LOCAL_OPERATORS, BatchOperator, Chunk, Operator, Route, parse_route
 
 
-def test_operator_is_abstract_no_input():
-    class_ = type('class_', (Operator,), {})
+def test_operator_is_abstract_no_input(model, caplog):
+    class_ = type('class_', (Operator,), {'output': model})
 
     assert class_.is_abstract is True
+    assert 'is abstract' in caplog.text
+
+
+def test_operator_is_abstract_base_class(caplog):
+    class_ = type('class_', (Operator,), {'max_batch_size': 10})
+
+    assert class_.is_abstract is True
+    assert BatchOperator.is_abstract is True
+    assert not caplog.records
 
 
 def test_operator_is_abstract_no_output(model):
@@ -56,12 +75,12 @@ def test_operator_init(operator):
     properties = Mock(reply_to='a')
     body = b'{"a": 3}'
 
-    with patch.object(operator, 'call', Mock(
+    with patch.object(operator, 'execute', Mock(
         return_value=[{'a': 'b'}]
-    )) as call_mock:
+    )) as execute_mock:
         operator(channel, method_frame, properties, body)
 
-        call_mock.assert_called_once_with(a=3)
+        execute_mock.assert_called_once_with(operator.input(a=3), None)
 
     assert channel.basic_publish.call_count == 2
 
@@ -96,12 +115,12 @@ def test_operator_generator(operator):
         yield {'c': 'd'}
         yield {'e': 'f'}
 
-    with patch.object(operator, 'call', Mock(
+    with patch.object(operator, 'execute', Mock(
         return_value=generator()
-    )) as call_mock:
+    )) as execute_mock:
         operator(channel, method_frame, properties, body)
 
-        call_mock.assert_called_once_with(a=3)
+        execute_mock.assert_called_once_with(operator.input(a=3), None)
 
     assert channel.basic_publish.call_count == 4
 
@@ -145,6 +164,120 @@ def test_operator_generator(operator):
     channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
 
 
+@pytest.mark.parametrize('reply_to, route', [
+    ('a', Route(('a',))),
+    ('a>b>c', Route(('a',), 'b>c')),
+    ('a,b>c,d>e', Route(('a', 'b'), 'c,d>e')),
+    ('a,>', Route(('a',))),
+    (',', Route(())),
+])
+def test_parse_route(reply_to, route):
+    assert parse_route(reply_to) == route
+    assert parse_route(reply_to) is parse_route(reply_to)
+
+
+def test_route_str():
+    assert str(Route(('a', 'b'), 'c>d')) == 'a,b>c>d'
+    assert str(Route(('a',))) == 'a'
+
+
+def test_operator_fan_out(operator):
+    channel = Mock()
+    properties = Mock(reply_to='a,b>c')
+
+    operator(channel, Mock(), properties, b'{"a": 3}')
+
+    answer_properties = pika.BasicProperties(correlation_id=properties.correlation_id, reply_to='c')
+    assert channel.basic_publish.call_args_list == [
+        call(
+            '',
+            routing_key=queue,
+            body=b'{"request":{"a":3},"result":{"a":300},"status":"PROCESSING","error":null,"num":0}',
+            properties=answer_properties,
+        )
+        for queue in ('a', 'b')
+    ] + [
+        call(
+            '',
+            routing_key=queue,
+            body=b'{"request":{"a":3},"result":null,"status":"DONE","error":null,"num":1}',
+            properties=answer_properties,
+        )
+        for queue in ('a', 'b')
+    ]
+
+
+def test_operator_reply_to_without_queue(operator):
+    channel = Mock()
+    properties = Mock(reply_to='>b')
+
+    operator(channel, Mock(), properties, b'{"a": 3}')
+
+    channel.queue_declare.assert_called_once_with('__dead_letters_queue__')
+    channel.basic_publish.assert_called_once()
+    assert channel.basic_publish.call_args.kwargs['routing_key'] == '__dead_letters_queue__'
+    assert b'"error":"No queue in property reply_to"' in channel.basic_publish.call_args.kwargs['body']
+
+
+@pytest.fixture
+def repeat_operator(model):
+    class Repeat(Operator):
+        input = model
+        output = model
+
+        @classmethod
+        def run(cls, input_):
+            yield {'a': input_.a + 1}
+            yield {'a': input_.a + 2}
+
+    with patch.dict(LOCAL_OPERATORS, {'repeat': Repeat}):
+        yield Repeat
+
+
+def test_operator_local_hops(operator, repeat_operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='repeat>repeat>out>next', correlation_id='id')
+
+    with patch.object(repeat_operator, 'run', wraps=repeat_operator.run) as run_mock:
+        operator(channel, Mock(), properties, b'{"a": 3}')
+
+    assert run_mock.call_count == 3
+    assert {call_.kwargs['routing_key'] for call_ in channel.basic_publish.call_args_list} == {'out'}
+    assert {call_.kwargs['properties'].reply_to for call_ in channel.basic_publish.call_args_list} == {'next'}
+    assert [from_json(call_.kwargs['body'])['result'] for call_ in channel.basic_publish.call_args_list] == [
+        {'a': 302}, {'a': 303}, {'a': 303}, {'a': 304}, None,
+    ]
+    assert [from_json(call_.kwargs['body'])['num'] for call_ in channel.basic_publish.call_args_list] == [
+        0, 1, 2, 3, 4,
+    ]
+
+
+@pytest.mark.parametrize('reply_to, routing_keys', [
+    ('repeat', ['repeat'] * 2),
+    ('repeat,out>next', ['repeat', 'out'] * 2),
+    ('other>repeat>out', ['other'] * 2),
+])
+def test_operator_not_local_hops(operator, repeat_operator, reply_to, routing_keys):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to=reply_to, correlation_id='id')
+
+    operator(channel, Mock(), properties, b'{"a": 3}')
+
+    assert [call_.kwargs['routing_key'] for call_ in channel.basic_publish.call_args_list] == routing_keys
+
+
+def test_operator_local_hop_error(operator, repeat_operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='repeat>out', correlation_id='id')
+
+    with patch.object(repeat_operator, 'run', side_effect=ValueError('failed')):
+        operator(channel, Mock(), properties, b'{"a": 3}')
+
+    channel.basic_publish.assert_called_once()
+    assert channel.basic_publish.call_args.kwargs['routing_key'] == 'out'
+    assert b'"status":"ERROR","error":"failed"' in channel.basic_publish.call_args.kwargs['body']
+
+
 def test_operator_init_properties_reply_to_none(operator):
     channel = Mock()
     method_frame = Mock()
@@ -194,3 +327,733 @@ def test_operator_init_properties_correlation_id_none(operator):
         properties=pika.BasicProperties(reply_to='b>c'),
     )
     channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+
+
+@pytest.fixture
+def async_operator(model):
+    class AsyncTestOperator(Operator):
+        input = model
+        output = model
+
+        @classmethod
+        async def run(cls, input_: model):
+            yield model(a=input_.a * 100)  # type: ignore
+            yield {'a': input_.a * 1000}  # type: ignore
+
+    return AsyncTestOperator
+
+
+def test_operator_call_async_run(async_operator):
+    with pytest.raises(ValueError):
+        for _ in async_operator.call(a=3):
+            pass
+
+
+async def test_operator_acall_is_abstract():
+    with pytest.raises(ValueError):
+        async for _ in Operator.acall():
+            pass
+
+
+async def test_operator_acall_sync_run(operator):
+    elements = [element async for element in operator.acall(a=3)]
+
+    assert elements == [{'a': 300}]
+
+
+async def test_operator_acall_async_run(async_operator):
+    elements = [element async for element in async_operator.acall(a=3)]
+
+    assert elements == [{'a': 300}, {'a': 3000}]
+
+
+async def test_operator_consume(async_operator):
+    channel = Mock(flush=AsyncMock())
+    method_frame = Mock()
+    properties = Mock(reply_to='a>b')
+    body = b'{"a": 3}'
+
+    await async_operator.consume(channel, method_frame, properties, body)
+
+    assert channel.basic_publish.call_args_list == [
+        call(
+            '',
+            routing_key='a',
+            body=b'{"request":{"a":3},"result":{"a":300},"status":"PROCESSING","error":null,"num":0}',
+            properties=pika.BasicProperties(correlation_id=properties.correlation_id, reply_to='b'),
+        ),
+        call(
+            '',
+            routing_key='a',
+            body=b'{"request":{"a":3},"result":{"a":3000},"status":"PROCESSING","error":null,"num":1}',
+            properties=pika.BasicProperties(correlation_id=properties.correlation_id, reply_to='b'),
+        ),
+        call(
+            '',
+            routing_key='a',
+            body=b'{"request":{"a":3},"result":null,"status":"DONE","error":null,"num":2}',
+            properties=pika.BasicProperties(correlation_id=properties.correlation_id, reply_to='b'),
+        ),
+    ]
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+    assert channel.flush.await_count == 3
+
+
+async def test_operator_consume_error(async_operator):
+    channel = Mock(flush=AsyncMock())
+    method_frame = Mock()
+    properties = Mock(reply_to='a')
+    body = b'{"a": "b"}'
+
+    await async_operator.consume(channel, method_frame, properties, body)
+
+    channel.basic_publish.assert_called_once()
+    assert b'"status":"ERROR"' in channel.basic_publish.call_args.kwargs['body']
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+    channel.flush.assert_awaited_once_with()
+
+
+def test_operator_execute_is_abstract(model):
+    with pytest.raises(ValueError):
+        for _ in Operator.execute(model(a=1)):
+            pass
+
+
+def test_operator_init_body_not_json(operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a')
+    body = b'not json'
+
+    operator(channel, method_frame, properties, body)
+
+    channel.basic_publish.assert_called_once()
+    assert channel.basic_publish.call_args.kwargs['body'].startswith(
+        b'{"request":"not json","result":null,"status":"ERROR","error":'
+    )
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+
+
+def test_operator_request_decoded_once(operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a')
+    body = b'{"a": 3}'
+
+    with (
+        patch.object(operator, 'execute', Mock(return_value=[{'a': 1}, {'a': 2}, {'a': 3}])),
+        patch.object(operator.input, 'model_validate_json', wraps=operator.input.model_validate_json) as validate_mock,
+        patch.object(CODEC, 'loads', wraps=CODEC.loads) as loads_mock,
+    ):
+        operator(channel, method_frame, properties, body)
+
+    assert channel.basic_publish.call_count == 4
+    validate_mock.assert_called_once_with(body)
+    loads_mock.assert_called_once_with(body)
+
+
+def test_operator_request_hash_once(operator):
+    channel = Mock()
+
+    with (
+        patch.object(operator, 'request_echo', RequestEcho.HASH),
+        patch.object(operator, 'execute', Mock(return_value=[{'a': 1}, {'a': 2}, {'a': 3}])),
+        patch('yarrow.operator.hashlib.sha256', wraps=hashlib.sha256) as sha256_mock,
+    ):
+        operator(channel, Mock(), Mock(reply_to='a'), b'{"a": 3}')
+
+    assert channel.basic_publish.call_count == 4
+    sha256_mock.assert_called_once_with(b'{"a": 3}')
+
+
+@pytest.mark.parametrize('request_echo, requests', [
+    (RequestEcho.ALL, [b'{"a":3}', b'{"a":3}', b'{"a":3}']),
+    (RequestEcho.FIRST, [b'{"a":3}', b'null', b'null']),
+    (RequestEcho.LAST, [b'null', b'null', b'{"a":3}']),
+    (
+        RequestEcho.HASH,
+        [b'"sha256:' + hashlib.sha256(b'{"a": 3}').hexdigest().encode('utf-8') + b'"'] * 3,
+    ),
+    (RequestEcho.NONE, [b'null', b'null', b'null']),
+])
+def test_operator_request_echo(operator, request_echo, requests):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a')
+    body = b'{"a": 3}'
+
+    with (
+        patch.object(operator, 'request_echo', request_echo),
+        patch.object(operator, 'execute', Mock(return_value=[{'a': 1}, {'a': 2}])),
+    ):
+        operator(channel, method_frame, properties, body)
+
+    bodies = [call_.kwargs['body'] for call_ in channel.basic_publish.call_args_list]
+    assert [body_[len(b'{"request":'):].split(b',"result"')[0] for body_ in bodies] == requests
+
+
+def test_operator_request_echo_header(operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a', headers={'x-request-echo': 'first'})
+    body = b'{"a": 3}'
+
+    with patch.object(operator, 'execute', Mock(return_value=[{'a': 1}, {'a': 2}])):
+        operator(channel, method_frame, properties, body)
+
+    assert channel.basic_publish.call_args_list[0].kwargs['body'] == (
+        b'{"request":{"a":3},"result":{"a":1},"status":"PROCESSING","error":null,"num":0}'
+    )
+    assert channel.basic_publish.call_args_list[1].kwargs['body'] == (
+        b'{"request":null,"result":{"a":2},"status":"PROCESSING","error":null,"num":1}'
+    )
+    assert channel.basic_publish.call_args_list[2].kwargs['body'] == (
+        b'{"request":null,"result":null,"status":"DONE","error":null,"num":2}'
+    )
+
+
+def test_operator_request_echo_header_error(operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a', headers={'x-request-echo': 'wrong'})
+    body = b'{"a": 3}'
+
+    operator(channel, method_frame, properties, body)
+
+    channel.basic_publish.assert_called_once()
+    assert channel.basic_publish.call_args.kwargs['body'].startswith(
+        b'{"request":{"a":3},"result":null,"status":"ERROR"'
+    )
+
+
+def test_chunk_max_items():
+    chunk = Chunk(max_items=2)
+
+    assert chunk.add(b'1') is False
+    assert chunk.add(b'2') is True
+    assert chunk.pop() == [b'1', b'2']
+    assert chunk.items == []
+
+
+def test_chunk_max_bytes():
+    chunk = Chunk(max_bytes=10)
+
+    assert chunk.add(b'{"a":1}') is False
+    assert chunk.add(b'{"a":2}') is True
+    assert chunk.pop() == [b'{"a":1}', b'{"a":2}']
+    assert chunk.size == 0
+
+
+@patch('yarrow.operator.time.monotonic', side_effect=[10.0, 10.2, 10.5, 11.0])
+def test_chunk_max_interval(monotonic_mock):
+    chunk = Chunk(max_interval=1.0)
+
+    assert chunk.add(b'1') is False
+    assert chunk.add(b'2') is False
+    assert chunk.add(b'3') is True
+    assert chunk.pop() == [b'1', b'2', b'3']
+    assert monotonic_mock.call_count == 4
+
+
+def test_operator_chunked(operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a')
+    body = b'{"a": 3}'
+
+    assert operator.is_chunked() is False
+
+    with (
+        patch.object(operator, 'chunk_size', 2),
+        patch.object(operator, 'execute', Mock(return_value=[{'a': 1}, {'a': 2}, {'a': 3}, {'a': 4}, {'a': 5}])),
+    ):
+        assert operator.is_chunked() is True
+        operator(channel, method_frame, properties, body)
+
+    assert [call_.kwargs['body'] for call_ in channel.basic_publish.call_args_list] == [
+        b'{"request":{"a":3},"result":[{"a":1},{"a":2}],"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":3},"result":[{"a":3},{"a":4}],"status":"PROCESSING","error":null,"num":1}',
+        b'{"request":{"a":3},"result":[{"a":5}],"status":"PROCESSING","error":null,"num":2}',
+        b'{"request":{"a":3},"result":null,"status":"DONE","error":null,"num":3}',
+    ]
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+
+
+def test_operator_chunked_empty(operator):
+    channel = Mock()
+    properties = Mock(reply_to='a')
+
+    with (
+        patch.object(operator, 'chunk_size', 2),
+        patch.object(operator, 'execute', Mock(return_value=[])),
+    ):
+        operator(channel, Mock(), properties, b'{"a": 3}')
+
+    channel.basic_publish.assert_called_once()
+    assert channel.basic_publish.call_args.kwargs['body'] == (
+        b'{"request":{"a":3},"result":null,"status":"DONE","error":null,"num":0}'
+    )
+
+
+def test_operator_msgpack(operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id', content_type='application/msgpack')
+
+    operator(channel, method_frame, properties, msgpack.packb({'a': 3}))
+
+    assert [msgpack.unpackb(call_.kwargs['body']) for call_ in channel.basic_publish.call_args_list] == [
+        {'request': {'a': 3}, 'result': {'a': 300}, 'status': 'PROCESSING', 'error': None, 'num': 0},
+        {'request': {'a': 3}, 'result': None, 'status': 'DONE', 'error': None, 'num': 1},
+    ]
+    assert channel.basic_publish.call_args.kwargs['properties'].content_type == 'application/msgpack'
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+
+
+def test_operator_reply_content_type_header(operator):
+    channel = Mock()
+    properties = pika.BasicProperties(
+        reply_to='a',
+        correlation_id='id',
+        headers={'x-reply-content-type': 'application/cbor'},
+    )
+
+    with patch.object(operator, 'chunk_size', 2):
+        operator(channel, Mock(), properties, b'{"a": 3}')
+
+    assert [cbor2.loads(call_.kwargs['body']) for call_ in channel.basic_publish.call_args_list] == [
+        {'request': {'a': 3}, 'result': [{'a': 300}], 'status': 'PROCESSING', 'error': None, 'num': 0},
+        {'request': {'a': 3}, 'result': None, 'status': 'DONE', 'error': None, 'num': 1},
+    ]
+    assert channel.basic_publish.call_args.kwargs['properties'].content_type == 'application/cbor'
+
+
+def test_operator_msgpack_request_json_reply(operator):
+    channel = Mock()
+    properties = pika.BasicProperties(
+        reply_to='a',
+        correlation_id='id',
+        content_type='application/x-msgpack',
+        headers={'x-reply-content-type': 'application/json'},
+    )
+
+    operator(channel, Mock(), properties, msgpack.packb({'a': 3}))
+
+    assert channel.basic_publish.call_args_list[0].kwargs['body'] == (
+        b'{"request":{"a":3},"result":{"a":300},"status":"PROCESSING","error":null,"num":0}'
+    )
+    assert channel.basic_publish.call_args.kwargs['properties'].content_type is None
+
+
+def test_operator_msgpack_malformed(operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id', content_type='application/msgpack')
+
+    operator(channel, Mock(), properties, b'\x92\x01')
+
+    channel.basic_publish.assert_called_once()
+    answer = msgpack.unpackb(channel.basic_publish.call_args.kwargs['body'])
+    assert answer['request'] == '\x92\x01'.encode('latin-1').decode('utf-8', 'replace')
+    assert answer['status'] == 'ERROR'
+
+
+def test_operator_format_not_installed(operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id', content_type='application/msgpack')
+
+    with patch('yarrow.operator.get_format', side_effect=[get_format(None), ImportError('No module named msgpack')]):
+        operator(channel, Mock(), properties, b'{"a": 3}')
+
+    channel.basic_publish.assert_called_once()
+    assert channel.basic_publish.call_args.kwargs['body'] == (
+        b'{"request":{"a":3},"result":null,"status":"ERROR","error":"No module named msgpack","num":0}'
+    )
+
+
+@pytest.mark.parametrize('encoding', list(ContentEncoding))
+def test_operator_compressed_request(operator, encoding):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id', content_encoding=encoding.value)
+
+    operator(channel, Mock(), properties, compress(b'{"a": 3}', encoding))
+
+    assert [call_.kwargs['body'] for call_ in channel.basic_publish.call_args_list] == [
+        b'{"request":{"a":3},"result":{"a":300},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":3},"result":null,"status":"DONE","error":null,"num":1}',
+    ]
+
+
+def test_operator_unsupported_content_encoding(operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id', content_encoding='br')
+
+    operator(channel, Mock(), properties, b'{"a": 3}')
+
+    channel.basic_publish.assert_called_once()
+    assert channel.basic_publish.call_args.kwargs['body'].endswith(
+        b'"status":"ERROR","error":"Unsupported content encoding br","num":0}'
+    )
+
+
+def test_operator_compressed_answers(operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id')
+
+    with patch.object(operator, 'compress_min_size', 75):
+        operator(channel, Mock(), properties, b'{"a": 3}')
+
+    first, last = channel.basic_publish.call_args_list
+    assert first.kwargs['properties'].content_encoding == 'gzip'
+    assert gzip.decompress(first.kwargs['body']) == (
+        b'{"request":{"a":3},"result":{"a":300},"status":"PROCESSING","error":null,"num":0}'
+    )
+    assert last.kwargs['properties'].content_encoding is None
+    assert last.kwargs['body'] == b'{"request":{"a":3},"result":null,"status":"DONE","error":null,"num":1}'
+
+
+@pytest.fixture
+def flow_control():
+    with (
+        patch.object(FLOW_CONTROL, 'queue', '__credits__.test'),
+        patch.object(FLOW_CONTROL, 'executor', lambda task: task()),
+        patch.object(FLOW_CONTROL, 'channel', Mock()),
+    ):
+        yield FLOW_CONTROL
+    FLOW_CONTROL.windows.clear()
+
+
+def test_operator_stream_credits(operator, flow_control):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='credits', headers={'x-credit': 2})
+    grant = partial(flow_control.on_grant, Mock(), Mock(), pika.BasicProperties(correlation_id='credits'))
+
+    with patch.object(operator, 'run', lambda input_: (operator.output(a=i) for i in range(5))):
+        operator(channel, Mock(delivery_tag=1), properties, b'{"a": 3}')
+
+        assert channel.basic_publish.call_count == 2
+        assert channel.basic_publish.call_args.kwargs['properties'].headers == {'x-credit-queue': '__credits__.test'}
+        channel.basic_ack.assert_not_called()
+
+        grant(b'1')
+        assert channel.basic_publish.call_count == 3
+        channel.basic_ack.assert_not_called()
+
+        grant(b'10')
+
+    assert [from_json(args.kwargs['body'])['num'] for args in channel.basic_publish.call_args_list] == [
+        0, 1, 2, 3, 4, 5,
+    ]
+    assert from_json(channel.basic_publish.call_args.kwargs['body'])['status'] == 'DONE'
+    channel.basic_ack.assert_called_once_with(1)
+    assert not flow_control.windows
+
+
+def test_operator_stream_credits_error(operator, flow_control):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='credits', headers={'x-credit': 0})
+
+    def run(input_):
+        raise ValueError('failed')
+        yield  # pylint: disable=unreachable
+
+    with patch.object(operator, 'run', run):
+        operator(channel, Mock(delivery_tag=1), properties, b'{"a": 3}')
+
+    assert from_json(channel.basic_publish.call_args.kwargs['body'])['status'] == 'ERROR'
+    channel.basic_ack.assert_called_once_with(1)
+    assert not flow_control.windows
+
+
+def test_operator_stream_credits_exact(operator, flow_control):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='credits', headers={'x-credit': 2})
+
+    with patch.object(operator, 'run', lambda input_: (operator.output(a=i) for i in range(2))):
+        operator(channel, Mock(delivery_tag=1), properties, b'{"a": 3}')
+
+    assert [from_json(args.kwargs['body'])['status'] for args in channel.basic_publish.call_args_list] == [
+        'PROCESSING', 'PROCESSING', 'DONE',
+    ]
+    channel.basic_ack.assert_called_once_with(1)
+    assert not flow_control.windows
+
+
+def test_operator_stream_credits_expired(operator, flow_control):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='credits', headers={'x-credit': 1})
+    taken = []
+
+    def run(input_):
+        for i in range(5):
+            taken.append(i)
+            yield operator.output(a=i)
+
+    with patch.object(operator, 'run', run), patch.object(flow_control, 'idle_timeout', 0.0):
+        operator(channel, Mock(delivery_tag=1), properties, b'{"a": 3}')
+        assert taken == [0, 1]
+
+        flow_control.expire()
+
+    answers = [from_json(args.kwargs['body']) for args in channel.basic_publish.call_args_list]
+    assert [answer['status'] for answer in answers] == ['PROCESSING', 'ERROR']
+    assert 'paused too long' in answers[-1]['error']
+    channel.basic_ack.assert_called_once_with(1)
+    assert not flow_control.windows
+
+
+def test_operator_stream_credits_not_started(operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='credits', headers={'x-credit': 0})
+
+    operator(channel, Mock(delivery_tag=1), properties, b'{"a": 3}')
+
+    assert channel.basic_publish.call_count == 2
+    assert channel.basic_publish.call_args.kwargs['properties'].headers is None
+
+
+@pytest.fixture
+def checkpoints():
+    store = Mock(spec=CheckpointStore)
+    store.get.return_value = None
+    with patch.object(CHECKPOINTS, 'store', store):
+        yield store
+
+
+@pytest.fixture
+def resumable_operator(operator):
+    def resume(input_, offset):
+        return (operator.output(a=i) for i in range(offset, input_.a))
+
+    with (
+        patch.object(operator, 'run', lambda input_: resume(input_, 0)),
+        patch.object(operator, 'resume', resume, create=True),
+        patch.object(operator, 'checkpoint_interval', 0.0),
+    ):
+        yield operator
+
+
+def published(channel):
+    return [(from_json(call_.kwargs['body'])['result'], from_json(call_.kwargs['body'])['num'])
+            for call_ in channel.basic_publish.call_args_list]
+
+
+def test_operator_checkpoints(resumable_operator, checkpoints):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id')
+
+    assert resumable_operator.is_resumable() is True
+    resumable_operator(channel, Mock(delivery_tag=1, redelivered=False), properties, b'{"a": 3}')
+
+    checkpoints.get.assert_not_called()
+    assert checkpoints.set.call_args_list == [
+        call('TestOperator:id', Checkpoint(1, 1)),
+        call('TestOperator:id', Checkpoint(2, 2)),
+        call('TestOperator:id', Checkpoint(3, 3)),
+    ]
+    checkpoints.delete.assert_called_once_with('TestOperator:id')
+    assert published(channel) == [({'a': 0}, 0), ({'a': 1}, 1), ({'a': 2}, 2), (None, 3)]
+    channel.basic_ack.assert_called_once_with(1)
+
+
+def test_operator_resume(resumable_operator, checkpoints):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id')
+    checkpoints.get.return_value = Checkpoint(3, 2)
+
+    with patch.object(resumable_operator, 'execute') as execute_mock:
+        resumable_operator(channel, Mock(delivery_tag=1, redelivered=True), properties, b'{"a": 5}')
+
+    execute_mock.assert_not_called()
+    checkpoints.get.assert_called_once_with('TestOperator:id')
+    assert published(channel) == [({'a': 3}, 2), ({'a': 4}, 3), (None, 4)]
+    checkpoints.delete.assert_called_once_with('TestOperator:id')
+    channel.basic_ack.assert_called_once_with(1)
+
+
+def test_operator_checkpoints_chunked(resumable_operator, checkpoints):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='id')
+
+    with patch.object(resumable_operator, 'chunk_size', 2):
+        resumable_operator(channel, Mock(delivery_tag=1), properties, b'{"a": 5}')
+
+        assert checkpoints.set.call_args_list == [
+            call('TestOperator:id', Checkpoint(2, 1)),
+            call('TestOperator:id', Checkpoint(4, 2)),
+        ]
+
+        channel = Mock()
+        checkpoints.get.return_value = Checkpoint(4, 2)
+        resumable_operator(channel, Mock(delivery_tag=2, redelivered=True), properties, b'{"a": 5}')
+
+    assert published(channel) == [([{'a': 4}], 2), (None, 3)]
+
+
+def test_operator_checkpoints_interval(resumable_operator, checkpoints):
+    with patch.object(resumable_operator, 'checkpoint_interval', 10.0):
+        resumable_operator(Mock(), Mock(), pika.BasicProperties(reply_to='a', correlation_id='id'), b'{"a": 3}')
+
+    checkpoints.set.assert_not_called()
+    checkpoints.delete.assert_called_once_with('TestOperator:id')
+
+
+def test_operator_checkpoints_local_hops(resumable_operator, repeat_operator, checkpoints):
+    channel = Mock()
+
+    resumable_operator(channel, Mock(), pika.BasicProperties(reply_to='repeat>a', correlation_id='id'), b'{"a": 3}')
+
+    assert channel.basic_publish.call_count == 7
+    checkpoints.get.assert_not_called()
+    checkpoints.set.assert_not_called()
+    checkpoints.delete.assert_not_called()
+
+
+def test_operator_not_resumable(operator, checkpoints):
+    operator(Mock(), Mock(), pika.BasicProperties(reply_to='a', correlation_id='id'), b'{"a": 3}')
+
+    assert operator.is_resumable() is False
+    checkpoints.get.assert_not_called()
+    checkpoints.delete.assert_not_called()
+
+
+@pytest.fixture
+def batch_operator(model):
+    class TestBatchOperator(BatchOperator):
+        input = model
+        output = model
+
+        @classmethod
+        def run(cls, input_: list[model]):  # type: ignore
+            for item in input_:
+                yield model(a=item.a * 100)  # type: ignore
+
+    return TestBatchOperator
+
+
+def batch_messages(channel, *bodies):
+    return [
+        (channel, Mock(delivery_tag=index), pika.BasicProperties(reply_to='a', correlation_id=str(index)), body)
+        for index, body in enumerate(bodies)
+    ]
+
+
+def test_batch_operator_consume_batch(batch_operator):
+    channel = Mock()
+    messages = batch_messages(channel, b'{"a": 1}', b'{"a": 2}')
+
+    with patch.object(batch_operator, 'run', wraps=batch_operator.run) as run_mock:
+        batch_operator.consume_batch(messages)
+
+    run_mock.assert_called_once()
+    assert [item.a for item in run_mock.call_args.args[0]] == [1, 2]
+    assert [call_.kwargs['body'] for call_ in channel.basic_publish.call_args_list] == [
+        b'{"request":{"a":1},"result":{"a":100},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":2},"result":{"a":200},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":1},"result":null,"status":"DONE","error":null,"num":1}',
+        b'{"request":{"a":2},"result":null,"status":"DONE","error":null,"num":1}',
+    ]
+    assert channel.basic_ack.call_args_list == [call(0), call(1)]
+
+
+def test_batch_operator_consume_batch_local_hop(batch_operator, repeat_operator):
+    channel = Mock()
+    properties = pika.BasicProperties(reply_to='repeat>out', correlation_id='0')
+    messages = [(channel, Mock(delivery_tag=0), properties, b'{"a": 1}')]
+
+    batch_operator.consume_batch(messages)
+
+    assert [call_.kwargs['body'] for call_ in channel.basic_publish.call_args_list] == [
+        b'{"request":{"a":1},"result":{"a":101},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":1},"result":{"a":102},"status":"PROCESSING","error":null,"num":1}',
+        b'{"request":{"a":1},"result":null,"status":"DONE","error":null,"num":2}',
+    ]
+
+
+def test_batch_operator_consume_batch_invalid_request(batch_operator):
+    channel = Mock()
+    messages = batch_messages(channel, b'{"a": 1}', b'{"b": 2}')
+
+    with patch.object(batch_operator, 'run', wraps=batch_operator.run) as run_mock:
+        batch_operator.consume_batch(messages)
+
+    assert [item.a for item in run_mock.call_args.args[0]] == [1]
+    statuses = [from_json(call_.kwargs['body'])['status'] for call_ in channel.basic_publish.call_args_list]
+    assert statuses == ['PROCESSING', 'DONE', 'ERROR']
+    assert channel.basic_ack.call_args_list == [call(0), call(1)]
+
+
+def test_batch_operator_consume_batch_all_invalid(batch_operator):
+    channel = Mock()
+
+    with patch.object(batch_operator, 'run') as run_mock:
+        batch_operator.consume_batch(batch_messages(channel, b'{"b": 1}'))
+
+    run_mock.assert_not_called()
+    assert from_json(channel.basic_publish.call_args.kwargs['body'])['status'] == 'ERROR'
+    channel.basic_ack.assert_called_once_with(0)
+
+
+def test_batch_operator_consume_batch_error(batch_operator):
+    channel = Mock()
+
+    with patch.object(batch_operator, 'run', Mock(return_value=[{'a': 1}])):
+        batch_operator.consume_batch(batch_messages(channel, b'{"a": 1}', b'{"a": 2}'))
+
+    answers = [from_json(call_.kwargs['body']) for call_ in channel.basic_publish.call_args_list]
+    assert [answer['status'] for answer in answers] == ['ERROR', 'ERROR']
+    assert answers[0]['error'] == f'Batch operator {batch_operator} returned 1 outputs for 2 inputs'
+    assert channel.basic_ack.call_args_list == [call(0), call(1)]
+
+
+def test_batch_operator_consume_batch_publish_error(batch_operator):
+    channel = Mock()
+    failing_channel = Mock(basic_publish=Mock(side_effect=[RuntimeError('publish failed'), None]))
+    messages = batch_messages(channel, b'{"a": 1}') + [
+        (failing_channel, Mock(delivery_tag=1), pika.BasicProperties(reply_to='a', correlation_id='1'), b'{"a": 2}'),
+    ]
+
+    batch_operator.consume_batch(messages)
+
+    answers = [from_json(call_.kwargs['body']) for call_ in channel.basic_publish.call_args_list]
+    assert [answer['status'] for answer in answers] == ['PROCESSING', 'DONE']
+    answer = from_json(failing_channel.basic_publish.call_args.kwargs['body'])
+    assert (answer['status'], answer['error']) == ('ERROR', 'publish failed')
+    channel.basic_ack.assert_called_once_with(0)
+    failing_channel.basic_ack.assert_called_once_with(1)
+
+
+def test_batch_operator_call(batch_operator):
+    assert list(batch_operator.call(a=3)) == [{'a': 300}]
+
+
+def test_batch_operator_init(batch_operator):
+    channel = Mock()
+    method_frame = Mock()
+
+    batch_operator(channel, method_frame, Mock(reply_to='a'), b'{"a": 3}')
+
+    assert channel.basic_publish.call_count == 2
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+
+
+def test_batch_operator_not_resumable(batch_operator, checkpoints):
+    with patch.object(batch_operator, 'resume', Mock(), create=True):
+        batch_operator.consume_batch(batch_messages(Mock(), b'{"a": 3}'))
+
+        assert batch_operator.is_resumable() is False
+    checkpoints.get.assert_not_called()
+
+
+def test_batch_operator_execute_batch_is_abstract(model):
+    class_ = type('class_', (BatchOperator,), {'input': model})
+
+    with pytest.raises(ValueError):
+        class_.execute_batch([model(a=1)])
+
+
+def test_batch_operator_execute_batch_async(batch_operator, model):
+    async def run(_):
+        yield model(a=1)
+
+    with patch.object(batch_operator, 'run', run), pytest.raises(ValueError):
+        batch_operator.execute_batch([model(a=1)])
@@ -0,0 +1,28 @@
+from unittest.mock import patch
+
+from yarrow.reconnect import Backoff
+
+
+def test_backoff():
+    backoff = Backoff(1.0, 5.0, 5)
+
+    with patch('yarrow.reconnect.random.uniform', side_effect=lambda low, high: high) as uniform_mock:
+        assert [backoff.next_delay() for _ in range(6)] == [1.0, 2.0, 4.0, 5.0, 5.0, None]
+
+        backoff.reset()
+        assert backoff.next_delay() == 1.0
+
+    uniform_mock.assert_called_with(0, 1.0)
+
+
+def test_backoff_jitter():
+    backoff = Backoff(1.0, 5.0, 100)
+
+    delays = [backoff.next_delay() for _ in range(100)]
+
+    assert all(0 <= delay <= 5.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_backoff_no_attempts():
+    assert Backoff(1.0, 5.0, 0).next_delay() is None
@@ -0,0 +1,391 @@
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from unittest.mock import Mock, call, patch
+
+import pika
+import pytest
+from pika.spec import Basic
+
+from example.example import BatchSum, Sequence, Sum
+from yarrow.checkpoint import CHECKPOINTS, Checkpoint
+from yarrow.models import ExecutionMode
+from yarrow.workers import (
+    BatchCollector, Delivery, DeliveryChannel, InFlightLimit, RecordingChannel, ThreadSafeChannel, WorkerPool,
+    run_batch_in_process, run_in_process, run_in_thread,
+)
+
+
+@pytest.fixture
+def connection():
+    return Mock(add_callback_threadsafe=Mock(side_effect=lambda callback: callback()))
+
+
+def test_thread_safe_channel():
+    connection = Mock()
+    channel = Mock()
+
+    thread_safe_channel = ThreadSafeChannel(connection, channel)
+    thread_safe_channel.basic_ack(123)
+
+    channel.basic_ack.assert_not_called()
+    connection.add_callback_threadsafe.assert_called_once()
+
+    connection.add_callback_threadsafe.call_args.args[0]()
+    channel.basic_ack.assert_called_once_with(123)
+
+
+def test_delivery_channel():
+    class AckCounter(DeliveryChannel):
+        acks = 0
+
+        def basic_ack(self, delivery_tag):
+            self.acks += 1
+            self.channel.basic_ack(delivery_tag)
+
+    channel = Mock()
+    delivery_channel = AckCounter(channel)
+
+    delivery_channel.basic_ack(1)
+    delivery_channel.queue_declare('a')
+    action = Mock()
+    delivery_channel.checkpoint(action)
+
+    assert delivery_channel.acks == 1
+    action.assert_called_once_with()
+    channel.basic_ack.assert_called_once_with(1)
+    channel.queue_declare.assert_called_once_with('a')
+
+
+def test_recording_channel():
+    channel = RecordingChannel()
+
+    channel.basic_publish('', routing_key='a', body=b'b')
+    channel.basic_ack(1)
+
+    assert channel.calls == [
+        ('basic_publish', ('',), {'routing_key': 'a', 'body': b'b'}),
+        ('basic_ack', (1,), {}),
+    ]
+
+
+def test_run_in_thread(operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a')
+
+    assert run_in_thread(channel, operator, method_frame, properties, b'{"a": 3}') == [[]]
+
+    assert channel.basic_publish.call_count == 2
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+
+
+def test_run_in_process(operator):
+    method_frame = Basic.Deliver(delivery_tag=7)
+    properties = pika.BasicProperties(reply_to='a', correlation_id='b')
+
+    [calls] = run_in_process(operator, method_frame, properties, b'{"a": 3}')
+
+    assert [name for name, _, _ in calls] == ['basic_publish', 'basic_publish', 'basic_ack']
+    assert calls[-1] == ('basic_ack', (7,), {})
+
+
+def test_run_batch_in_process():
+    properties = pika.BasicProperties(reply_to='a', correlation_id='b')
+    messages = [
+        (None, Basic.Deliver(delivery_tag=1), properties, b'{"a": 1, "b": 2}'),
+        (None, Basic.Deliver(delivery_tag=2), properties, b'{"a": 3, "b": 4}'),
+    ]
+
+    calls = run_batch_in_process(BatchSum.consume_batch, messages)
+
+    assert [[name for name, _, _ in channel_calls] for channel_calls in calls] == [
+        ['basic_publish', 'basic_publish', 'basic_ack'],
+        ['basic_publish', 'basic_publish', 'basic_ack'],
+    ]
+    assert [channel_calls[-1] for channel_calls in calls] == [('basic_ack', (1,), {}), ('basic_ack', (2,), {})]
+
+
+def test_worker_pool_sync_mode():
+    with pytest.raises(ValueError):
+        WorkerPool(Mock(), ExecutionMode.SYNC)
+
+
+def test_worker_pool_thread(connection, operator):
+    channel = Mock()
+    method_frame = Mock()
+    properties = Mock(reply_to='a')
+
+    pool = WorkerPool(connection, ExecutionMode.THREAD, 2)
+    assert isinstance(pool.executor, ThreadPoolExecutor)
+
+    pool.consumer(operator)(channel, method_frame, properties, b'{"a": 3}')
+    pool.executor.shutdown(wait=True)
+
+    assert channel.basic_publish.call_count == 2
+    channel.basic_ack.assert_called_once_with(method_frame.delivery_tag)
+    channel.basic_nack.assert_not_called()
+
+
+def test_worker_pool_process(connection):
+    channel = Mock()
+    method_frame = Basic.Deliver(delivery_tag=7)
+    properties = pika.BasicProperties(reply_to='a', correlation_id='b')
+
+    pool = WorkerPool(connection, ExecutionMode.PROCESS, 1)
+    assert isinstance(pool.executor, ProcessPoolExecutor)
+
+    pool.consumer(Sum)(channel, method_frame, properties, b'{"a": 3, "b": 4}')
+    pool.executor.shutdown(wait=True)
+
+    channel.basic_publish.assert_has_calls([
+        call(
+            '',
+            routing_key='a',
+            body=b'{"request":{"a":3,"b":4},"result":{"c":7},"status":"PROCESSING","error":null,"num":0}',
+            properties=pika.BasicProperties(correlation_id='b'),
+        ),
+        call(
+            '',
+            routing_key='a',
+            body=b'{"request":{"a":3,"b":4},"result":null,"status":"DONE","error":null,"num":1}',
+            properties=pika.BasicProperties(correlation_id='b'),
+        ),
+    ])
+    channel.basic_ack.assert_called_once_with(7)
+
+
+def test_worker_pool_thread_checkpoints():
+    callbacks = []
+    connection = Mock(add_callback_threadsafe=Mock(side_effect=callbacks.append))
+    events = Mock()
+    properties = pika.BasicProperties(reply_to='a', correlation_id='b')
+
+    pool = WorkerPool(connection, ExecutionMode.THREAD, 1)
+    with patch.object(CHECKPOINTS, 'store', events.store), patch.object(Sequence, 'checkpoint_interval', 0.0):
+        pool.submit(Sequence, Delivery(events.channel, Basic.Deliver(delivery_tag=1), properties, b'{"a": 0, "b": 3}'))
+        pool.executor.shutdown(wait=True)
+
+        # Answers are still queued to the connection thread, so are the checkpoints.
+        events.store.set.assert_not_called()
+        while callbacks:
+            callbacks.pop(0)()
+
+    published = 0
+    for name, args, _ in events.mock_calls:
+        if name == 'channel.basic_publish':
+            published += 1
+        elif name == 'store.set':
+            assert args[1].num <= published
+    assert events.store.set.call_args_list == [call('Sequence:b', Checkpoint(offset, offset)) for offset in (1, 2, 3)]
+    assert [name for name, _, _ in events.mock_calls][-2:] == ['store.delete', 'channel.basic_ack']
+
+
+@pytest.mark.parametrize('redelivered, requeue', [(False, True), (True, False)])
+def test_worker_pool_failed(connection, redelivered, requeue):
+    channel = Mock()
+    method_frame = Mock(redelivered=redelivered)
+    future: Future = Future()
+    future.set_exception(RuntimeError('worker died'))
+
+    pool = WorkerPool(connection, ExecutionMode.THREAD)
+    with patch.object(pool, 'executor', Mock(submit=Mock(return_value=future))):
+        pool.submit(Mock(), Delivery(channel, method_frame, Mock(), b''))
+
+    channel.basic_nack.assert_called_once_with(method_frame.delivery_tag, requeue=requeue)
+
+
+def test_worker_pool_broken(connection):
+    pool = WorkerPool(connection, ExecutionMode.PROCESS)
+    broken_executor = Mock(submit=Mock(side_effect=BrokenExecutor))
+    pool.executor = broken_executor
+
+    with patch.object(pool, '_create_executor') as create_executor_mock:
+        pool.submit(Mock(), Delivery(Mock(), Mock(), Mock(), b''))
+
+    create_executor_mock.assert_called_once_with()
+    assert pool.executor is create_executor_mock.return_value
+    pool.executor.submit.assert_called_once()
+
+
+def test_worker_pool_shutdown(connection):
+    pool = WorkerPool(connection, ExecutionMode.THREAD)
+
+    with patch.object(pool, 'executor') as executor_mock:
+        pool.shutdown()
+
+    executor_mock.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+
+def test_in_flight_limit():
+    limit = InFlightLimit(2)
+    tasks = [Mock() for _ in range(4)]
+
+    for task in tasks:
+        limit.run(task)
+
+    tasks[0].assert_called_once_with()
+    tasks[1].assert_called_once_with()
+    tasks[2].assert_not_called()
+    tasks[3].assert_not_called()
+    assert limit.count == 2
+
+    limit.release()
+    tasks[2].assert_called_once_with()
+    tasks[3].assert_not_called()
+
+    limit.release()
+    limit.release()
+    limit.release()
+    tasks[3].assert_called_once_with()
+    assert limit.count == 0
+    assert not limit.pending
+
+
+def test_in_flight_limit_unlimited():
+    limit = InFlightLimit()
+    tasks = [Mock() for _ in range(10)]
+
+    for task in tasks:
+        limit.run(task)
+
+    for task in tasks:
+        task.assert_called_once_with()
+
+
+def test_worker_pool_max_in_flight(connection, operator):
+    channel = Mock()
+    pool = WorkerPool(connection, ExecutionMode.THREAD, 4)
+    futures = []
+
+    def submit(*_):
+        futures.append(Future())
+        return futures[-1]
+
+    with patch.object(pool, 'executor', Mock(submit=Mock(side_effect=submit))):
+        consumer = pool.consumer(operator, 1)
+        consumer(channel, Mock(), Mock(reply_to='a'), b'{"a": 1}')
+        consumer(channel, Mock(), Mock(reply_to='a'), b'{"a": 2}')
+
+        assert len(futures) == 1
+
+        futures[0].set_result([[('basic_ack', (1,), {})]])
+
+        assert len(futures) == 2
+        channel.basic_ack.assert_called_once_with(1)
+
+
+def test_batch_collector_max_size():
+    connection = Mock()
+    handler = Mock()
+    channel = Mock()
+    other_channel = Mock()
+    collector = BatchCollector(connection, handler, 2, 0.5)
+
+    collector(channel, 'frame1', 'properties1', b'1')
+    handler.assert_not_called()
+    connection.call_later.assert_called_once_with(0.5, collector._on_timer)
+
+    collector(other_channel, 'frame2', 'properties2', b'2')
+    handler.assert_called_once_with([
+        (channel, 'frame1', 'properties1', b'1'),
+        (other_channel, 'frame2', 'properties2', b'2'),
+    ])
+    connection.remove_timeout.assert_called_once_with(connection.call_later.return_value)
+    assert collector.timer is None
+    assert not collector.batch
+
+
+def test_batch_collector_max_wait():
+    connection = Mock()
+    handler = Mock()
+    channel = Mock()
+    collector = BatchCollector(connection, handler, 10, 0.5)
+
+    collector(channel, 'frame1', 'properties1', b'1')
+    collector(channel, 'frame2', 'properties2', b'2')
+    connection.call_later.assert_called_once()
+
+    connection.call_later.call_args.args[1]()
+
+    handler.assert_called_once_with([
+        (channel, 'frame1', 'properties1', b'1'),
+        (channel, 'frame2', 'properties2', b'2'),
+    ])
+    connection.remove_timeout.assert_not_called()
+    assert collector.timer is None
+
+
+def test_batch_collector_flush_empty():
+    handler = Mock()
+
+    BatchCollector(Mock(), handler, 10, 0.5).flush()
+
+    handler.assert_not_called()
+
+
+def test_worker_pool_batch_thread(connection):
+    channels = [Mock(), Mock()]
+    properties = pika.BasicProperties(reply_to='a', correlation_id='b')
+
+    pool = WorkerPool(connection, ExecutionMode.THREAD, 2)
+    consumer = pool.batch_consumer(BatchSum)
+    assert isinstance(consumer, BatchCollector)
+    assert consumer.max_size == BatchSum.max_batch_size
+
+    consumer(channels[0], Basic.Deliver(delivery_tag=1), properties, b'{"a": 1, "b": 2}')
+    consumer(channels[1], Basic.Deliver(delivery_tag=2), properties, b'{"a": 3, "b": 4}')
+    consumer.flush()
+    pool.executor.shutdown(wait=True)
+
+    for delivery_tag, channel in enumerate(channels, 1):
+        assert channel.basic_publish.call_count == 2
+        channel.basic_ack.assert_called_once_with(delivery_tag)
+
+
+def test_worker_pool_batch_process(connection):
+    channels = [Mock(), Mock()]
+    messages = [
+        (
+            channels[0],
+            Basic.Deliver(delivery_tag=1),
+            pika.BasicProperties(reply_to='a', correlation_id='b'),
+            b'{"a": 1, "b": 2}',
+        ),
+        (
+            channels[1],
+            Basic.Deliver(delivery_tag=2),
+            pika.BasicProperties(reply_to='a', correlation_id='c'),
+            b'{"a": 3, "b": 4}',
+        ),
+    ]
+
+    pool = WorkerPool(connection, ExecutionMode.PROCESS, 1)
+    pool.submit_batch(BatchSum, messages)
+    pool.executor.shutdown(wait=True)
+
+    assert [call_.kwargs['body'] for call_ in channels[0].basic_publish.call_args_list] == [
+        b'{"request":{"a":1,"b":2},"result":{"c":3},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":1,"b":2},"result":null,"status":"DONE","error":null,"num":1}',
+    ]
+    assert [call_.kwargs['body'] for call_ in channels[1].basic_publish.call_args_list] == [
+        b'{"request":{"a":3,"b":4},"result":{"c":7},"status":"PROCESSING","error":null,"num":0}',
+        b'{"request":{"a":3,"b":4},"result":null,"status":"DONE","error":null,"num":1}',
+    ]
+    channels[0].basic_ack.assert_called_once_with(1)
+    channels[1].basic_ack.assert_called_once_with(2)
+
+
+def test_worker_pool_batch_failed(connection):
+    channels = [Mock(), Mock()]
+    messages = [
+        (channels[0], Mock(delivery_tag=1, redelivered=False), Mock(), b''),
+        (channels[1], Mock(delivery_tag=2, redelivered=True), Mock(), b''),
+    ]
+    future: Future = Future()
+    future.set_exception(RuntimeError('worker died'))
+
+    pool = WorkerPool(connection, ExecutionMode.THREAD)
+    with patch.object(pool, 'executor', Mock(submit=Mock(return_value=future))):
+        pool.submit_batch(BatchSum, messages)
+
+    channels[0].basic_nack.assert_called_once_with(1, requeue=True)
+    channels[1].basic_nack.assert_called_once_with(2, requeue=False)
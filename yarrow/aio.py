@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractAsyncContextManager, nullcontext
+from functools import partial
+from typing import Any, Awaitable, Callable
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+from pika import BasicProperties
+from pika.spec import Basic
+
+from yarrow.main import INFO_QUEUE, get_info, load_operators, apply_settings
+from yarrow.settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+AsyncHandler = Callable[['AsyncChannel', Basic.Deliver, BasicProperties, bytes], Awaitable[None]]
+
+
+class AsyncChannel:
+    """
+    Adapter of aio-pika channel to pika channel methods, which are used by operators.
+    Calls are collected and executed in order by method flush.
+    """
+    def __init__(self, channel: AbstractChannel, message: AbstractIncomingMessage):
+        self.channel = channel
+        self.message = message
+        self.pending: list[Callable[[], Awaitable[Any]]] = []
+
+    def basic_publish(
+            self,
+            exchange: str,
+            routing_key: str,
+            body: bytes,
+            properties: BasicProperties | None = None,
+    ) -> None:
+        """
+        Publish message to exchange.
+        """
+        message = outgoing_message(body, properties or BasicProperties())
+        self.pending.append(partial(self._publish, exchange, routing_key, message))
+
+    def basic_ack(self, delivery_tag: int) -> None:
+        """
+        Acknowledge the message of this channel.
+        """
+        if delivery_tag != self.message.delivery_tag:
+            raise ValueError(f'Unknown delivery tag {delivery_tag}')
+        self.pending.append(self.message.ack)
+
+    def queue_declare(self, queue: str) -> None:
+        """
+        Declare queue.
+        """
+        self.pending.append(partial(self.channel.declare_queue, queue))
+
+    async def flush(self) -> None:
+        """
+        Execute collected calls one by one.
+        """
+        pending, self.pending = self.pending, []
+        for call in pending:
+            await call()
+
+    async def _publish(self, exchange_name: str, routing_key: str, message: aio_pika.Message) -> None:
+        exchange = (
+            await self.channel.get_exchange(exchange_name, ensure=False)
+            if exchange_name
+            else self.channel.default_exchange
+        )
+        await exchange.publish(message, routing_key=routing_key)
+
+
+def incoming_frames(message: AbstractIncomingMessage) -> tuple[Basic.Deliver, BasicProperties]:
+    """
+    Return pika method frame and properties of aio-pika message.
+    """
+    method_frame = Basic.Deliver(
+        consumer_tag=message.consumer_tag,
+        delivery_tag=message.delivery_tag,
+        redelivered=bool(message.redelivered),
+        exchange=message.exchange,
+        routing_key=message.routing_key,
+    )
+    properties = BasicProperties(
+        content_type=message.content_type,
+        content_encoding=message.content_encoding,
+        headers=message.headers or None,
+        priority=message.priority,
+        correlation_id=message.correlation_id,
+        reply_to=message.reply_to,
+        message_id=message.message_id,
+    )
+    return method_frame, properties
+
+
+def outgoing_message(body: bytes, properties: BasicProperties) -> aio_pika.Message:
+    """
+    Return aio-pika message with pika properties.
+    """
+    return aio_pika.Message(
+        body,
+        content_type=properties.content_type,
+        content_encoding=properties.content_encoding,
+        headers=None if properties.headers is None else dict(properties.headers),
+        priority=properties.priority,
+        correlation_id=properties.correlation_id,
+        reply_to=properties.reply_to,
+        message_id=properties.message_id,
+    )
+
+
+async def info(channel: AsyncChannel, method_frame: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+    """
+    Async version of get_info.
+    """
+    get_info(channel, method_frame, properties, body)  # type: ignore[arg-type]
+    await channel.flush()
+
+
+def consumer(
+        channel: AbstractChannel,
+        handler: AsyncHandler,
+        max_in_flight: int | None = None,
+) -> Callable[[AbstractIncomingMessage], Awaitable[None]]:
+    """
+    Return callback for queue.consume. Every message is processed in its own task by aio-pika,
+    not more than max_in_flight at the same time.
+    """
+    limit: AbstractAsyncContextManager = nullcontext() if max_in_flight is None else asyncio.Semaphore(max_in_flight)
+
+    async def on_message(message: AbstractIncomingMessage) -> None:
+        async with limit:
+            method_frame, properties = incoming_frames(message)
+            await handler(AsyncChannel(channel, message), method_frame, properties, message.body)
+
+    return on_message
+
+
+async def serve() -> None:
+    """
+    Main function of asyncio engine: serve operators on one event loop.
+    Synchronous operators are executed in the default executor, its size is WORKERS.
+    """
+    settings = Settings()
+    operator_configs, operator_pairs = load_operators(settings)
+
+    handlers: list[AsyncHandler] = []
+    for operator_name, operator_function in operator_pairs:
+        handler = getattr(operator_function, 'consume', None)
+        if handler is None:
+            raise ValueError(f'Operator {operator_name} is not subclass of Operator, it can not be served by asyncio')
+        handlers.append(handler)
+
+    apply_settings(settings)
+
+    if settings.WORKERS is not None:
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=settings.WORKERS, thread_name_prefix='yarrow')
+        )
+
+    connection = await aio_pika.connect(
+        host=settings.HOST,
+        port=settings.PORT,
+        virtualhost=settings.VIRTUAL_HOST,
+        login=settings.USERNAME,
+        password=settings.PASSWORD,
+    )
+    async with connection:
+        channel = await connection.channel()
+
+        info_queue = await channel.declare_queue(INFO_QUEUE)
+        await info_queue.consume(consumer(channel, info))
+
+        operators = zip(operator_pairs, handlers, operator_configs, strict=True)
+        for (operator_name, _), handler, operator_config in operators:
+            await channel.set_qos(prefetch_count=operator_config.prefetch_count)
+            queue = await channel.declare_queue(operator_name)
+            await queue.consume(
+                consumer(channel, handler, operator_config.max_in_flight),
+                arguments=None if operator_config.priority is None else {'x-priority': operator_config.priority},
+            )
+
+        await asyncio.Future()
@@ -0,0 +1,103 @@
+import hashlib
+import time
+from collections import OrderedDict
+from functools import cache
+from threading import Lock
+from typing import Callable, Iterator
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+
+from yarrow import metrics
+
+
+@cache
+def outputs_adapter(output: type[BaseModel]) -> TypeAdapter[list[BaseModel]]:
+    """
+    Return validator of serialized output sequence.
+    """
+    return TypeAdapter(list[output])  # type: ignore[valid-type]
+
+
+def operator_of(key: str) -> str:
+    """
+    Return name of the operator from the cache key.
+    """
+    return key.split(':', 1)[0]
+
+
+class ResultCache:
+    """
+    Base class of result caches. Keys are '<operator name>:<sha256 of the input in JSON>',
+    values are output sequences serialized to JSON list. Subclass it to keep results in a shared storage.
+    """
+    def get(self, key: str) -> bytes | None:
+        """
+        Return the value or None if there is no value.
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store the value.
+        """
+        raise NotImplementedError
+
+    def memoize(
+            self,
+            operator_name: str,
+            output: type[BaseModel],
+            input_: BaseModel,
+            execute: Callable[[], Iterator[BaseModel]],
+    ) -> Iterator[BaseModel]:
+        """
+        Yield the stored output sequence of the input, or the results of execute.
+        The sequence is stored only if execute yielded all results.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        key = f'{operator_name}:{hashlib.sha256(to_json(input_)).hexdigest()}'
+        value = self.get(key)
+        if value is not None:
+            metrics.CACHE_HITS.inc(operator_name)
+            yield from outputs_adapter(output).validate_json(value)
+            return
+
+        metrics.CACHE_MISSES.inc(operator_name)
+        outputs = []
+        for element in execute():
+            outputs.append(element)
+            yield element
+        self.set(key, to_json(outputs))
+
+
+class MemoryCache(ResultCache):
+    """
+    In-process cache, which keeps max_size last used values, every value expires after ttl seconds.
+    """
+    def __init__(self, max_size: int = 1024, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.values: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self.lock:
+            item = self.values.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.monotonic():
+                del self.values[key]
+                metrics.CACHE_EVICTIONS.inc(operator_of(key))
+                return None
+            self.values.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        expires = float('inf') if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            self.values[key] = (expires, value)
+            self.values.move_to_end(key)
+            while len(self.values) > self.max_size:
+                evicted, _ = self.values.popitem(last=False)
+                metrics.CACHE_EVICTIONS.inc(operator_of(evicted))
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+from pydantic_core import from_json, to_json
+
+
+class Checkpoint(NamedTuple):
+    """
+    Position of a stream: offset is the number of results of run, which are answered,
+    num is the number of the next answer.
+    """
+    offset: int
+    num: int
+
+
+class CheckpointStore:
+    """
+    Base class of stores of checkpoints. Keys are '<operator name>:<correlation_id>'.
+    Method get is called from worker threads, set and delete from the connection thread.
+    """
+    def get(self, key: str) -> Checkpoint | None:
+        """
+        Return the last checkpoint of the stream or None.
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, checkpoint: Checkpoint) -> None:
+        """
+        Store checkpoint of the stream.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """
+        Remove checkpoint of the finished stream.
+        """
+        raise NotImplementedError
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    Store of checkpoints in a directory, one JSON file per stream. Files are replaced atomically.
+    """
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        """
+        Return file of the checkpoint, correlation_id can be any string, so the key is hashed.
+        """
+        return self.directory / f'{hashlib.sha256(key.encode("utf-8")).hexdigest()}.json'
+
+    def get(self, key: str) -> Checkpoint | None:
+        try:
+            return Checkpoint(*from_json(self.path(key).read_bytes()))
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, checkpoint: Checkpoint) -> None:
+        path = self.path(key)
+        temporary = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        temporary.write_bytes(to_json(checkpoint))
+        temporary.replace(path)
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+
+class SqliteCheckpointStore(CheckpointStore):
+    """
+    Store of checkpoints in SQLite database.
+    """
+    def __init__(self, filename: Path | str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints '
+                '(key TEXT PRIMARY KEY, "offset" INTEGER NOT NULL, num INTEGER NOT NULL)'
+            )
+
+    def get(self, key: str) -> Checkpoint | None:
+        with self.lock:
+            row = self.connection.execute('SELECT "offset", num FROM checkpoints WHERE key = ?', (key,)).fetchone()
+        return None if row is None else Checkpoint(*row)
+
+    def set(self, key: str, checkpoint: Checkpoint) -> None:
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)', (key, *checkpoint))
+
+    def delete(self, key: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM checkpoints WHERE key = ?', (key,))
+
+
+def after_publish(channel: Any, action: Callable[[], None]) -> None:
+    """
+    Call action, when answers published by the channel so far reached the broker. Channels, which send answers later
+    (from worker threads) or wait for their confirms, postpone it by method checkpoint. Answers of other channels
+    are already sent. The method is looked up in the class, so proxies with __getattr__ do not get it by accident.
+    """
+    if hasattr(type(channel), 'checkpoint'):
+        channel.checkpoint(action)
+    else:
+        action()
+
+
+class Checkpoints:
+    # pylint: disable=too-few-public-methods
+    """
+    Checkpoints of streams of resumable operators: the position of a stream is stored every checkpoint_interval
+    seconds of the operator, a redelivered message continues the stream from the stored position.
+    """
+    def __init__(self) -> None:
+        self.store: CheckpointStore | None = None
+
+
+CHECKPOINTS = Checkpoints()
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+
+from yarrow import log, main
+from yarrow.settings import Settings
+
+
+def run(argv: list[str] | None = None) -> None:
+    """
+    Entry point of yarrow command.
+    """
+    parser = argparse.ArgumentParser(prog='yarrow', description='Serve operators from RabbitMQ queues.')
+    parser.add_argument(
+        '--asyncio',
+        action='store_true',
+        help='serve with asyncio engine, operators with async generator run are supported',
+    )
+    args = parser.parse_args(argv)
+    log.configure(Settings())
+
+    if args.asyncio:
+        from yarrow import aio  # pylint: disable=import-outside-toplevel
+
+        asyncio.run(aio.serve())
+    else:
+        main.serve()
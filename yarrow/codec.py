@@ -0,0 +1,234 @@
+import gzip
+import struct
+from typing import Any, Callable, Sequence
+
+from pydantic import BaseModel
+from pydantic_core import from_json, to_json
+
+from yarrow.models import ContentEncoding, JsonBackend
+
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+
+# Names of answer fields in the order of serialization.
+ANSWER_FIELDS = ('request', 'result', 'status', 'error', 'num')
+
+
+def dump_model_json(obj: Any) -> Any:
+    """
+    Return pydantic model as python object of JSON types for JSON libraries and binary formats,
+    which do not know pydantic. Fields are converted as by pydantic (Decimal to str, set to list...),
+    so all backends accept the same outputs.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode='json')
+    raise TypeError(f'Type {type(obj)} is not serializable')
+
+
+class JsonCodec:
+    # pylint: disable=too-few-public-methods
+    """
+    JSON serialization of results and requests. Validated output models are serialized directly,
+    without a dict in between. pydantic-core is the default backend, orjson is optional.
+    """
+    def __init__(self) -> None:
+        self.dumps: Callable[[Any], bytes] = to_json
+        self.loads: Callable[[bytes], Any] = from_json
+
+    def use(self, backend: JsonBackend) -> None:
+        """
+        Switch backend.
+        """
+        if backend is JsonBackend.ORJSON:
+            import orjson  # pylint: disable=import-outside-toplevel
+
+            self.dumps = lambda obj: orjson.dumps(obj, default=dump_model_json)  # pylint: disable=no-member
+            self.loads = orjson.loads  # pylint: disable=no-member
+        else:
+            self.dumps = to_json
+            self.loads = from_json
+
+
+CODEC = JsonCodec()
+
+
+class Format:
+    """
+    Format of message bodies. Answers are assembled from already serialized fields,
+    so every result is serialized only once.
+    """
+    content_type = JSON
+    # Exceptions of loads on malformed bodies.
+    decode_errors: tuple[type[Exception], ...] = (ValueError,)
+
+    def __init__(self) -> None:
+        self.keys = [self.dumps(name) for name in ANSWER_FIELDS]
+        self.null = self.dumps(None)
+
+    def dumps(self, obj: Any) -> bytes:
+        """
+        Serialize python object or pydantic model.
+        """
+        return CODEC.dumps(obj)
+
+    def loads(self, body: bytes) -> Any:
+        """
+        Deserialize body.
+        """
+        return CODEC.loads(body)
+
+    def validate(self, model: type[BaseModel], body: bytes) -> BaseModel:
+        """
+        Return body validated by model.
+        """
+        return model.model_validate_json(body)
+
+    def array(self, items: Sequence[bytes]) -> bytes:
+        """
+        Return list of serialized items.
+        """
+        return b'[' + b','.join(items) + b']'
+
+    def answer(self, values: Sequence[bytes]) -> bytes:
+        """
+        Return answer from serialized values of ANSWER_FIELDS.
+        """
+        return b'{' + b','.join(key + b':' + value for key, value in zip(self.keys, values)) + b'}'
+
+
+class BinaryFormat(Format):
+    """
+    Base class of binary formats: requests are deserialized before validation, models are dumped to JSON types.
+    """
+    def validate(self, model: type[BaseModel], body: bytes) -> BaseModel:
+        return model.model_validate(self.loads(body))
+
+
+class MsgpackFormat(BinaryFormat):
+    """
+    MessagePack format, it needs package msgpack.
+    """
+    content_type = MSGPACK
+
+    def __init__(self) -> None:
+        import msgpack  # pylint: disable=import-outside-toplevel
+
+        self.packb: Callable[..., bytes] = msgpack.packb
+        self.unpackb: Callable[[bytes], Any] = msgpack.unpackb
+        super().__init__()
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.packb(obj, default=dump_model_json)
+
+    def loads(self, body: bytes) -> Any:
+        return self.unpackb(body)
+
+    def array(self, items: Sequence[bytes]) -> bytes:
+        size = len(items)
+        if size < 16:
+            header = bytes((0x90 | size,))
+        elif size < 0x10000:
+            header = struct.pack('>BH', 0xdc, size)
+        else:
+            header = struct.pack('>BI', 0xdd, size)
+        return header + b''.join(items)
+
+    def answer(self, values: Sequence[bytes]) -> bytes:
+        return bytes((0x80 | len(values),)) + b''.join(key + value for key, value in zip(self.keys, values))
+
+
+def cbor_header(major_type: int, size: int) -> bytes:
+    """
+    Return CBOR header of an item with major type and size.
+    """
+    major_type <<= 5
+    if size < 24:
+        return bytes((major_type | size,))
+    if size < 0x100:
+        return struct.pack('>BB', major_type | 24, size)
+    if size < 0x10000:
+        return struct.pack('>BH', major_type | 25, size)
+    if size < 0x100000000:
+        return struct.pack('>BI', major_type | 26, size)
+    return struct.pack('>BQ', major_type | 27, size)
+
+
+class CborFormat(BinaryFormat):
+    """
+    CBOR format, it needs package cbor2.
+    """
+    content_type = CBOR
+
+    def __init__(self) -> None:
+        import cbor2  # pylint: disable=import-outside-toplevel
+
+        self.cbor_dumps: Callable[..., bytes] = cbor2.dumps
+        self.cbor_loads: Callable[[bytes], Any] = cbor2.loads
+        self.decode_errors = (ValueError, cbor2.CBORDecodeError)
+        super().__init__()
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.cbor_dumps(obj, default=lambda encoder, value: encoder.encode(dump_model_json(value)))
+
+    def loads(self, body: bytes) -> Any:
+        return self.cbor_loads(body)
+
+    def array(self, items: Sequence[bytes]) -> bytes:
+        return cbor_header(4, len(items)) + b''.join(items)
+
+    def answer(self, values: Sequence[bytes]) -> bytes:
+        return cbor_header(5, len(values)) + b''.join(key + value for key, value in zip(self.keys, values))
+
+
+# Formats by content type, they are created on the first use.
+FORMATS: dict[str, type[Format]] = {
+    JSON: Format,
+    MSGPACK: MsgpackFormat,
+    'application/x-msgpack': MsgpackFormat,
+    'application/vnd.msgpack': MsgpackFormat,
+    CBOR: CborFormat,
+}
+_FORMATS: dict[type[Format], Format] = {}
+
+
+def get_format(content_type: Any) -> Format:
+    """
+    Return format of the content type. Absent and unknown content types are JSON.
+    """
+    format_class = Format
+    if isinstance(content_type, str):
+        format_class = FORMATS.get(content_type.split(';', 1)[0].strip().lower(), Format)
+    format_ = _FORMATS.get(format_class)
+    if format_ is None:
+        format_ = _FORMATS[format_class] = format_class()
+    return format_
+
+
+def compress(body: bytes, encoding: ContentEncoding) -> bytes:
+    """
+    Return compressed body. Encoding zstd needs package zstandard.
+    """
+    if encoding is ContentEncoding.ZSTD:
+        import zstandard  # pylint: disable=import-outside-toplevel
+
+        return zstandard.compress(body)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def decompress(body: bytes, content_encoding: Any) -> bytes:
+    """
+    Return body decompressed according to content_encoding property. Absent and identity encodings are not changed.
+    """
+    if not isinstance(content_encoding, str) or content_encoding.lower() in ('', 'identity'):
+        return body
+    try:
+        encoding = ContentEncoding(content_encoding.lower())
+    except ValueError:
+        raise ValueError(f'Unsupported content encoding {content_encoding}') from None
+    if encoding is ContentEncoding.ZSTD:
+        import zstandard  # pylint: disable=import-outside-toplevel
+
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return gzip.decompress(body)
@@ -0,0 +1,133 @@
+import logging
+from functools import partial
+from typing import Any, Callable
+
+from pika import BlockingConnection
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.frame import Method
+from pika.spec import Basic
+
+from yarrow.checkpoint import after_publish
+from yarrow.workers import DeliveryChannel, OnMessageCallback
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConfirmedChannel(DeliveryChannel):
+    """
+    Channel of one delivery: replies are published with confirms,
+    acknowledgments of the delivery and checkpoints are postponed until the replies before them are confirmed.
+    """
+    def __init__(self, confirms: 'PublisherConfirms', channel: BlockingChannel):
+        super().__init__(channel)
+        self.confirms = confirms
+        self.unconfirmed = 0
+        self.confirmed = 0
+        self.nacked = False
+        self.delivery_tags: list[int] = []
+        self.checkpoints: list[tuple[int, Callable[[], None]]] = []
+
+    def basic_publish(self, *args: Any, **kwargs: Any) -> None:
+        """
+        Publish reply by the confirming channel.
+        """
+        self.confirms.publish(self, *args, **kwargs)
+
+    def basic_ack(self, delivery_tag: int) -> None:
+        """
+        Acknowledge the delivery after all its replies are confirmed.
+        """
+        self.delivery_tags.append(delivery_tag)
+        self.flush()
+
+    def checkpoint(self, action: Callable[[], None]) -> None:
+        """
+        Call action after all replies published so far are confirmed. After a rejected reply it is dropped:
+        the delivery is requeued and continues from the previous checkpoint.
+        """
+        if self.nacked:
+            return
+        if self.unconfirmed:
+            self.checkpoints.append((self.confirmed + self.unconfirmed, action))
+            return
+        after_publish(self.channel, action)
+
+    def confirm(self, acked: bool) -> None:
+        """
+        Register confirm of one reply.
+        """
+        self.unconfirmed -= 1
+        self.confirmed += 1
+        self.nacked = self.nacked or not acked
+        if self.nacked:
+            self.checkpoints.clear()
+        while self.checkpoints and self.checkpoints[0][0] <= self.confirmed:
+            after_publish(self.channel, self.checkpoints.pop(0)[1])
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Acknowledge deliveries, when there are no unconfirmed replies. If broker rejected a reply, they are requeued.
+        """
+        if self.unconfirmed:
+            return
+
+        delivery_tags, self.delivery_tags = self.delivery_tags, []
+        for delivery_tag in delivery_tags:
+            if self.nacked:
+                self.channel.basic_nack(delivery_tag, requeue=True)
+            else:
+                self.channel.basic_ack(delivery_tag)
+
+
+class PublisherConfirms:
+    """
+    Replies are published by a dedicated channel in confirm mode. Confirms are received asynchronously,
+    so a stream of replies is not blocked by a round-trip to broker for every message.
+    It is used only from the connection thread.
+    """
+    def __init__(self, connection: BlockingConnection, channel: BlockingChannel):
+        self.connection = connection
+        self.channel = channel
+        self.sequence = 0
+        self.unconfirmed: dict[int, ConfirmedChannel] = {}
+
+        # BlockingChannel.confirm_delivery makes every basic_publish wait for its confirm,
+        # so confirm mode is turned on by the underlying channel with own callback.
+        channel._impl.confirm_delivery(self._on_confirm)  # type: ignore[attr-defined]  # pylint: disable=protected-access
+
+    def consumer(self, callback: OnMessageCallback) -> OnMessageCallback:
+        """
+        Return callback for basic_consume, which gives every delivery its own ConfirmedChannel.
+        """
+        def on_message(channel: BlockingChannel, *args: Any) -> None:
+            callback(ConfirmedChannel(self, channel), *args)  # type: ignore[arg-type]
+
+        return on_message
+
+    def publish(self, confirmed_channel: ConfirmedChannel, *args: Any, **kwargs: Any) -> None:
+        """
+        Publish message and wait for its confirm in background.
+        """
+        self.channel.basic_publish(*args, **kwargs)
+        self.sequence += 1
+        self.unconfirmed[self.sequence] = confirmed_channel
+        confirmed_channel.unconfirmed += 1
+
+    def _on_confirm(self, frame: Method) -> None:
+        # Methods of blocking channels can not be called inside of callbacks of the underlying channel.
+        self.connection.add_callback_threadsafe(partial(self._settle, frame.method))
+
+    def _settle(self, confirm: Basic.Ack | Basic.Nack) -> None:
+        acked = isinstance(confirm, Basic.Ack)
+        if not acked:
+            logger.error('Broker rejected reply %s', confirm.delivery_tag)
+
+        if confirm.multiple:
+            sequences = [sequence for sequence in self.unconfirmed if sequence <= confirm.delivery_tag]
+        else:
+            sequences = [confirm.delivery_tag]
+
+        for sequence in sequences:
+            self.unconfirmed.pop(sequence).confirm(acked)
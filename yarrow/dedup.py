@@ -0,0 +1,224 @@
+import logging
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple
+
+from pika import BasicProperties
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.spec import Basic
+
+from yarrow import metrics
+from yarrow.workers import DeliveryChannel, OnMessageCallback
+
+
+logger = logging.getLogger(__name__)
+
+
+class Publication(NamedTuple):
+    # pylint: disable=missing-class-docstring
+    routing_key: str
+    body: bytes
+    reply_to: str | None = None
+    content_type: str | None = None
+    content_encoding: str | None = None
+
+
+class AnswerStore:
+    """
+    Base class of stores of published answers. Keys are '<operator name>:<correlation_id>'.
+    """
+    def get(self, key: str) -> list[Publication] | None:
+        """
+        Return answers of the message or None if it was not answered.
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, publications: list[Publication]) -> None:
+        """
+        Store answers of the message.
+        """
+        raise NotImplementedError
+
+
+class MemoryAnswerStore(AnswerStore):
+    """
+    In-process store of answers of max_size last messages.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.answers: OrderedDict[str, list[Publication]] = OrderedDict()
+
+    def get(self, key: str) -> list[Publication] | None:
+        return self.answers.get(key)
+
+    def set(self, key: str, publications: list[Publication]) -> None:
+        self.answers[key] = publications
+        self.answers.move_to_end(key)
+        while len(self.answers) > self.max_size:
+            self.answers.popitem(last=False)
+
+
+class SqliteAnswerStore(AnswerStore):
+    """
+    Store of answers of max_size last messages in SQLite database, it survives restarts of the process.
+    """
+    def __init__(self, filename: Path | str, max_size: int):
+        self.max_size = max_size
+        self.connection = sqlite3.connect(filename)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE NOT NULL)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS publications ('
+                'message_id INTEGER NOT NULL, routing_key TEXT NOT NULL, body BLOB NOT NULL, '
+                'reply_to TEXT, content_type TEXT, content_encoding TEXT)'
+            )
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS publications_message_id ON publications (message_id)'
+            )
+
+    def get(self, key: str) -> list[Publication] | None:
+        row = self.connection.execute('SELECT id FROM messages WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        rows = self.connection.execute(
+            'SELECT routing_key, body, reply_to, content_type, content_encoding FROM publications '
+            'WHERE message_id = ? ORDER BY rowid',
+            row,
+        )
+        return [Publication(*row) for row in rows]
+
+    def set(self, key: str, publications: list[Publication]) -> None:
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM publications WHERE message_id IN (SELECT id FROM messages WHERE key = ?)',
+                (key,),
+            )
+            self.connection.execute('DELETE FROM messages WHERE key = ?', (key,))
+            message_id = self.connection.execute('INSERT INTO messages (key) VALUES (?)', (key,)).lastrowid
+            self.connection.executemany(
+                'INSERT INTO publications VALUES (?, ?, ?, ?, ?, ?)',
+                [(message_id, *publication) for publication in publications],
+            )
+            # Ids grow, so messages with ids not greater than this one are older than the last max_size messages.
+            oldest = (message_id or 0) - self.max_size
+            self.connection.execute('DELETE FROM messages WHERE id <= ?', (oldest,))
+            self.connection.execute('DELETE FROM publications WHERE message_id <= ?', (oldest,))
+
+
+class DeduplicatedChannel(DeliveryChannel):
+    """
+    Channel of one delivery, which records published answers and stores them, when the delivery is acknowledged.
+    Answers are recorded by delivery tag, so copies of a message with the same correlation_id do not mix their answers.
+    """
+    def __init__(self, deduplication: 'Deduplication', delivery_tag: int, channel: BlockingChannel):
+        super().__init__(channel)
+        self.deduplication = deduplication
+        self.delivery_tag = delivery_tag
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties) -> None:
+        """
+        Record and publish the answer.
+        """
+        self.deduplication.pending.setdefault(self.delivery_tag, []).append(
+            Publication(routing_key, body, properties.reply_to, properties.content_type, properties.content_encoding)
+        )
+        self.channel.basic_publish(exchange, routing_key=routing_key, body=body, properties=properties)
+
+    def basic_ack(self, delivery_tag: int) -> None:
+        """
+        Store answers of the delivery and acknowledge it.
+        """
+        self.deduplication.store_answers(delivery_tag)
+        self.channel.basic_ack(delivery_tag)
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True) -> None:
+        """
+        Drop recorded answers of the delivery and reject it.
+        """
+        self.deduplication.forget(delivery_tag)
+        self.channel.basic_nack(delivery_tag, requeue=requeue)
+
+
+class Deduplication:
+    """
+    Deduplication of messages by operator name and correlation_id: answers of a message are stored, when it is
+    acknowledged, a message with the same correlation_id gets the stored answers without execution of the operator.
+    It is used only from the connection thread.
+    """
+    def __init__(self) -> None:
+        self.store: AnswerStore | None = None
+        self.pending: dict[int, list[Publication]] = {}
+        self.deliveries: dict[int, str] = {}
+
+    def consumer(self, operator_name: str, callback: OnMessageCallback) -> OnMessageCallback:
+        """
+        Return callback for basic_consume, which replays answers of duplicates and records answers of new messages.
+        """
+        def on_message(
+                channel: BlockingChannel, method_frame: Basic.Deliver, properties: BasicProperties, body: bytes,
+        ) -> None:
+            if properties.correlation_id is None or method_frame.delivery_tag is None or self.store is None:
+                callback(channel, method_frame, properties, body)
+                return
+
+            key = f'{operator_name}:{properties.correlation_id}'
+            publications = self.store.get(key)
+            if publications is None:
+                self.deliveries[method_frame.delivery_tag] = key
+                self.pending[method_frame.delivery_tag] = []
+                deduplicated_channel = DeduplicatedChannel(self, method_frame.delivery_tag, channel)
+                callback(deduplicated_channel, method_frame, properties, body)  # type: ignore[arg-type]
+                return
+
+            logger.info(
+                'Duplicate message of operator %s, correlation_id %s: replay %s answers',
+                operator_name,
+                properties.correlation_id,
+                len(publications),
+            )
+            metrics.DUPLICATES.inc(operator_name)
+            for publication in publications:
+                channel.basic_publish(
+                    '',
+                    routing_key=publication.routing_key,
+                    body=publication.body,
+                    properties=BasicProperties(
+                        content_type=publication.content_type,
+                        content_encoding=publication.content_encoding,
+                        correlation_id=properties.correlation_id,
+                        reply_to=publication.reply_to,
+                    ),
+                )
+            channel.basic_ack(method_frame.delivery_tag)
+
+        return on_message
+
+    def store_answers(self, delivery_tag: int) -> None:
+        """
+        Store recorded answers of the acknowledged delivery.
+        """
+        key = self.deliveries.pop(delivery_tag, None)
+        publications = self.pending.pop(delivery_tag, [])
+        if key is not None and self.store is not None:
+            self.store.set(key, publications)
+
+    def forget(self, delivery_tag: int) -> None:
+        """
+        Drop recorded answers of the rejected delivery.
+        """
+        self.deliveries.pop(delivery_tag, None)
+        self.pending.pop(delivery_tag, None)
+
+    def reset(self) -> None:
+        """
+        Drop recorded answers of all deliveries, when their connection is closed: delivery tags are numbered
+        again on the next connection, and not acknowledged messages are redelivered by broker.
+        """
+        self.deliveries.clear()
+        self.pending.clear()
+
+
+DEDUPLICATION = Deduplication()
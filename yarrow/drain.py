@@ -0,0 +1,101 @@
+import logging
+from collections import Counter
+from typing import Callable
+
+from pika import BasicProperties, BlockingConnection
+from pika.spec import Basic
+from pika.adapters.blocking_connection import BlockingChannel
+
+from yarrow import metrics
+from yarrow.workers import DeliveryChannel, OnMessageCallback
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedChannel(DeliveryChannel):
+    """
+    Channel of one delivery, which reports acknowledgement of the delivery to the drain.
+    """
+    def __init__(self, drain: 'Drain', channel: BlockingChannel):
+        super().__init__(channel)
+        self.drain = drain
+
+    def basic_ack(self, delivery_tag: int) -> None:  # pylint: disable=missing-function-docstring
+        self.channel.basic_ack(delivery_tag)
+        self.drain.settle(delivery_tag)
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True) -> None:  # pylint: disable=missing-function-docstring
+        self.channel.basic_nack(delivery_tag, requeue=requeue)
+        self.drain.settle(delivery_tag)
+
+
+class Drain:
+    """
+    Graceful shutdown: consumers are cancelled (not dispatched prefetched messages are returned to the broker),
+    received messages are processed and acknowledged, then consuming stops. Messages, which are not acknowledged
+    in timeout seconds, are abandoned: they are redelivered by the broker after the connection is closed.
+    It is used only from the connection thread.
+    """
+    def __init__(self, connection: BlockingConnection, channel: BlockingChannel, timeout: float):
+        self.connection = connection
+        self.channel = channel
+        self.timeout = timeout
+        self.deliveries: dict[int, str] = {}
+        self.draining = False
+        self.timer: object | None = None
+
+    def consumer(self, operator_name: str, callback: OnMessageCallback) -> OnMessageCallback:
+        """
+        Return callback for basic_consume, which tracks deliveries until they are acknowledged.
+        """
+        def on_message(
+                channel: BlockingChannel, method_frame: Basic.Deliver, properties: BasicProperties, body: bytes,
+        ) -> None:
+            if method_frame.delivery_tag is not None:
+                self.deliveries[method_frame.delivery_tag] = operator_name
+            callback(TrackedChannel(self, channel), method_frame, properties, body)  # type: ignore[arg-type]
+
+        return on_message
+
+    def settle(self, delivery_tag: int) -> None:
+        """
+        Forget the acknowledged delivery, stop consuming if it was the last one of the drain.
+        """
+        operator_name = self.deliveries.pop(delivery_tag, None)
+        if operator_name is not None and self.draining and not self.deliveries:
+            self.stop()
+
+    def start(self, cancel: Callable[[], None]) -> None:
+        """
+        Cancel consumers and wait for received messages. The second call stops consuming at once.
+        """
+        if self.draining:
+            logger.warning('Drain is interrupted')
+            self.stop()
+            return
+
+        cancel()
+        self.draining = True
+        logger.info('Drain %s messages, timeout %s seconds', len(self.deliveries), self.timeout)
+        if not self.deliveries:
+            self.stop()
+            return
+        self.timer = self.connection.call_later(self.timeout, self.stop)
+
+    def stop(self) -> None:
+        """
+        Count messages, which are not acknowledged, as abandoned and stop consuming.
+        """
+        if self.timer is not None:
+            self.connection.remove_timeout(self.timer)
+            self.timer = None
+
+        abandoned = Counter(self.deliveries.values())
+        self.deliveries.clear()
+        for operator_name, count in abandoned.items():
+            metrics.ABANDONED.inc(operator_name, value=count)
+        if abandoned:
+            logger.warning('Abandoned messages: %s', dict(abandoned))
+
+        self.channel.stop_consuming()
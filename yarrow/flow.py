@@ -0,0 +1,180 @@
+import logging
+import time
+import uuid
+from threading import Lock
+from typing import Any, Callable
+
+from pika import BasicProperties
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.spec import Basic
+from pydantic_core import from_json
+
+from yarrow import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+CREDIT_HEADER = 'x-credit'
+CREDIT_QUEUE_HEADER = 'x-credit-queue'
+
+Task = Callable[[], None]
+
+
+def call(task: Task) -> None:
+    """
+    Run task in the current thread.
+    """
+    task()
+
+
+class Window:
+    """
+    Credits of one stream: every PROCESSING answer takes one credit. When credits are exhausted, the stream is paused
+    with its continuation, a grant of credits returns the continuation to be resumed. A stream paused for too long
+    is expired: its continuation is returned to be resumed, and it fails on the next acquire.
+    """
+    def __init__(self, operator_name: str, credits_: int):
+        self.operator_name = operator_name
+        self.credits = credits_
+        self.lock = Lock()
+        self.resume: Task | None = None
+        self.paused_at = 0.0
+        self.paused_seconds = 0.0
+        self.expired = False
+
+    def acquire(self, resume: Task) -> bool:
+        """
+        Return True if there is a credit, otherwise pause the stream with the continuation resume.
+        Raise TimeoutError if the stream is expired.
+        """
+        with self.lock:
+            if self.expired:
+                raise TimeoutError('Stream is paused too long without credits')
+            if self.credits > 0:
+                return True
+            self.resume = resume
+            self.paused_at = time.monotonic()
+            return False
+
+    def spend(self) -> None:
+        """
+        Take one credit for a published answer.
+        """
+        with self.lock:
+            self.credits -= 1
+
+    def grant(self, credits_: int) -> Task | None:
+        """
+        Add credits and return the continuation of the paused stream, if it can be resumed.
+        """
+        with self.lock:
+            self.credits += credits_
+            if self.resume is None or self.credits <= 0:
+                return None
+            resume, self.resume = self.resume, None
+            paused = time.monotonic() - self.paused_at
+            self.paused_seconds += paused
+        metrics.STREAM_PAUSE_SECONDS.observe(paused, self.operator_name)
+        return resume
+
+    def expire(self, timeout: float) -> Task | None:
+        """
+        Return the continuation of the stream, if it is paused longer than timeout seconds.
+        """
+        with self.lock:
+            if self.resume is None or time.monotonic() - self.paused_at < timeout:
+                return None
+            resume, self.resume = self.resume, None
+            self.expired = True
+        return resume
+
+
+class FlowControl:
+    """
+    Credit-based flow control of streams. A request with header x-credit gets this number of PROCESSING answers,
+    then its stream is paused without holding the worker, until the client grants more credits: it publishes
+    a message with the same correlation_id and the number of credits in the body to the control queue,
+    which name is in header x-credit-queue of answers. Paused streams are resumed by executor.
+    Streams paused longer than idle_timeout seconds fail, they are checked every idle_timeout / 2 seconds.
+    """
+    def __init__(self) -> None:
+        self.queue: str | None = None
+        self.executor: Callable[[Task], Any] = call
+        self.windows: dict[str, Window] = {}
+        self.channel: BlockingChannel | None = None
+        self.idle_timeout: float | None = None
+
+    def start(
+            self,
+            channel: BlockingChannel,
+            executor: Callable[[Task], Any] | None = None,
+            idle_timeout: float | None = None,
+    ) -> None:
+        """
+        Declare the control queue of the process and consume grants from it.
+        Windows of streams of the previous connection are dropped.
+        """
+        self.windows.clear()
+        self.queue = f'__credits__.{uuid.uuid4().hex}'
+        self.executor = call if executor is None else executor
+        self.channel, self.idle_timeout = channel, idle_timeout
+        channel.queue_declare(self.queue, exclusive=True, auto_delete=True)
+        channel.basic_consume(self.queue, self.on_grant)
+        if idle_timeout is not None:
+            channel.connection.call_later(idle_timeout / 2, self.expire)
+
+    def expire(self) -> None:
+        """
+        Fail streams paused longer than idle_timeout and check them again later. It is called in the connection thread.
+        """
+        if self.channel is None or self.idle_timeout is None:
+            return
+        for correlation_id, window in list(self.windows.items()):
+            resume = window.expire(self.idle_timeout)
+            if resume is not None:
+                logger.warning('Stream is paused longer than %s seconds, correlation_id %s', self.idle_timeout,
+                               correlation_id)
+                self.executor(resume)
+        self.channel.connection.call_later(self.idle_timeout / 2, self.expire)
+
+    def open(self, operator_name: str, correlation_id: str, credits_: int) -> Window:
+        """
+        Return window of the stream with initial credits.
+        """
+        window = self.windows[correlation_id] = Window(operator_name, credits_)
+        return window
+
+    def close(self, correlation_id: str) -> None:
+        """
+        Forget window of the finished stream.
+        """
+        self.windows.pop(correlation_id, None)
+
+    def on_grant(
+            self, channel: BlockingChannel, method_frame: Basic.Deliver, properties: BasicProperties, body: bytes,
+    ) -> None:
+        """
+        Add credits to the window of the stream and resume it.
+        """
+        if method_frame.delivery_tag is not None:
+            channel.basic_ack(method_frame.delivery_tag)
+
+        window = self.windows.get(str(properties.correlation_id))
+        if window is None:
+            logger.debug('Credits for unknown stream, correlation_id %s', properties.correlation_id)
+            return
+        try:
+            credits_ = from_json(body)
+            if not isinstance(credits_, int):
+                raise ValueError(f'Credits are not integer: {body[:100]!r}')
+        except ValueError as error:
+            logger.error('Wrong credits, correlation_id %s: %s', properties.correlation_id, error)
+            return
+
+        resume = window.grant(credits_)
+        if resume is not None:
+            self.executor(resume)
+
+
+FLOW_CONTROL = FlowControl()
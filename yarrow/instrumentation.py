@@ -0,0 +1,86 @@
+import random
+import time
+from typing import Any, Callable
+
+from yarrow import metrics
+from yarrow.models import Phase
+
+
+class Instrument:
+    """
+    Base class of instruments. Hooks are called around every phase of profiled messages,
+    in the thread, which processes the message.
+    """
+    def before(self, operator_name: str, phase: Phase) -> None:
+        """
+        Hook, which is called before the phase.
+        """
+
+    def after(self, operator_name: str, phase: Phase, seconds: float) -> None:
+        """
+        Hook, which is called after the phase, even if it failed.
+        """
+
+
+class PhaseMetrics(Instrument):
+    """
+    Instrument, which collects time of phases to metric yarrow_phase_seconds.
+    """
+    def after(self, operator_name: str, phase: Phase, seconds: float) -> None:
+        metrics.PHASE_SECONDS.observe(seconds, operator_name, phase.value)
+
+
+class Profiler:
+    # pylint: disable=too-few-public-methods
+    """
+    Profiler of one message: measures time of phases and calls hooks of instruments.
+    """
+    def __init__(self, operator_name: str, instruments: list[Instrument]):
+        self.operator_name = operator_name
+        self.instruments = instruments
+
+    def measure(self, phase: Phase, function: Callable, *args: Any) -> Any:
+        """
+        Call function with args as the phase and return its result.
+        """
+        for instrument in self.instruments:
+            instrument.before(self.operator_name, phase)
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            seconds = time.perf_counter() - started
+            for instrument in self.instruments:
+                instrument.after(self.operator_name, phase, seconds)
+
+
+class Instrumentation:
+    """
+    Registered instruments and sampling rate: the share of messages, which are profiled.
+    """
+    def __init__(self) -> None:
+        self.instruments: list[Instrument] = []
+        self.sample_rate = 0.0
+
+    def register(self, instrument: Instrument) -> None:
+        """
+        Add instrument.
+        """
+        self.instruments.append(instrument)
+
+    def unregister(self, instrument: Instrument) -> None:
+        """
+        Remove instrument.
+        """
+        self.instruments.remove(instrument)
+
+    def profiler(self, operator_name: str) -> Profiler | None:
+        """
+        Return profiler for a new message, or None if the message is not sampled.
+        """
+        if not self.instruments or random.random() >= self.sample_rate:
+            return None
+        return Profiler(operator_name, self.instruments)
+
+
+INSTRUMENTATION = Instrumentation()
@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from typing import Any, Iterable, Iterator
+
+from pika import BlockingConnection
+
+
+logger = logging.getLogger(__name__)
+
+
+_STOP = object()
+
+
+class KeepAlive:
+    """
+    Heartbeats of the connection in sync execution mode, where operators are executed in the connection thread.
+    When it is started, a watchdog thread processes I/O of the connection, if the connection thread waits
+    for the next result of an operator longer than interval seconds, so heartbeats are not starved by a long run.
+    The connection is used by one thread at a time: the watchdog holds the lock, and the connection thread takes it
+    after the result is ready. Deliveries and other callbacks are not dispatched by the watchdog: pika does not
+    dispatch them inside of a callback.
+    """
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.connection: BlockingConnection | None = None
+        self.lock = threading.Lock()
+        self.waiting_since: float | None = None
+        self.stopped = threading.Event()
+
+    def start(self, connection: BlockingConnection) -> None:
+        """
+        Keep the connection alive while results are computed.
+        """
+        self.connection = connection
+        self.stopped = threading.Event()
+        threading.Thread(target=self.watch, args=(self.stopped,), name='yarrow-keepalive', daemon=True).start()
+
+    def stop(self) -> None:
+        """
+        Stop processing I/O of the connection and the watchdog thread.
+        """
+        with self.lock:
+            self.connection = None
+        self.stopped.set()
+
+    def watch(self, stopped: threading.Event) -> None:
+        """
+        Body of the watchdog thread.
+        """
+        while not stopped.wait(self.interval):
+            self.beat()
+
+    def beat(self) -> None:
+        """
+        Process I/O of the connection, if the connection thread waits for a result longer than interval.
+        """
+        with self.lock:
+            if (
+                    self.connection is None
+                    or self.waiting_since is None
+                    or time.monotonic() - self.waiting_since < self.interval
+            ):
+                return
+            try:
+                self.connection.process_data_events(0)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                # The connection thread gets the error, when it uses the connection.
+                logger.warning('Heartbeats are stopped: %r', error)
+                self.connection = None
+
+    def next(self, results: Iterator[Any], default: Any) -> Any:
+        """
+        Return the next result or default, when results are exhausted.
+        """
+        if self.connection is None:
+            return next(results, default)
+
+        with self.lock:
+            self.waiting_since = time.monotonic()
+        try:
+            return next(results, default)
+        finally:
+            with self.lock:
+                self.waiting_since = None
+
+    def iterate(self, results: Iterable[Any]) -> Iterator[Any]:
+        """
+        Yield results, which are taken as by next.
+        """
+        iterator = iter(results)
+        while (result := self.next(iterator, _STOP)) is not _STOP:
+            yield result
+
+
+KEEPALIVE = KeepAlive()
@@ -0,0 +1,82 @@
+import json
+import logging
+import random
+
+from yarrow.models import LogFormat
+from yarrow.settings import Settings
+
+
+# Fields of log records, which are added to JSON output if they are passed by extra.
+EXTRA_FIELDS = ('operator', 'correlation_id', 'reply_to', 'status')
+
+
+class Preview:
+    # pylint: disable=too-few-public-methods
+    """
+    Lazy preview of a message body for log arguments: it is decoded and truncated only if the record is emitted.
+    """
+    def __init__(self, body: bytes, length: int):
+        self.body = body
+        self.length = length
+
+    def __str__(self) -> str:
+        preview = self.body[:self.length].decode('utf-8', 'replace')
+        if len(self.body) > self.length:
+            return f'{preview}... ({len(self.body)} bytes)'
+        return preview
+
+
+class MessageLog:
+    """
+    Settings of logs of every message: length of body preview and the share of messages, which are logged.
+    Errors are logged always.
+    """
+    def __init__(self) -> None:
+        self.body_preview = 200
+        self.sample_rate = 1.0
+
+    def sampled(self) -> bool:
+        """
+        Return True if the new message should be logged.
+        """
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def preview(self, body: bytes) -> Preview:
+        """
+        Return lazy preview of the body.
+        """
+        return Preview(body, self.body_preview)
+
+
+MESSAGE_LOG = MessageLog()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatter of log records to one line JSON objects.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in EXTRA_FIELDS:
+            if field in record.__dict__:
+                entry[field] = record.__dict__[field]
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(settings: Settings) -> None:
+    """
+    Configure root logger for yarrow command. Applications, which call serve themselves, configure logging on their own.
+    """
+    handler = logging.StreamHandler()
+    if settings.LOG_FORMAT is LogFormat.JSON:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logging.basicConfig(level=settings.LOG_LEVEL, handlers=[handler])
@@ -1,18 +1,34 @@
+import inspect
 import json
 import logging
+import signal
+import time
+from functools import cache, partial
 from importlib import import_module
-from typing import Callable
+from typing import Callable, Type, TypeGuard
 
 import yaml
 from pika import BasicProperties, BlockingConnection, ConnectionParameters, PlainCredentials
 from pika.spec import Basic
 from pika.adapters.blocking_connection import BlockingChannel
 
-from yarrow.models import OperatorInfo
+from yarrow import metrics
+from yarrow.checkpoint import CHECKPOINTS, FileCheckpointStore, SqliteCheckpointStore
+from yarrow.codec import CODEC
+from yarrow.confirms import PublisherConfirms
+from yarrow.dedup import DEDUPLICATION, MemoryAnswerStore, SqliteAnswerStore
+from yarrow.drain import Drain
+from yarrow.flow import FLOW_CONTROL
+from yarrow.instrumentation import INSTRUMENTATION, PhaseMetrics
+from yarrow.keepalive import KEEPALIVE
+from yarrow.log import MESSAGE_LOG
+from yarrow.models import CheckpointBackend, ExecutionMode, OperatorConfig, OperatorInfo
+from yarrow.operator import LOCAL_OPERATORS, BatchOperator, Operator
+from yarrow.reconnect import CONNECTION_ERRORS, Backoff
 from yarrow.settings import Settings
+from yarrow.workers import BatchCollector, OnMessageCallback, WorkerPool
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -20,9 +36,10 @@ OPERATORS = 'operators'
 INFO_QUEUE = '__info__'
 
 
-def read_operator_list() -> list[str]:
+def read_operator_list() -> list[OperatorConfig]:
     """
-    Return all registered operators.
+    Return all registered operators with their settings.
+    Operator in config is either dotted path or mapping with key "operator" and settings.
     """
     settings = Settings()
 
@@ -30,21 +47,25 @@ def read_operator_list() -> list[str]:
         generator = yaml.load_all(file_descriptor, Loader=yaml.Loader)
         data = list(generator)
 
-    operators: list[str] = data[0][OPERATORS]
-    return operators
+    return [
+        OperatorConfig(operator=operator) if isinstance(operator, str) else OperatorConfig.model_validate(operator)
+        for operator in data[0][OPERATORS]
+    ]
 
 
-def import_operators() -> list[tuple[str, Callable]]:
+def import_operators(operator_configs: list[OperatorConfig] | None = None) -> list[tuple[str, Callable]]:
     """
     Import operators and return pairs: [(name, function), ...].
     """
-    operators = read_operator_list()
+    if operator_configs is None:
+        operator_configs = read_operator_list()
     operator_pairs: list[tuple[str, Callable]] = []
 
-    for operator in operators:
+    for operator_config in operator_configs:
+        operator = operator_config.operator
         try:
-            operator_name = operator.rsplit('.', 1)[1]
-            package_name = operator.rsplit('.', 1)[0]
+            operator_name = operator_config.name
+            package_name = operator_config.module
 
             operator_module = import_module(
                 package_name,
@@ -70,6 +91,22 @@ def import_operators() -> list[tuple[str, Callable]]:
     return operator_pairs
 
 
+@cache
+def info_body() -> bytes:
+    """
+    Return serialized list of all operators with schemas of their input and output.
+    It is computed once, call info_body.cache_clear() to reload it.
+    """
+    operator_info_list = [
+        OperatorInfo(
+            name=name,
+            input=class_.input.model_json_schema(),  # type: ignore
+            output=class_.output.model_json_schema(),  # type: ignore
+        ) for name, class_ in import_operators()
+    ]
+    return json.dumps([info.model_dump() for info in operator_info_list]).encode('utf-8')
+
+
 def get_info(channel: BlockingChannel, method_frame: Basic.Deliver, properties: BasicProperties, _: bytes) -> None:
     """
     Function return all operators, that can be launched.
@@ -77,48 +114,233 @@ def get_info(channel: BlockingChannel, method_frame: Basic.Deliver, properties:
     if properties.reply_to is None:
         logger.error('No reply_to')
     else:
-        operator_pairs = import_operators()
-
-        operator_info_list = [
-            OperatorInfo(
-                name=name,
-                input=class_.input.model_json_schema(),  # type: ignore
-                output=class_.output.model_json_schema(),  # type: ignore
-            ) for name, class_ in operator_pairs
-        ]
-
         channel.basic_publish(
             exchange='',
             routing_key=properties.reply_to,
             properties=BasicProperties(
                 correlation_id=properties.correlation_id,
             ),
-            body=json.dumps([info.model_dump() for info in operator_info_list]).encode('utf-8')
+            body=info_body(),
         )
 
     if method_frame.delivery_tag is not None:
         channel.basic_ack(method_frame.delivery_tag)
 
 
-def serve() -> None:
+def load_operators(settings: Settings) -> tuple[list[OperatorConfig], list[tuple[str, Callable]]]:
     """
-    Main function: serve and do all business logic of package.
+    Log settings, read config and import operators.
     """
-    settings = Settings()
     logger.info(
-        'Start serving: %s %s %s %s %s, config file: %s',
+        'Start serving: %s %s %s %s %s, config file: %s, execution mode: %s',
         settings.HOST,
         settings.PORT,
         settings.VIRTUAL_HOST,
         settings.USERNAME,
         '***',
         settings.CONFIG_FILENAME,
+        settings.EXECUTION_MODE,
     )
-    operator_pairs = import_operators()
+    operator_configs = read_operator_list()
+    operator_pairs = import_operators(operator_configs)
     logger.info('Operators: %s', [
         operator_name
         for operator_name, _ in operator_pairs
     ])
+    info_body.cache_clear()
+    info_body()
+    return operator_configs, operator_pairs
+
+
+def apply_settings(settings: Settings) -> None:
+    """
+    Apply settings of JSON backend and message logs, serve metrics, turn on profiling of sampled messages
+    and deduplication.
+    """
+    CODEC.use(settings.JSON_BACKEND)
+    MESSAGE_LOG.body_preview = settings.LOG_BODY_PREVIEW
+    MESSAGE_LOG.sample_rate = settings.LOG_SAMPLE_RATE
+    if settings.METRICS_PORT is not None:
+        metrics.start_server(settings.METRICS_PORT)
+    if settings.PROFILE_SAMPLE_RATE:
+        INSTRUMENTATION.sample_rate = settings.PROFILE_SAMPLE_RATE
+        INSTRUMENTATION.register(PhaseMetrics())
+    if settings.DEDUP_SIZE:
+        DEDUPLICATION.store = (
+            MemoryAnswerStore(settings.DEDUP_SIZE)
+            if settings.DEDUP_FILENAME is None
+            else SqliteAnswerStore(settings.DEDUP_FILENAME, settings.DEDUP_SIZE)
+        )
+
+
+def set_checkpoint_store(settings: Settings) -> None:
+    """
+    Turn on checkpoints of resumable operators, if CHECKPOINT_PATH is set. Workers of process mode publish answers
+    after the end of run, so the position of a stream is not known there.
+    """
+    if settings.CHECKPOINT_PATH is None:
+        return
+    if settings.EXECUTION_MODE is ExecutionMode.PROCESS:
+        logger.warning('Checkpoints are not supported in process execution mode')
+        return
+    CHECKPOINTS.store = (
+        FileCheckpointStore(settings.CHECKPOINT_PATH)
+        if settings.CHECKPOINT_BACKEND is CheckpointBackend.FILE
+        else SqliteCheckpointStore(settings.CHECKPOINT_PATH)
+    )
+
+
+def is_batch_operator(operator_function: Callable) -> TypeGuard[Type[BatchOperator]]:
+    """
+    Check that operator is subclass of BatchOperator.
+    """
+    return isinstance(operator_function, type) and issubclass(operator_function, BatchOperator)
+
+
+def is_local_operator(operator_function: Callable) -> TypeGuard[Type[Operator]]:
+    """
+    Check that operator can be called in-process as the next hop of a route: it is a synchronous operator class,
+    which is marked as fusable.
+    """
+    return (
+        isinstance(operator_function, type)
+        and issubclass(operator_function, Operator)
+        and not operator_function.is_abstract
+        and operator_function.fusable
+        and not inspect.isasyncgenfunction(operator_function.run)
+    )
+
+
+def consumer(
+        connection: BlockingConnection,
+        pool: WorkerPool | None,
+        operator_function: Callable,
+        operator_config: OperatorConfig,
+) -> OnMessageCallback:
+    """
+    Return callback of the operator for basic_consume.
+    """
+    if is_batch_operator(operator_function):
+        if pool is None:
+            return BatchCollector(
+                connection,
+                operator_function.consume_batch,
+                operator_function.max_batch_size,
+                operator_function.max_batch_wait,
+            )
+        return pool.batch_consumer(operator_function, operator_config.max_in_flight)
+
+    if pool is None:
+        return operator_function
+    return pool.consumer(operator_function, operator_config.max_in_flight)
+
+
+class Consumers:
+    """
+    Consumers of operator queues on one channel. They can be changed by reload of the config without reconnection.
+    Consumed operators are kept in dict operators, which outlives the connection.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+            self,
+            connection: BlockingConnection,
+            channel: BlockingChannel,
+            pool: WorkerPool | None,
+            confirms: PublisherConfirms | None = None,
+            local_operators: dict[str, Type[Operator]] | None = None,
+            drain: Drain | None = None,
+            operators: dict[str, tuple[Callable, OperatorConfig]] | None = None,
+    ):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.connection = connection
+        self.channel = channel
+        self.pool = pool
+        self.confirms = confirms
+        self.local_operators = local_operators
+        self.drain = drain
+        self.operators = {} if operators is None else operators
+        self.registered: dict[str, tuple[OperatorConfig, str, OnMessageCallback]] = {}
+
+    def add(self, operator_name: str, operator_function: Callable, operator_config: OperatorConfig) -> None:
+        """
+        Start consuming of the operator queue.
+        """
+        self.channel.queue_declare(operator_name)
+
+        # Without global flag prefetch count is applied to every next consumer of the channel separately.
+        self.channel.basic_qos(prefetch_count=operator_config.prefetch_count)
+        callback = consumer(self.connection, self.pool, operator_function, operator_config)
+        on_message = callback if DEDUPLICATION.store is None else DEDUPLICATION.consumer(operator_name, callback)
+        if self.confirms is not None:
+            on_message = self.confirms.consumer(on_message)
+        if self.drain is not None:
+            on_message = self.drain.consumer(operator_name, on_message)
+        consumer_tag = self.channel.basic_consume(
+            operator_name,
+            on_message,
+            arguments=None if operator_config.priority is None else {'x-priority': operator_config.priority},
+        )
+        self.registered[operator_name] = (operator_config, consumer_tag, callback)
+        self.operators[operator_name] = (operator_function, operator_config)
+        if self.local_operators is not None and is_local_operator(operator_function):
+            self.local_operators[operator_name] = operator_function
+
+    def cancel(self, operator_name: str) -> None:
+        """
+        Stop consuming of the operator queue. Already received messages are still processed and acknowledged.
+        """
+        _, consumer_tag, callback = self.registered.pop(operator_name)
+        self.operators.pop(operator_name, None)
+        if self.local_operators is not None:
+            self.local_operators.pop(operator_name, None)
+        self.channel.basic_cancel(consumer_tag)
+        if isinstance(callback, BatchCollector):
+            callback.flush()
+
+    def cancel_all(self) -> None:
+        """
+        Stop consuming of all operator queues.
+        """
+        for operator_name in list(self.registered):
+            self.cancel(operator_name)
+
+    def reload(self) -> None:
+        """
+        Read config again, cancel consumers of removed or changed operators and add new or changed ones.
+        Modules of operators, which are already imported, are not reloaded.
+        """
+        logger.info('Reload config')
+        try:
+            operator_configs = read_operator_list()
+            operator_pairs = import_operators(operator_configs)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            logger.error('Config is not reloaded: %s', error)
+            return
+
+        operators = {
+            operator_name: (operator_function, operator_config)
+            for (operator_name, operator_function), operator_config
+            in zip(operator_pairs, operator_configs, strict=True)
+        }
+        for operator_name, (operator_config, _, _) in list(self.registered.items()):
+            if operator_name not in operators or operators[operator_name][1] != operator_config:
+                logger.info('Cancel operator %s', operator_name)
+                self.cancel(operator_name)
+
+        for operator_name, (operator_function, operator_config) in operators.items():
+            if operator_name not in self.registered:
+                logger.info('Add operator %s', operator_name)
+                self.add(operator_name, operator_function, operator_config)
+
+        info_body.cache_clear()
+        info_body()
+
+
+def consume(settings: Settings, operators: dict[str, tuple[Callable, OperatorConfig]], backoff: Backoff) -> None:
+    """
+    Connect to broker and consume queues of operators until graceful shutdown. Errors of the connection are raised,
+    unless the connection is lost while draining.
+    """
     connection = BlockingConnection(
         parameters=ConnectionParameters(
             host=settings.HOST,
@@ -127,23 +349,94 @@ def serve() -> None:
             credentials=PlainCredentials(
                 settings.USERNAME,
                 settings.PASSWORD,
-            )
+            ),
+            heartbeat=settings.HEARTBEAT,
         )
     )
     channel = connection.channel()
 
+    pool = None
+    if settings.EXECUTION_MODE is not ExecutionMode.SYNC:
+        pool = WorkerPool(connection, settings.EXECUTION_MODE, settings.WORKERS)
+    elif settings.HEARTBEAT != 0:
+        KEEPALIVE.start(connection)
+
+    drain = Drain(connection, channel, settings.DRAIN_TIMEOUT)
     try:
         channel.queue_declare(INFO_QUEUE)
         channel.basic_consume(INFO_QUEUE, get_info)
 
-        for operator_name, operator_function in operator_pairs:
-            channel.queue_declare(operator_name)
+        confirms = None
+        if settings.PUBLISHER_CONFIRMS:
+            confirms = PublisherConfirms(connection, connection.channel())
+
+        if settings.STREAM_CREDITS and settings.EXECUTION_MODE is not ExecutionMode.PROCESS:
+            FLOW_CONTROL.start(
+                channel,
+                None if pool is None else pool.executor.submit,
+                settings.STREAM_IDLE_TIMEOUT,
+            )
 
-            channel.basic_consume(operator_name, operator_function)
+        local_operators = None
+        if settings.FUSE_PIPELINES and settings.EXECUTION_MODE is not ExecutionMode.PROCESS:
+            local_operators = LOCAL_OPERATORS
+
+        consumers = Consumers(connection, channel, pool, confirms, local_operators, drain, operators)
+        for operator_name, (operator_function, operator_config) in list(operators.items()):
+            consumers.add(operator_name, operator_function, operator_config)
+        backoff.reset()
+
+        # Handlers are called in the connection thread, but maybe inside of a channel callback.
+        signal.signal(signal.SIGHUP, lambda *_: connection.add_callback_threadsafe(consumers.reload))
+        signal.signal(
+            signal.SIGTERM,
+            lambda *_: connection.add_callback_threadsafe(partial(drain.start, consumers.cancel_all)),
+        )
 
         channel.start_consuming()
+    except CONNECTION_ERRORS:
+        if not drain.draining:
+            raise
+        # Not acknowledged messages are redelivered by broker.
+        logger.warning('Connection is lost while draining')
     finally:
+        if pool is not None:
+            pool.shutdown()
+        KEEPALIVE.stop()
+        DEDUPLICATION.reset()
         if channel.is_open:
             channel.close()
         if connection.is_open:
             connection.close()
+
+
+def serve() -> None:
+    """
+    Main function: serve and do all business logic of package.
+    Lost connection is established again after a jittered delay, operators are not imported again.
+    """
+    settings = Settings()
+    operator_configs, operator_pairs = load_operators(settings)
+    apply_settings(settings)
+    set_checkpoint_store(settings)
+
+    operators = {
+        operator_name: (operator_function, operator_config)
+        for (operator_name, operator_function), operator_config in zip(operator_pairs, operator_configs, strict=True)
+    }
+    backoff = Backoff(settings.RECONNECT_DELAY, settings.RECONNECT_MAX_DELAY, settings.RECONNECT_ATTEMPTS)
+    while True:
+        try:
+            consume(settings, operators, backoff)
+            return
+        except CONNECTION_ERRORS as error:
+            delay = backoff.next_delay()
+            if delay is None:
+                raise
+            metrics.RECONNECTS.inc()
+            logger.warning('Connection to broker is lost: %r, reconnect in %.1f seconds', error, delay)
+
+        # There is no connection to call handlers in, SIGTERM stops at once, SIGHUP waits for the connection.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        time.sleep(delay)
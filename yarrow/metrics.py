@@ -0,0 +1,217 @@
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Iterator
+
+
+logger = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LENGTH_BUCKETS = (1, 2, 5, 10, 100, 1_000, 10_000, 100_000)
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    """
+    Return labels in Prometheus text format.
+    """
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+def format_value(value: float) -> str:
+    """
+    Return value in Prometheus text format with full precision: integral values are written without fraction.
+    """
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    # pylint: disable=too-few-public-methods
+    """
+    Base class of metrics. Values are kept per set of label values, they can be changed from any thread.
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ('operator',)):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.lock = Lock()
+
+    def samples(self) -> Iterator[str]:
+        """
+        Return lines of the metric in Prometheus text format.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Value, which only grows.
+    """
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ('operator',)):
+        super().__init__(name, documentation, labels)
+        self.values: defaultdict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, *label_values: str, value: float = 1) -> None:
+        """
+        Increase the value.
+        """
+        with self.lock:
+            self.values[label_values] += value
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            yield f'{self.name}{{{format_labels(self.labels, label_values)}}} {format_value(value)}'
+
+
+class Gauge(Counter):
+    """
+    Value, which goes up and down.
+    """
+    type = 'gauge'
+
+    def dec(self, *label_values: str, value: float = 1) -> None:
+        """
+        Decrease the value.
+        """
+        self.inc(*label_values, value=-value)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values by buckets with their sum and count.
+    """
+    type = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            buckets: tuple[float, ...] = LATENCY_BUCKETS,
+            labels: tuple[str, ...] = ('operator',),
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # Counts of every bucket (not cumulative), the last one is +Inf, then the sum.
+        self.observations: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Add the value to the distribution.
+        """
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            observations = self.observations.get(label_values)
+            if observations is None:
+                observations = self.observations[label_values] = [0] * (len(self.buckets) + 2)
+            observations[index] += 1
+            observations[-1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            items = [(label_values, list(observations)) for label_values, observations in self.observations.items()]
+        for label_values, observations in items:
+            labels = format_labels(self.labels, label_values)
+            count = 0.0
+            for bound, bucket_count in zip([*map(str, self.buckets), '+Inf'], observations):
+                count += bucket_count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {format_value(count)}'
+            yield f'{self.name}_sum{{{labels}}} {format_value(observations[-1])}'
+            yield f'{self.name}_count{{{labels}}} {format_value(count)}'
+
+
+MESSAGES_CONSUMED = Counter('yarrow_messages_consumed_total', 'Messages received by operator.')
+ANSWERS_PUBLISHED = Counter(
+    'yarrow_answers_published_total',
+    'Answers published by operator.',
+    ('operator', 'status'),
+)
+IN_FLIGHT = Gauge('yarrow_in_flight', 'Messages, which are processed by operator now.')
+VALIDATION_SECONDS = Histogram('yarrow_validation_seconds', 'Time of request validation.')
+RUN_SECONDS = Histogram('yarrow_run_seconds', 'Time of operator run without publishing of answers.')
+PUBLISH_SECONDS = Histogram('yarrow_publish_seconds', 'Time of serialization and publishing of one answer.')
+STREAM_LENGTH = Histogram('yarrow_stream_length', 'Number of PROCESSING answers to one message.', LENGTH_BUCKETS)
+PHASE_SECONDS = Histogram(
+    'yarrow_phase_seconds',
+    'Time of phases of profiled messages.',
+    labels=('operator', 'phase'),
+)
+CACHE_HITS = Counter('yarrow_cache_hits_total', 'Requests answered from the result cache.')
+CACHE_MISSES = Counter('yarrow_cache_misses_total', 'Requests, which results were not cached.')
+CACHE_EVICTIONS = Counter('yarrow_cache_evictions_total', 'Cached results removed by size limit or expiration.')
+DUPLICATES = Counter('yarrow_duplicates_total', 'Duplicate messages answered with stored answers.')
+STREAM_PAUSE_SECONDS = Histogram('yarrow_stream_pause_seconds', 'Time of streams paused for lack of credits.')
+ABANDONED = Counter('yarrow_abandoned_total', 'Messages, which were not finished before shutdown.')
+RECONNECTS = Counter('yarrow_reconnects_total', 'Attempts to connect again after the connection was lost.', ())
+
+METRICS: list[Metric] = [
+    MESSAGES_CONSUMED,
+    ANSWERS_PUBLISHED,
+    IN_FLIGHT,
+    VALIDATION_SECONDS,
+    RUN_SECONDS,
+    PUBLISH_SECONDS,
+    STREAM_LENGTH,
+    PHASE_SECONDS,
+    CACHE_HITS,
+    CACHE_MISSES,
+    CACHE_EVICTIONS,
+    DUPLICATES,
+    STREAM_PAUSE_SECONDS,
+    ABANDONED,
+    RECONNECTS,
+]
+
+
+def render() -> bytes:
+    """
+    Return all metrics in Prometheus text format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.samples())
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Handler of GET /metrics.
+    """
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Return metrics.
+        """
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+
+        body = render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+def start_server(port: int, host: str = '') -> ThreadingHTTPServer:
+    """
+    Serve metrics by HTTP in a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    Thread(target=server.serve_forever, name='yarrow-metrics', daemon=True).start()
+    logger.info('Serve metrics on port %s', server.server_port)
+    return server
@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 # pylint: disable=missing-class-docstring
@@ -13,6 +13,49 @@ class Status(Enum):
     ERROR = 'ERROR'
 
 
+class RequestEcho(Enum):
+    ALL = 'all'  # the request is in every answer
+    FIRST = 'first'  # only in the first answer
+    LAST = 'last'  # only in the last answer (DONE)
+    HASH = 'hash'  # sha256 of the request body instead of the request
+    NONE = 'none'  # never, answers are matched by correlation_id
+
+
+class ExecutionMode(Enum):
+    SYNC = 'sync'
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+
+class JsonBackend(Enum):
+    PYDANTIC = 'pydantic'
+    ORJSON = 'orjson'
+
+
+class CheckpointBackend(Enum):
+    FILE = 'file'  # JSON file per stream in the directory
+    SQLITE = 'sqlite'
+
+
+class LogFormat(Enum):
+    TEXT = 'text'
+    JSON = 'json'
+
+
+class Phase(Enum):
+    VALIDATION = 'validation'  # input.model_validate_json of the request
+    RUN = 'run'  # method run of the operator till the next result
+    OUTPUT = 'output'  # output.model_validate of one result
+    SERIALIZATION = 'serialization'  # serialization of one result or answer
+    PUBLISH = 'publish'  # basic_publish of one answer
+    COMPRESSION = 'compression'  # decompression of the request or compression of one answer
+
+
+class ContentEncoding(Enum):
+    GZIP = 'gzip'
+    ZSTD = 'zstd'
+
+
 class Answer(BaseModel):
     request: Any
     result: Any | None = None
@@ -25,3 +68,24 @@ class OperatorInfo(BaseModel):
     name: str
     input: dict
     output: dict
+
+
+class OperatorConfig(BaseModel):
+    operator: str
+    prefetch_count: int = Field(default=0, ge=0)  # 0 is unlimited
+    max_in_flight: int | None = Field(default=None, ge=1)
+    priority: int | None = None
+
+    @property
+    def module(self) -> str:
+        """
+        Module of the operator, the import path without the last part.
+        """
+        return self.operator.rsplit('.', 1)[0]
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the operator in the module, the last part of the import path.
+        """
+        return self.operator.rsplit('.', 1)[-1]
@@ -1,37 +1,567 @@
-import json
+import asyncio
+import hashlib
+import inspect
 import logging
-from typing import Any, Callable, Type
+import time
+from functools import cached_property, lru_cache, partial
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Iterable, Iterator, NamedTuple, Type
 
 from pika import BasicProperties
 from pika.spec import Basic
 from pika.channel import Channel
 from pydantic import BaseModel
 
-from yarrow.models import Answer, Status
+from yarrow import metrics
+from yarrow.cache import ResultCache
+from yarrow.checkpoint import CHECKPOINTS, Checkpoint, CheckpointStore, after_publish
+from yarrow.codec import JSON, compress, decompress, get_format
+from yarrow.flow import CREDIT_HEADER, CREDIT_QUEUE_HEADER, FLOW_CONTROL, Window
+from yarrow.instrumentation import INSTRUMENTATION, Profiler
+from yarrow.keepalive import KEEPALIVE
+from yarrow.log import MESSAGE_LOG
+from yarrow.models import Answer, ContentEncoding, Phase, RequestEcho, Status
+
+if TYPE_CHECKING:  # pragma: no cover
+    from yarrow.aio import AsyncChannel
 
 
 logger = logging.getLogger(__name__)
 
 
 DEAD_LETTERS_QUEUE = '__dead_letters_queue__'
+REQUEST_ECHO_HEADER = 'x-request-echo'
+REPLY_CONTENT_TYPE_HEADER = 'x-reply-content-type'
+
+_STOP = object()
+
+# Delivery of a batch with its own channel, so answers of every message are published by the channel of its delivery.
+Message = tuple[Any, Basic.Deliver, BasicProperties, bytes]
+
+
+class Route(NamedTuple):
+    """
+    Destination of answers parsed from reply_to: answers are published to every queue of the next hop
+    with the rest of the chain as their reply_to. E.g. 'A,B>C>D' is published to A and B with reply_to 'C>D'.
+    """
+    queues: tuple[str, ...]
+    reply_to: str | None = None
+
+    def __str__(self) -> str:
+        return ','.join(self.queues) + ('' if self.reply_to is None else '>' + self.reply_to)
+
+
+DEAD_LETTERS_ROUTE = Route((DEAD_LETTERS_QUEUE,))
+
+
+@lru_cache(maxsize=1024)
+def parse_route(reply_to: str) -> Route:
+    """
+    Return route of reply_to property. Routes of recent values are cached.
+    """
+    head, _, tail = reply_to.partition('>')
+    return Route(tuple(queue for queue in head.split(',') if queue), tail or None)
+
+
+# Operators served by this process by their queues. If such operator is the next hop of a route,
+# it is called in-process on every result instead of publishing answers to its queue.
+LOCAL_OPERATORS: dict[str, Type['Operator']] = {}
+
+
+def local_route(route: Route) -> tuple[list[Type['Operator']], Route]:
+    """
+    Return local operators, which are the next hops of the route, and the rest of the route.
+    Hops with several queues and the last hop are not local.
+    """
+    stages = []
+    while len(route.queues) == 1 and route.reply_to is not None and route.queues[0] in LOCAL_OPERATORS:
+        stages.append(LOCAL_OPERATORS[route.queues[0]])
+        route = parse_route(route.reply_to)
+    return stages, route
+
+
+def hand_off(operator_class: Type['Operator'], results: Iterable[Any], profiler: Profiler | None) -> Iterator[Any]:
+    """
+    Call operator on every result and yield its results, results are validated as its input.
+    """
+    for result in results:
+        yield from operator_class.execute(operator_class.input.model_validate(result, from_attributes=True), profiler)
+
+
+def get_header(properties: BasicProperties, name: str) -> Any:
+    """
+    Return header of the message or None.
+    """
+    headers = properties.headers
+    return headers.get(name) if isinstance(headers, dict) else None
+
+
+class Chunk:
+    """
+    Serialized results of a stream, which are collected to be sent in one answer.
+    The chunk is full when it has max_items results, or its results take max_bytes serialized,
+    or max_interval seconds passed since its first result. There is no timer: the interval is checked, when the next
+    result is added, so a chunk waits for the next result or the end of the stream, while run computes it.
+    """
+    def __init__(
+            self,
+            max_items: int | None = None,
+            max_bytes: int | None = None,
+            max_interval: float | None = None,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+        self.items: list[bytes] = []
+        self.size = 0
+        self.started = 0.0
+
+    def add(self, item: bytes) -> bool:
+        """
+        Add serialized result to the chunk and return True if the chunk is full.
+        """
+        if not self.items:
+            self.started = time.monotonic()
+        self.items.append(item)
+        self.size += len(item)
+
+        return (
+            (self.max_items is not None and len(self.items) >= self.max_items)
+            or (self.max_bytes is not None and self.size >= self.max_bytes)
+            or (self.max_interval is not None and time.monotonic() - self.started >= self.max_interval)
+        )
+
+    def pop(self) -> list[bytes]:
+        """
+        Return collected serialized results and clear the chunk.
+        """
+        items, self.items, self.size = self.items, [], 0
+        return items
+
+
+class Reply:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Answers of an operator to one delivery.
+    Channel is any object with pika channel methods basic_publish, basic_ack and queue_declare.
+    The request is decoded by its content_type, answers have the same format or the one of header
+    x-reply-content-type. Content types other than MessagePack and CBOR are JSON.
+    Compressed requests are decompressed by their content_encoding.
+    Requests with header x-credit get a window of credits for their stream, if flow control is started.
+    Streams of resumable operators are checkpointed, if the checkpoint store is set, unless they have local hops.
+    """
+    def __init__(
+            self,
+            operator_class: Type['Operator'],
+            channel: Any,
+            method_frame: Basic.GetOk | Basic.Deliver,
+            properties: BasicProperties,
+            body: bytes,
+    ):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.operator_name = operator_class.__name__
+        self.request_echo = operator_class.request_echo
+        self.chunk = (
+            Chunk(operator_class.chunk_size, operator_class.chunk_bytes, operator_class.chunk_interval)
+            if operator_class.is_chunked()
+            else None
+        )
+        self.compress_min_size = operator_class.compress_min_size
+        self.compression = operator_class.compression
+        self.checkpoint_interval = operator_class.checkpoint_interval if operator_class.is_resumable() else None
+        self.checkpoints: CheckpointStore | None = None
+        self.checkpointed = 0.0
+        self.offset = 0
+        self.channel = channel
+        self.method_frame = method_frame
+        self.properties = properties
+        self.body = body
+        self.route = DEAD_LETTERS_ROUTE
+        self.stages: list[Type[Operator]] = []
+        self.window: Window | None = None
+        self.request_format = self.reply_format = get_format(None)
+        self.num = -1  # the solution of zero length generator
+        self.run_started: float | None = None
+        self.publish_time = 0.0
+        self.profiler = INSTRUMENTATION.profiler(self.operator_name)
+        self.logged = MESSAGE_LOG.sampled()
+
+        metrics.MESSAGES_CONSUMED.inc(self.operator_name)
+        metrics.IN_FLIGHT.inc(self.operator_name)
+
+        if self.logged:
+            logger.info(
+                'Start operator %s, correlation_id %s, body %s',
+                self.operator_name,
+                properties.correlation_id,
+                MESSAGE_LOG.preview(body),
+                extra=self.log_extra,
+            )
+        logger.debug('Full body of operator %s: %s', self.operator_name, body)
+
+    @property
+    def log_extra(self) -> dict[str, Any]:
+        """
+        Fields of log records about the delivery.
+        """
+        return {'operator': self.operator_name, 'correlation_id': self.properties.correlation_id}
+
+    def request(self, model: Type[BaseModel]) -> BaseModel:
+        """
+        Check properties of the delivery and return the request validated by model.
+        """
+        content_encoding = self.properties.content_encoding
+        if self.profiler is not None and isinstance(content_encoding, str):
+            self.body = self.profiler.measure(Phase.COMPRESSION, decompress, self.body, content_encoding)
+        else:
+            self.body = decompress(self.body, content_encoding)
+        request_format = get_format(self.properties.content_type)
+        reply_content_type = get_header(self.properties, REPLY_CONTENT_TYPE_HEADER)
+        self.reply_format = request_format if reply_content_type is None else get_format(reply_content_type)
+        self.request_format = request_format
+
+        if self.properties.reply_to is None:
+            raise ValueError('No property reply_to')
+        if self.method_frame.delivery_tag is None:
+            raise ValueError('No delivery tag')
+        if self.properties.correlation_id is None:
+            raise ValueError('No correlation_id')
+        stages, route = local_route(parse_route(self.properties.reply_to))
+        if not route.queues:
+            raise ValueError('No queue in property reply_to')
+        self.stages, self.route = stages, route
+        if self.checkpoint_interval is not None and CHECKPOINTS.store is not None and not stages:
+            self.checkpoints = CHECKPOINTS.store
+            self.checkpointed = time.monotonic()
+            # Only redelivered messages can have a checkpoint, fresh ones do not read the store.
+            if self.method_frame.redelivered:
+                self.restore(CHECKPOINTS.store)
+
+        request_echo = get_header(self.properties, REQUEST_ECHO_HEADER)
+        if request_echo is not None:
+            self.request_echo = RequestEcho(request_echo)
+
+        credit = get_header(self.properties, CREDIT_HEADER)
+        if credit is not None and FLOW_CONTROL.queue is not None:
+            self.window = FLOW_CONTROL.open(self.operator_name, self.properties.correlation_id, int(credit))
+
+        started = time.perf_counter()
+        if self.profiler is None:
+            request = self.request_format.validate(model, self.body)
+        else:
+            request = self.profiler.measure(Phase.VALIDATION, self.request_format.validate, model, self.body)
+        self.run_started = time.perf_counter()
+        metrics.VALIDATION_SECONDS.observe(self.run_started - started, self.operator_name)
+        return request
+
+    @property
+    def checkpoint_key(self) -> str:  # pylint: disable=missing-function-docstring
+        return f'{self.operator_name}:{self.properties.correlation_id}'
+
+    def restore(self, checkpoints: CheckpointStore) -> None:
+        """
+        Continue the stream from the stored checkpoint of the redelivered message.
+        """
+        checkpoint = checkpoints.get(self.checkpoint_key)
+        if checkpoint is None:
+            return
+
+        logger.info(
+            'Resume operator %s from result %s, answer %s, correlation_id %s',
+            self.operator_name,
+            checkpoint.offset,
+            checkpoint.num,
+            self.properties.correlation_id,
+            extra=self.log_extra,
+        )
+        self.offset = checkpoint.offset
+        self.num = checkpoint.num - 1
+
+    def save(self) -> None:
+        """
+        Store the position of the stream, if checkpoint_interval seconds passed since the last checkpoint.
+        Results in not full chunk are not answered yet, so the position is stored only between chunks.
+        The position is stored by the channel, when the answers before it reached the broker: in thread mode
+        after the connection thread published them, with publisher confirms after they are confirmed.
+        """
+        if (
+                self.checkpoints is None
+                or self.checkpoint_interval is None
+                or (self.chunk is not None and self.chunk.items)
+                or time.monotonic() - self.checkpointed < self.checkpoint_interval
+        ):
+            return
+        after_publish(
+            self.channel, partial(self.checkpoints.set, self.checkpoint_key, Checkpoint(self.offset, self.num + 1)),
+        )
+        self.checkpointed = time.monotonic()
+
+    @cached_property
+    def encoded_request(self) -> bytes:
+        """
+        The request echoed in every answer, it is decoded and serialized only once.
+        Malformed body is echoed as string.
+        """
+        try:
+            request = self.request_format.loads(self.body)
+        except self.request_format.decode_errors:
+            request = self.body.decode('utf-8', 'replace')
+        return self.reply_format.dumps(request)
+
+    @cached_property
+    def encoded_request_hash(self) -> bytes:
+        """
+        Hash of the request body echoed instead of the request, it is computed and serialized only once.
+        """
+        return self.reply_format.dumps('sha256:' + hashlib.sha256(self.body).hexdigest())
+
+    def echo(self, answer: Answer) -> bytes:
+        """
+        Return serialized request field of the answer according to the request echo mode.
+        Answers with status ERROR always have the whole request.
+        """
+        if answer.status is Status.ERROR or self.request_echo is RequestEcho.ALL:
+            return self.encoded_request
+        if self.request_echo is RequestEcho.FIRST:
+            return self.encoded_request if answer.num == 0 else self.reply_format.null
+        if self.request_echo is RequestEcho.LAST:
+            return self.encoded_request if answer.status is Status.DONE else self.reply_format.null
+        if self.request_echo is RequestEcho.HASH:
+            return self.encoded_request_hash
+        return self.reply_format.null
+
+    def encode(self, answer: Answer, result: bytes | None = None) -> bytes:
+        """
+        Serialize answer, the request is put as its first field. The result can be already serialized.
+        """
+        dumps = self.reply_format.dumps
+        return self.reply_format.answer((
+            self.echo(answer),
+            dumps(answer.result) if result is None else result,
+            dumps(answer.status.value),
+            dumps(answer.error),
+            dumps(answer.num),
+        ))
+
+    def pipe(self, results: Iterable[Any]) -> Iterable[Any]:
+        """
+        Return results of the last local operator of the route: results are handed off from one to the next lazily.
+        """
+        for operator_class in self.stages:
+            results = hand_off(operator_class, results, self.profiler)
+        return results
+
+    def stream(self, results: Iterator[Any], data: Any = _STOP) -> None:
+        """
+        Publish results and finish the reply. Stream with a window is paused, when its credits are exhausted,
+        the rest of the results is published, when the stream is resumed by a grant of credits.
+        The next result is taken before a credit, so the last answer needs no credit; a paused stream holds it.
+        """
+        try:
+            if data is _STOP:
+                data = KEEPALIVE.next(results, _STOP)
+            while data is not _STOP:
+                if self.window is not None and not self.window.acquire(partial(self.stream, results, data)):
+                    logger.debug('Stream of operator %s is paused', self.operator_name, extra=self.log_extra)
+                    return
+                self.send(data)
+                data = KEEPALIVE.next(results, _STOP)
+
+            logger.debug('The operator end returning sequence.')
+            route, answer = self.done()
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            route, answer = self.error(error)
+
+        self.finish(route, answer)
+
+    def send(self, data: Any) -> None:
+        """
+        Publish one element of the result sequence, or add it to the chunk and publish the chunk when it is full.
+        Validated output models are serialized directly.
+        """
+        if self.profiler is None:
+            result = self.reply_format.dumps(data)
+        else:
+            result = self.profiler.measure(Phase.SERIALIZATION, self.reply_format.dumps, data)
+
+        if self.chunk is None:
+            self._send(result)
+        elif self.chunk.add(result):
+            self._send(self.reply_format.array(self.chunk.pop()))
+        self.offset += 1
+        self.save()
+
+    def _send(self, result: bytes) -> None:
+        self.num += 1
+        answer = Answer.model_construct(
+            request=None,
+            result=None,
+            status=Status.PROCESSING,
+            error=None,
+            num=self.num,
+        )
+        self._publish(self.route, answer, result)
+        if self.window is not None:
+            self.window.spend()
+
+    def done(self) -> tuple[Route, Answer]:
+        """
+        Publish not full chunk and return the last answer of succeeded operator and its route.
+        """
+        if self.chunk is not None and self.chunk.items:
+            self._send(self.reply_format.array(self.chunk.pop()))
+        self._observe_run()
+        metrics.STREAM_LENGTH.observe(self.num + 1, self.operator_name)
+
+        answer = Answer(
+            request=None,
+            result=None,
+            status=Status.DONE,
+            num=self.num + 1,
+        )
+        return self.route, answer
+
+    def error(self, error: Exception) -> tuple[Route, Answer]:
+        """
+        Return the answer of failed operator and its route.
+        """
+        logger.error('Error in operator %s: %s', self.operator_name, error, extra=self.log_extra)
+        self._observe_run()
+
+        route = self.route
+        if route is DEAD_LETTERS_ROUTE and self.properties.reply_to is not None:
+            # The request failed before its route was resolved.
+            route = parse_route(self.properties.reply_to)
+        if route is DEAD_LETTERS_ROUTE or not route.queues:
+            self.channel.queue_declare(DEAD_LETTERS_QUEUE)
+            route = DEAD_LETTERS_ROUTE
+
+        answer = Answer(
+            request=None,
+            error=str(error),
+            status=Status.ERROR,
+            num=0,
+        )
+        return route, answer
+
+    def finish(self, route: Route, answer: Answer) -> None:
+        """
+        Publish the last answer and acknowledge the delivery.
+        """
+        self._publish(route, answer)
+        if self.checkpoints is not None:
+            # Before the acknowledgement and after the checkpoints of the stream:
+            # a new message with the same correlation_id must not be resumed.
+            after_publish(self.channel, partial(self.checkpoints.delete, self.checkpoint_key))
+        if self.method_frame.delivery_tag is not None:
+            self.channel.basic_ack(self.method_frame.delivery_tag)
+        metrics.IN_FLIGHT.dec(self.operator_name)
+        if self.window is not None:
+            FLOW_CONTROL.close(str(self.properties.correlation_id))
+
+        if self.logged:
+            logger.info(
+                'End operator %s with status %s, reply_to %s, correlation_id %s',
+                self.operator_name,
+                answer.status.value,
+                route,
+                self.properties.correlation_id,
+                extra={**self.log_extra, 'status': answer.status.value, 'reply_to': str(route)},
+            )
+
+    def _publish_body(self, route: Route, body: bytes, properties: BasicProperties) -> None:
+        for queue in route.queues:
+            self.channel.basic_publish('', routing_key=queue, body=body, properties=properties)
+
+    def _observe_run(self) -> None:
+        if self.run_started is not None:
+            run_time = time.perf_counter() - self.run_started - self.publish_time
+            if self.window is not None:
+                run_time -= self.window.paused_seconds
+            metrics.RUN_SECONDS.observe(run_time, self.operator_name)
+
+    def compress(self, body: bytes) -> tuple[bytes, str | None]:
+        """
+        Return body of the answer and its content encoding: the body is compressed if it takes compress_min_size.
+        """
+        if self.compress_min_size is None or len(body) < self.compress_min_size:
+            return body, None
+        if self.profiler is None:
+            return compress(body, self.compression), self.compression.value
+        return self.profiler.measure(Phase.COMPRESSION, compress, body, self.compression), self.compression.value
+
+    def _publish(self, route: Route, answer: Answer, result: bytes | None = None) -> None:
+        started = time.perf_counter()
+        if self.profiler is None:
+            body = self.encode(answer, result)
+        else:
+            body = self.profiler.measure(Phase.SERIALIZATION, self.encode, answer, result)
+        body, content_encoding = self.compress(body)
+
+        properties = BasicProperties(
+            content_type=None if self.reply_format.content_type == JSON else self.reply_format.content_type,
+            content_encoding=content_encoding,
+            correlation_id=self.properties.correlation_id,
+            reply_to=route.reply_to,
+            headers=None if self.window is None else {CREDIT_QUEUE_HEADER: FLOW_CONTROL.queue},
+        )
+        if self.profiler is None:
+            self._publish_body(route, body, properties)
+        else:
+            self.profiler.measure(Phase.PUBLISH, self._publish_body, route, body, properties)
+        publish_time = time.perf_counter() - started
+        self.publish_time += publish_time
+        metrics.PUBLISH_SECONDS.observe(publish_time, self.operator_name)
+        metrics.ANSWERS_PUBLISHED.inc(self.operator_name, answer.status.value)
 
 
 class Operator:
     # pylint: disable=too-few-public-methods
     """
     Base class for any operators.
+    Method run is a generator or an async generator, the last one can be served only by asyncio engine.
+    Field request_echo defines which answers contain the request, header x-request-echo of a message overrides it.
+    Fields chunk_size, chunk_bytes and chunk_interval turn on chunked stream: every answer has a list of results,
+    and it is sent when it has chunk_size results, or the results take chunk_bytes serialized,
+    or chunk_interval seconds passed since its first result (checked, when the next result is yielded).
+    Answers, which take at least compress_min_size bytes, are compressed by compression (gzip or zstd).
+    Field cache turns on memoization of deterministic operators: the output sequence of the same input
+    is replayed from the cache without calling run.
+    Operators with classmethod resume(input_, offset), which yields results of run starting from number offset,
+    are resumable: the position of the stream is stored every checkpoint_interval seconds, a redelivered message
+    continues the stream from the stored position.
+    Field fusable allows to call the operator in-process as the next hop of a route with FUSE_PIPELINES: its input
+    is every result of the previous operator, not the answer, which it would get by broker.
     """
     is_abstract: bool = True
+    request_echo: RequestEcho = RequestEcho.ALL
+
+    chunk_size: int | None = None
+    chunk_bytes: int | None = None
+    chunk_interval: float | None = None
+
+    compress_min_size: int | None = None
+    compression: ContentEncoding = ContentEncoding.GZIP
+
+    cache: ResultCache | None = None
+
+    checkpoint_interval: float = 10.0
+
+    fusable: bool = False
 
     input: Type[BaseModel]
     output: Type[BaseModel]
 
     run: Callable
+    resume: Callable
 
     def __init_subclass__(cls: type) -> None:
         """
         Create new Operator class
         """
+        if not {'input', 'output', 'run'} & cls.__dict__.keys():
+            # Base classes like BatchOperator define none of them, they stay abstract without a warning.
+            return
+
         input_ = getattr(cls, 'input', None)
         output = getattr(cls, 'output', None)
         if not (
@@ -58,89 +588,61 @@ class Operator:
         """
         Init message call.
         """
-        logger.info('Start operator %s with body %s', self.__class__.__name__, body)
+        reply = Reply(self.__class__, channel, method_frame, properties, body)
         try:
-            if properties.reply_to is None:
-                raise ValueError('No property reply_to')
-            if method_frame.delivery_tag is None:
-                raise ValueError('No delivery tag')
-            if properties.correlation_id is None:
-                raise ValueError('No correlation_id')
-
-            result = self.call(**json.loads(body))
-
-            logger.info('The operator start return sequence.')
-            num = -1  # the solution of zero length generator
-            for num, data in enumerate(result):
-                answer = Answer(
-                    request=json.loads(body),
-                    result=data,
-                    status=Status.PROCESSING,
-                    num=num,
-                )
-
-                channel.basic_publish(
-                    '',
-                    routing_key=properties.reply_to.split('>', 1)[0],
-                    body=answer.model_dump_json().encode('utf-8'),
-                    properties=BasicProperties(
-                        correlation_id=properties.correlation_id,
-                        reply_to=(
-                            properties.reply_to.split('>', 1)[1]
-                            if '>' in properties.reply_to
-                            else None
-                        )
-                    )
-                )
-
-            logger.info('The operator end returning sequence.')
-            answer = Answer(
-                request=json.loads(body),
-                result=None,
-                status=Status.DONE,
-                num=num + 1,
-            )
-            reply_to = properties.reply_to
+            input_ = reply.request(self.input)
+            if reply.offset:
+                result = reply.pipe(self.execute_run(input_, reply.profiler, reply.offset))
+            else:
+                result = reply.pipe(self.execute(input_, reply.profiler))
         except Exception as error:  # pylint: disable=broad-exception-caught
-            logger.error('Error in operator %s: %s', self.__class__.__name__, str(error))
+            reply.finish(*reply.error(error))
+            return
 
-            if properties.reply_to is None:
-                channel.queue_declare(DEAD_LETTERS_QUEUE)
-                reply_to = DEAD_LETTERS_QUEUE
-            else:
-                reply_to = properties.reply_to
+        logger.debug('The operator start return sequence.')
+        reply.stream(iter(result))
 
-            answer = Answer(
-                request=json.loads(body),
-                error=str(error),
-                status=Status.ERROR,
-                num=0,
-            )
+    @classmethod
+    async def consume(
+            cls,
+            channel: 'AsyncChannel',
+            method_frame: Basic.GetOk,
+            properties: BasicProperties,
+            body: bytes,
+    ) -> None:
+        """
+        Async message call. Channel calls are awaited by method flush of the channel.
+        """
+        reply = Reply(cls, channel, method_frame, properties, body)
+        try:
+            result = cls.aexecute(reply.request(cls.input), reply.profiler)
 
-        channel.basic_publish(
-            '',
-            routing_key=reply_to.split('>', 1)[0],
-            body=answer.model_dump_json().encode('utf-8'),
-            properties=BasicProperties(
-                correlation_id=properties.correlation_id,
-                reply_to=(
-                    reply_to.split('>', 1)[1]
-                    if '>' in reply_to
-                    else None
-                )
-            )
-        )
-        if method_frame.delivery_tag is not None:
-            channel.basic_ack(method_frame.delivery_tag)
+            logger.debug('The operator start return sequence.')
+            async for data in result:
+                reply.send(data)
+                await channel.flush()
 
-        logger.info(
-            'End operator %s with body %s, body %s, reply_to %s, correlation_id %s',
-            self.__class__.__name__,
-            body,
-            str(answer),
-            reply_to,
-            properties.correlation_id
-        )
+            logger.debug('The operator end returning sequence.')
+            route, answer = reply.done()
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            route, answer = reply.error(error)
+
+        reply.finish(route, answer)
+        await channel.flush()
+
+    @classmethod
+    def is_chunked(cls) -> bool:
+        """
+        Return True if results of the operator are sent in chunks.
+        """
+        return cls.chunk_size is not None or cls.chunk_bytes is not None or cls.chunk_interval is not None
+
+    @classmethod
+    def is_resumable(cls) -> bool:
+        """
+        Return True if streams of the operator can be continued from a checkpoint.
+        """
+        return callable(getattr(cls, 'resume', None))
 
     @classmethod
     def call(cls, **kwargs: Any) -> Any:
@@ -149,8 +651,142 @@ class Operator:
         """
         if cls.is_abstract:
             raise ValueError(f'Can not use method .call for abstract class {cls}')
-        input_ = cls.input.model_validate(kwargs)
-        result = cls.run(input_)
-        for element in result:
-            output_ = cls.output.model_validate(element)
+        for output_ in cls.execute(cls.input.model_validate(kwargs)):
+            yield output_.model_dump()
+
+    @classmethod
+    def execute(cls, input_: BaseModel, profiler: Profiler | None = None) -> Iterator[Any]:
+        """
+        Run operator with already validated input and yield validated output models.
+        With profiler time of run and output validation is measured for every result.
+        Operators with cache replay cached results.
+        """
+        if cls.is_abstract:
+            raise ValueError(f'Can not use method .execute for abstract class {cls}')
+        if inspect.isasyncgenfunction(cls.run):
+            raise ValueError(f'Operator {cls} is asynchronous, it can be served only by asyncio engine')
+        if cls.cache is None:
+            yield from cls.execute_run(input_, profiler)
+        else:
+            yield from cls.cache.memoize(cls.__name__, cls.output, input_, partial(cls.execute_run, input_, profiler))
+
+    @classmethod
+    def execute_run(cls, input_: BaseModel, profiler: Profiler | None = None, offset: int = 0) -> Iterator[Any]:
+        """
+        Call run, or resume from the offset, and yield its validated results.
+        """
+        result = cls.run(input_) if offset == 0 else cls.resume(input_, offset)
+        if profiler is None:
+            for element in result:
+                yield cls.output.model_validate(element)
+            return
+
+        while (element := profiler.measure(Phase.RUN, next, result, _STOP)) is not _STOP:
+            yield profiler.measure(Phase.OUTPUT, cls.output.model_validate, element)
+
+    @classmethod
+    async def acall(cls, **kwargs: Any) -> AsyncIterator[Any]:
+        """
+        Async version of call.
+        """
+        if cls.is_abstract:
+            raise ValueError(f'Can not use method .acall for abstract class {cls}')
+        async for output_ in cls.aexecute(cls.input.model_validate(kwargs)):
             yield output_.model_dump()
+
+    @classmethod
+    async def aexecute(cls, input_: BaseModel, profiler: Profiler | None = None) -> AsyncIterator[Any]:
+        """
+        Async version of execute. Synchronous run is executed in the default executor of the loop.
+        Time of asynchronous run is not measured by profiler.
+        """
+        if not inspect.isasyncgenfunction(cls.run):
+            loop = asyncio.get_running_loop()
+            iterator = cls.execute(input_, profiler)
+            while (element := await loop.run_in_executor(None, next, iterator, _STOP)) is not _STOP:
+                yield element
+            return
+
+        async for element in cls.run(input_):
+            if profiler is None:
+                yield cls.output.model_validate(element)
+            else:
+                yield profiler.measure(Phase.OUTPUT, cls.output.model_validate, element)
+
+
+class BatchOperator(Operator):
+    """
+    Base class for operators, which process requests by batches.
+    Method run gets list of inputs and yields one output for every input in the same order.
+    The blocking engine collects up to max_batch_size deliveries, but waits not longer than max_batch_wait seconds
+    since the first one. Every request gets its own answers, deliveries are acknowledged after the whole batch.
+    """
+    max_batch_size: int = 100
+    max_batch_wait: float = 0.1
+
+    @classmethod
+    def consume_batch(cls, messages: list[Message]) -> None:
+        """
+        Process batch of deliveries, every reply uses the channel of its delivery.
+        """
+        logger.info('Start batch operator %s with %s messages', cls.__name__, len(messages))
+        replies = [Reply(cls, *message) for message in messages]
+        answers: dict[int, tuple[Route, Answer]] = {}
+        batch: dict[int, BaseModel] = {}
+
+        for index, reply in enumerate(replies):
+            try:
+                batch[index] = reply.request(cls.input)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                answers[index] = reply.error(error)
+
+        if batch:
+            try:
+                outputs = cls.execute_batch(list(batch.values()))
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                outputs = []
+                for index in batch:
+                    answers[index] = replies[index].error(error)
+
+            # Errors of local hops and of publishing fail only their own message.
+            for index, output in zip(batch, outputs):
+                try:
+                    for data in replies[index].pipe([output]):
+                        replies[index].send(data)
+                    answers[index] = replies[index].done()
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    answers[index] = replies[index].error(error)
+
+        for index, reply in enumerate(replies):
+            reply.finish(*answers[index])
+
+    @classmethod
+    def is_resumable(cls) -> bool:
+        """
+        Batch operators yield one output per input, their answers are not checkpointed.
+        """
+        return False
+
+    @classmethod
+    def execute(cls, input_: BaseModel, profiler: Profiler | None = None) -> Iterator[Any]:
+        """
+        Run operator with batch of one input. Phases of batches are not measured by profiler.
+        """
+        # pylint: disable=unused-argument
+        yield from cls.execute_batch([input_])
+
+    @classmethod
+    def execute_batch(cls, inputs: list[BaseModel]) -> list[BaseModel]:
+        """
+        Run operator with already validated inputs and return validated output models.
+        Outputs are taken from run by KEEPALIVE, so heartbeats are not starved by a long batch in sync mode.
+        """
+        if cls.is_abstract:
+            raise ValueError(f'Can not use method .execute_batch for abstract class {cls}')
+        if inspect.isasyncgenfunction(cls.run):
+            raise ValueError(f'Batch operator {cls} can not be asynchronous')
+
+        outputs = [cls.output.model_validate(element) for element in KEEPALIVE.iterate(cls.run(inputs))]
+        if len(outputs) != len(inputs):
+            raise ValueError(f'Batch operator {cls} returned {len(outputs)} outputs for {len(inputs)} inputs')
+        return outputs
@@ -0,0 +1,36 @@
+import random
+
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+
+
+# Errors of the connection or of the consuming channel, after them serving starts again on a new connection.
+CONNECTION_ERRORS = (AMQPConnectionError, AMQPChannelError)
+
+
+class Backoff:
+    """
+    Delays between reconnection attempts: exponential from delay to max_delay seconds with full jitter,
+    so processes, which lost the same broker, do not reconnect at once. Attempts are counted until reset,
+    the process gives up after max_attempts failed attempts in a row.
+    """
+    def __init__(self, delay: float, max_delay: float, max_attempts: int):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.attempts = 0
+
+    def reset(self) -> None:
+        """
+        Start counting again after the connection is established.
+        """
+        self.attempts = 0
+
+    def next_delay(self) -> float | None:
+        """
+        Return delay of the next attempt or None, if attempts are exhausted.
+        """
+        if self.attempts >= self.max_attempts:
+            return None
+        ceiling = min(self.max_delay, self.delay * 2 ** self.attempts)
+        self.attempts += 1
+        return random.uniform(0, ceiling)
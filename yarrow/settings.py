@@ -1,7 +1,10 @@
 from pathlib import Path
 
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
+from yarrow.models import CheckpointBackend, ExecutionMode, JsonBackend, LogFormat
+
 
 class Settings(BaseSettings):
     # pylint: disable=missing-class-docstring
@@ -13,3 +16,33 @@ class Settings(BaseSettings):
     PASSWORD: str
 
     CONFIG_FILENAME: Path
+
+    HEARTBEAT: int | None = Field(None, ge=0)
+    RECONNECT_DELAY: float = Field(1.0, ge=0)
+    RECONNECT_MAX_DELAY: float = Field(60.0, ge=0)
+    RECONNECT_ATTEMPTS: int = Field(10, ge=0)
+
+    EXECUTION_MODE: ExecutionMode = ExecutionMode.SYNC
+    WORKERS: int | None = None
+
+    PUBLISHER_CONFIRMS: bool = False
+    FUSE_PIPELINES: bool = False
+    STREAM_CREDITS: bool = False
+    STREAM_IDLE_TIMEOUT: float = Field(300.0, gt=0)
+    DRAIN_TIMEOUT: float = Field(30.0, ge=0)
+
+    DEDUP_SIZE: int = Field(0, ge=0)
+    DEDUP_FILENAME: Path | None = None
+
+    CHECKPOINT_PATH: Path | None = None
+    CHECKPOINT_BACKEND: CheckpointBackend = CheckpointBackend.SQLITE
+
+    METRICS_PORT: int | None = None
+    PROFILE_SAMPLE_RATE: float = Field(0.0, ge=0, le=1)
+
+    JSON_BACKEND: JsonBackend = JsonBackend.PYDANTIC
+
+    LOG_LEVEL: str = 'INFO'
+    LOG_FORMAT: LogFormat = LogFormat.TEXT
+    LOG_BODY_PREVIEW: int = Field(200, ge=0)
+    LOG_SAMPLE_RATE: float = Field(1.0, ge=0, le=1)
@@ -0,0 +1,341 @@
+import logging
+from collections import deque
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, NamedTuple, Type
+
+from pika import BasicProperties, BlockingConnection
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.spec import Basic
+
+from yarrow.checkpoint import after_publish
+from yarrow.models import ExecutionMode
+from yarrow.operator import BatchOperator, Message
+
+
+logger = logging.getLogger(__name__)
+
+
+ChannelCall = tuple[str, tuple, dict]
+OnMessageCallback = Callable[[BlockingChannel, Basic.Deliver, BasicProperties, bytes], None]
+
+
+class Delivery(NamedTuple):
+    # pylint: disable=missing-class-docstring
+    channel: BlockingChannel
+    method_frame: Basic.Deliver
+    properties: BasicProperties
+    body: bytes
+
+
+class ThreadSafeChannel:
+    # pylint: disable=too-few-public-methods
+    """
+    Channel proxy for worker threads: every method call is marshalled to the connection thread.
+    """
+    def __init__(self, connection: BlockingConnection, channel: BlockingChannel):
+        self.connection = connection
+        self.channel = channel
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        method = getattr(self.channel, name)
+
+        def threadsafe_call(*args: Any, **kwargs: Any) -> None:
+            self.connection.add_callback_threadsafe(partial(method, *args, **kwargs))
+
+        return threadsafe_call
+
+    def checkpoint(self, action: Callable[[], None]) -> None:
+        """
+        Call action in the connection thread after the calls, which are marshalled before it.
+        """
+        self.connection.add_callback_threadsafe(partial(after_publish, self.channel, action))
+
+
+class DeliveryChannel:
+    # pylint: disable=too-few-public-methods
+    """
+    Base class of channels of one delivery: subclasses override some methods,
+    the rest are called on the consuming channel.
+    """
+    def __init__(self, channel: BlockingChannel):
+        self.channel = channel
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.channel, name)
+
+    def checkpoint(self, action: Callable[[], None]) -> None:
+        """
+        Call action, when answers published so far reached the broker.
+        """
+        after_publish(self.channel, action)
+
+
+class RecordingChannel:
+    # pylint: disable=too-few-public-methods
+    """
+    Channel stand-in for worker processes: method calls are recorded and replayed by the parent process.
+    """
+    def __init__(self) -> None:
+        self.calls: list[ChannelCall] = []
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        def record_call(*args: Any, **kwargs: Any) -> None:
+            self.calls.append((name, args, kwargs))
+
+        return record_call
+
+
+def run_in_thread(channel: ThreadSafeChannel, handler: Callable, *args: Any) -> list[list[ChannelCall]]:
+    """
+    Execute operator in worker thread. Channel calls are already sent to connection thread.
+    """
+    handler(channel, *args)
+    return [[]]
+
+
+def run_in_process(handler: Callable, *args: Any) -> list[list[ChannelCall]]:
+    """
+    Execute operator in worker process and return channel calls of the delivery for replay.
+    """
+    channel = RecordingChannel()
+    handler(channel, *args)
+    return [channel.calls]
+
+
+def run_batch_in_thread(
+        channels: list[ThreadSafeChannel],
+        handler: Callable,
+        messages: list[Message],
+) -> list[list[ChannelCall]]:
+    """
+    Execute batch operator in worker thread, every message gets its channel. Channel calls are already sent
+    to connection thread.
+    """
+    handler([(channel, *message[1:]) for channel, message in zip(channels, messages)])
+    return [[] for _ in messages]
+
+
+def run_batch_in_process(handler: Callable, messages: list[Message]) -> list[list[ChannelCall]]:
+    """
+    Execute batch operator in worker process and return channel calls of every delivery for replay.
+    """
+    channels = [RecordingChannel() for _ in messages]
+    handler([(channel, *message[1:]) for channel, message in zip(channels, messages)])
+    return [channel.calls for channel in channels]
+
+
+class InFlightLimit:
+    """
+    Limit of concurrently executed deliveries of one operator.
+    It is used only from the connection thread, so there is no locking.
+    """
+    def __init__(self, maximum: int | None = None):
+        self.maximum = maximum
+        self.count = 0
+        self.pending: deque[Callable[[], None]] = deque()
+
+    def run(self, task: Callable[[], None]) -> None:
+        """
+        Run task now or postpone it until one of running tasks is released.
+        """
+        if self.maximum is not None and self.count >= self.maximum:
+            self.pending.append(task)
+            return
+
+        self.count += 1
+        task()
+
+    def release(self) -> None:
+        """
+        Mark one running task as finished and run the next postponed one.
+        """
+        self.count -= 1
+        if self.pending:
+            self.run(self.pending.popleft())
+
+
+class BatchCollector:
+    """
+    Callback for basic_consume, which collects deliveries of a batch operator and hands them over to handler
+    by batches of max_size deliveries, or after max_wait seconds since the first delivery of the batch.
+    Every delivery keeps its own channel. It is used only from the connection thread.
+    """
+    def __init__(
+            self,
+            connection: BlockingConnection,
+            handler: Callable[[list[Message]], None],
+            max_size: int,
+            max_wait: float,
+    ):
+        self.connection = connection
+        self.handler = handler
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.batch: list[Message] = []
+        self.timer: object | None = None
+
+    def __call__(
+            self,
+            channel: BlockingChannel,
+            method_frame: Basic.Deliver,
+            properties: BasicProperties,
+            body: bytes,
+    ) -> None:
+        self.batch.append((channel, method_frame, properties, body))
+
+        if len(self.batch) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.connection.call_later(self.max_wait, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self.timer = None
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Hand over collected deliveries to handler.
+        """
+        if self.timer is not None:
+            self.connection.remove_timeout(self.timer)
+            self.timer = None
+
+        batch, self.batch = self.batch, []
+        if batch:
+            self.handler(batch)
+
+
+class WorkerPool:
+    """
+    Pool of threads or processes for operators execution.
+    All channel calls are done in the connection thread.
+    """
+    def __init__(self, connection: BlockingConnection, mode: ExecutionMode, workers: int | None = None):
+        if mode is ExecutionMode.SYNC:
+            raise ValueError('Worker pool can not be used in sync execution mode')
+
+        self.connection = connection
+        self.mode = mode
+        self.workers = workers
+        self.executor = self._create_executor()
+
+    def _create_executor(self) -> Executor:
+        if self.mode is ExecutionMode.THREAD:
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='yarrow')
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    def consumer(self, operator_class: Callable, max_in_flight: int | None = None) -> OnMessageCallback:
+        """
+        Return callback for basic_consume, which hands deliveries over to the pool.
+        Not more than max_in_flight deliveries of the operator are executed at the same time.
+        """
+        limit = InFlightLimit(max_in_flight)
+
+        def on_message(
+                channel: BlockingChannel,
+                method_frame: Basic.Deliver,
+                properties: BasicProperties,
+                body: bytes,
+        ) -> None:
+            limit.run(partial(self.submit, operator_class, Delivery(channel, method_frame, properties, body), limit))
+
+        return on_message
+
+    def batch_consumer(self, operator_class: Type[BatchOperator], max_in_flight: int | None = None) -> BatchCollector:
+        """
+        Return callback for basic_consume, which collects deliveries of batch operator and hands batches over
+        to the pool. Not more than max_in_flight batches of the operator are executed at the same time.
+        """
+        limit = InFlightLimit(max_in_flight)
+
+        def on_batch(messages: list[Message]) -> None:
+            limit.run(partial(self.submit_batch, operator_class, messages, limit))
+
+        return BatchCollector(self.connection, on_batch, operator_class.max_batch_size, operator_class.max_batch_wait)
+
+    def submit(self, operator_class: Callable, delivery: Delivery, limit: InFlightLimit | None = None) -> None:
+        """
+        Submit delivery to the pool.
+        """
+        channel, method_frame, properties, body = delivery
+        task = partial(run_in_process, operator_class, method_frame, properties, body)
+        if self.mode is ExecutionMode.THREAD:
+            thread_safe_channel = ThreadSafeChannel(self.connection, channel)
+            task = partial(run_in_thread, thread_safe_channel, operator_class, method_frame, properties, body)
+        self._submit([channel], [method_frame], limit, task)
+
+    def submit_batch(
+            self,
+            operator_class: Type[BatchOperator],
+            messages: list[Message],
+            limit: InFlightLimit | None = None,
+    ) -> None:
+        """
+        Submit batch of deliveries to the pool. Channels of the deliveries stay in the connection thread,
+        workers get their own channels.
+        """
+        channels = [channel for channel, _, _, _ in messages]
+        method_frames = [method_frame for _, method_frame, _, _ in messages]
+        frames = [(None, method_frame, properties, body) for _, method_frame, properties, body in messages]
+        task = partial(run_batch_in_process, operator_class.consume_batch, frames)
+        if self.mode is ExecutionMode.THREAD:
+            thread_safe_channels = [ThreadSafeChannel(self.connection, channel) for channel in channels]
+            task = partial(run_batch_in_thread, thread_safe_channels, operator_class.consume_batch, frames)
+        self._submit(channels, method_frames, limit, task)
+
+    def _submit(
+            self,
+            channels: list[BlockingChannel],
+            method_frames: list[Basic.Deliver],
+            limit: InFlightLimit | None,
+            task: Callable[[], list[list[ChannelCall]]],
+    ) -> None:
+        try:
+            future = self.executor.submit(task)
+        except BrokenExecutor:
+            logger.warning('Worker pool is broken, restart it.')
+            self.executor = self._create_executor()
+            future = self.executor.submit(task)
+
+        future.add_done_callback(partial(self._done, channels, method_frames, limit))
+
+    def _done(
+            self,
+            channels: list[BlockingChannel],
+            method_frames: list[Basic.Deliver],
+            limit: InFlightLimit | None,
+            future: Future,
+    ) -> None:
+        self.connection.add_callback_threadsafe(partial(self._finish, channels, method_frames, limit, future))
+
+    @staticmethod
+    def _finish(
+            channels: list[BlockingChannel],
+            method_frames: list[Basic.Deliver],
+            limit: InFlightLimit | None,
+            future: Future,
+    ) -> None:
+        try:
+            calls: list[list[ChannelCall]] = future.result()
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            logger.error('Worker failed on deliveries %s: %s', [frame.delivery_tag for frame in method_frames], error)
+            # Requeue only once, so a message which kills workers can not do it forever.
+            calls = [
+                [('basic_nack', (method_frame.delivery_tag,), {'requeue': not method_frame.redelivered})]
+                for method_frame in method_frames
+            ]
+
+        # Every delivery replays its calls on its own channel.
+        for channel, channel_calls in zip(channels, calls):
+            for name, args, kwargs in channel_calls:
+                getattr(channel, name)(*args, **kwargs)
+
+        if limit is not None:
+            limit.release()
+
+    def shutdown(self) -> None:
+        """
+        Stop the pool. Not started deliveries are cancelled and will be redelivered by broker.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)